@@ -49,6 +49,98 @@ class OpenAISettings(BaseSettings):
         default=60,
         description="Rate limit for API calls per minute"
     )
+    RATE_LIMIT_TPM: int = Field(
+        default=1000000,
+        description="Rate limit for tokens per minute"
+    )
+    RATE_LIMIT_MAX_WAIT: float = Field(
+        default=30.0,
+        description="Maximum seconds a call waits for rate limit capacity before RateLimitException"
+    )
+    
+    # Request coalescing settings
+    SINGLEFLIGHT_ENABLED: bool = Field(
+        default=True,
+        description="Share one upstream request between identical concurrent completion calls"
+    )
+    
+    # Completion response cache settings
+    COMPLETION_CACHE_ENABLED: bool = Field(
+        default=False,
+        description="Cache temperature-0 completions automatically (requests can also opt in with cache=True)"
+    )
+    COMPLETION_CACHE_BACKEND: str = Field(
+        default="memory",
+        description="Completion cache backend: 'memory' or 'disk' (SQLite)"
+    )
+    COMPLETION_CACHE_TTL: float = Field(
+        default=3600.0,
+        description="Seconds a cached completion stays valid"
+    )
+    COMPLETION_CACHE_MAX_ENTRIES: int = Field(
+        default=1024,
+        description="Maximum cached completions before least recently used ones are evicted"
+    )
+    COMPLETION_CACHE_PATH: Optional[str] = Field(
+        default=None,
+        description="SQLite file for the disk completion cache"
+    )
+    
+    # Embedding micro-batching settings
+    EMBEDDING_BATCH_ENABLED: bool = Field(
+        default=True,
+        description="Coalesce concurrent single-text embedding calls into batched requests"
+    )
+    EMBEDDING_BATCH_MAX_SIZE: int = Field(
+        default=64,
+        description="Maximum number of texts per batched embedding request"
+    )
+    EMBEDDING_BATCH_MAX_TOKENS: int = Field(
+        default=8000,
+        description="Maximum estimated tokens per batched embedding request"
+    )
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = Field(
+        default=10.0,
+        description="Maximum milliseconds a text waits for a batch to fill before it is flushed"
+    )
+    
+    # Embedding cache settings
+    EMBEDDING_CACHE_ENABLED: bool = Field(
+        default=True,
+        description="Cache embeddings by (model, normalized text hash)"
+    )
+    EMBEDDING_CACHE_MAX_BYTES: int = Field(
+        default=64 * 1024 * 1024,
+        description="Byte budget of the in-process embedding LRU"
+    )
+    EMBEDDING_CACHE_PATH: Optional[str] = Field(
+        default=None,
+        description="Optional SQLite file for a persistent embedding cache shared by workers"
+    )
+    
+    # Batch sentiment settings
+    SENTIMENT_BATCH_SIZE: int = Field(
+        default=25,
+        description="Maximum texts classified in one batched sentiment prompt"
+    )
+    SENTIMENT_BATCH_CONCURRENCY: int = Field(
+        default=4,
+        description="Maximum batched sentiment prompts in flight at once"
+    )
+    
+    # Local sentiment fast path settings
+    SENTIMENT_LOCAL_MODE: str = Field(
+        default="off",
+        description="Local sentiment classifier in front of the LLM: off, lexicon or embedding"
+    )
+    SENTIMENT_LOCAL_THRESHOLD: float = Field(
+        default=0.8,
+        description="Minimum local classifier confidence; less confident texts go to the LLM"
+    )
+    SENTIMENT_MODEL_PATH: Optional[str] = Field(
+        default=None,
+        description="Weights (.npz) of the embedding sentiment model used in embedding mode"
+    )
     
     # Cost tracking settings
     ENABLE_COST_TRACKING: bool = Field(
@@ -75,6 +167,18 @@ class OpenAISettings(BaseSettings):
         "news": 0.7,
         "sentiment": 0.5
     })
+    # Routing policy per agent type: minimum quality tier (1-3) and optional
+    # max_cost (USD per request) / max_latency (seconds) budgets
+    agent_model_policies: Dict[str, Dict[str, Any]] = Field(default_factory=lambda: {
+        "sentiment": {"min_quality": 1},
+        "news": {"min_quality": 2},
+        "technical": {"min_quality": 2}
+    })
+    MODEL_ROUTING_ENABLED: bool = Field(
+        default=False,
+        description="Choose the model per request for agent-typed calls that do not pin a model, "
+                    "instead of using agent_models"
+    )
     
     # Pricing dictionary
     pricing: Dict[str, Dict[str, float]] = Field(default_factory=lambda: {
@@ -86,15 +190,85 @@ class OpenAISettings(BaseSettings):
             "input": 0.03,
             "output": 0.06
         },
+        "gpt-4-turbo": {
+            "input": 0.01,
+            "output": 0.03
+        },
+        "gpt-4-turbo-preview": {
+            "input": 0.01,
+            "output": 0.03
+        },
+        "gpt-4o": {
+            "input": 0.0025,
+            "output": 0.01
+        },
+        "gpt-4o-mini": {
+            "input": 0.00015,
+            "output": 0.0006
+        },
         "text-embedding-ada-002": {
             "input": 0.0001,
             "output": 0.0001
+        },
+        "text-embedding-3-small": {
+            "input": 0.00002,
+            "output": 0.00002
+        },
+        "text-embedding-3-large": {
+            "input": 0.00013,
+            "output": 0.00013
         }
     })
+    PROMPT_CACHE_DISCOUNT: float = Field(
+        default=0.5,
+        description="Fraction of the input price not billed for prompt tokens served from the provider's prefix cache"
+    )
     
     # Retry Configuration
     max_retries: int = 3
     retry_delay: float = 1.0
+    RETRY_MAX_DELAY: float = Field(
+        default=20.0,
+        description="Upper bound of the jittered delay between retries, in seconds"
+    )
+    RETRY_MAX_RETRY_AFTER: float = Field(
+        default=60.0,
+        description="Give up instead of retrying when the server asks to wait longer than this, in seconds"
+    )
+    RETRY_BUDGET_RATIO: float = Field(
+        default=0.2,
+        description="Retries allowed as a fraction of recent requests"
+    )
+    RETRY_BUDGET_MIN_RETRIES: int = Field(
+        default=10,
+        description="Retries always allowed per budget window, regardless of traffic"
+    )
+    RETRY_BUDGET_WINDOW: float = Field(
+        default=10.0,
+        description="Length of the retry budget window, in seconds"
+    )
+
+    # HTTP connection pool settings (shared by all requests of a service instance)
+    HTTP_MAX_CONNECTIONS: int = Field(
+        default=200,
+        description="Maximum number of concurrent connections per HTTP client"
+    )
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = Field(
+        default=50,
+        description="Maximum number of idle keep-alive connections kept in the pool"
+    )
+    HTTP_KEEPALIVE_EXPIRY: float = Field(
+        default=30.0,
+        description="Seconds an idle keep-alive connection stays in the pool"
+    )
+    HTTP2: bool = Field(
+        default=True,
+        description="Use HTTP/2 when the 'h2' package is installed"
+    )
+    REQUEST_TIMEOUT: float = Field(
+        default=60.0,
+        description="Timeout in seconds for a single upstream request"
+    )
 
     # OpenRouter settings
     OPENROUTER_API_KEY: Optional[str] = Field(
@@ -110,6 +284,36 @@ class OpenAISettings(BaseSettings):
         description="Whether to use OpenRouter instead of OpenAI directly"
     )
 
+    # Failover settings (primary key, BACKUP_API_KEY and OpenRouter, in that order)
+    FAILOVER_ENABLED: bool = Field(
+        default=True,
+        description="Route around failing backends when a backup key or OpenRouter is configured"
+    )
+    BREAKER_FAILURE_RATE: float = Field(
+        default=0.5,
+        description="Error rate within the breaker window that opens a backend's circuit"
+    )
+    BREAKER_LATENCY_P95_MS: Optional[float] = Field(
+        default=None,
+        description="p95 latency (ms) within the breaker window that opens a backend's circuit"
+    )
+    BREAKER_MIN_CALLS: int = Field(
+        default=10,
+        description="Calls required within the breaker window before a circuit may open"
+    )
+    BREAKER_WINDOW: float = Field(
+        default=60.0,
+        description="Seconds of call history the circuit breakers evaluate"
+    )
+    BREAKER_OPEN_SECONDS: float = Field(
+        default=30.0,
+        description="Seconds an open circuit rejects traffic before probing the backend again"
+    )
+    HEDGE_AFTER_MS: Optional[float] = Field(
+        default=None,
+        description="Send a completion or embedding to the next backend too if the first has not answered after this many ms"
+    )
+
     @property
     def embedding_model(self) -> str:
         return self.EMBEDDING_MODEL
@@ -132,6 +336,7 @@ def get_agent_settings(agent_type: str) -> Dict[str, Any]:
     return {
         "model": settings.agent_models.get(agent_type, settings.default_model),
         "temperature": settings.agent_temperatures.get(agent_type, settings.default_temperature),
+        "model_policy": settings.agent_model_policies.get(agent_type, {}),
         "api_key": settings.api_key,
         "organization": settings.organization
     }
@@ -147,6 +352,7 @@ OPENAI_BACKUP_API_KEY=your_backup_key
 OPENAI_DEFAULT_MODEL=gpt-4-turbo-preview
 OPENAI_EMBEDDING_MODEL=text-embedding-ada-002
 OPENAI_RATE_LIMIT_RPM=60
+OPENAI_RATE_LIMIT_TPM=1000000
 OPENAI_ENABLE_COST_TRACKING=true
 """
 
@@ -5,6 +5,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 from app.config.openai_config import get_openai_settings
+from app.dependencies import get_openai_service
 from fastapi.responses import JSONResponse
 from app.utils.logging_utils import get_logger
 
@@ -15,7 +16,6 @@ load_dotenv()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    settings = get_openai_settings()
     print(f"Starting TradeAdvisor API on port {PORT}")
     print(f"Environment: {ENVIRONMENT}")
     print(f"Allowed origins: {ALLOWED_ORIGINS}")
@@ -24,11 +24,25 @@ async def lifespan(app: FastAPI):
     print(f"Supabase Key configured: {'SUPABASE_KEY' in os.environ}")
     # Log OpenAI configuration status
     print(f"OpenAI API Key configured: {'OPENAI_API_KEY' in os.environ}")
-    print(f"OpenAI Model configured: {settings.default_model}")
     print("SUPABASE_JWT_SECRET loaded:", bool(os.getenv("SUPABASE_JWT_SECRET")))
+    # Open the pooled async LLM client once per worker. Without OpenAI configuration
+    # the app still starts, so non-LLM routes keep working.
+    openai_service = None
+    try:
+        settings = get_openai_settings()
+        print(f"OpenAI Model configured: {settings.default_model}")
+        openai_service = get_openai_service()
+        await openai_service.astart()
+    except ValueError as e:
+        logger.warning(f"OpenAI service not started: {e}")
     yield
     # Shutdown
     print("Shutting down TradeAdvisor API")
+    if openai_service is not None:
+        await openai_service.aclose()
+        openai_service.close()
+        # A closed service cannot be reused; the next lifespan (reload, tests) builds a new one
+        get_openai_service.cache_clear()
 
 # Get environment variables or use defaults
 PORT = int(os.getenv("PORT", "8080"))
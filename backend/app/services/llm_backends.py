@@ -0,0 +1,286 @@
+"""
+LLM backend adapters used by OpenAIService.
+
+Each backend owns one long-lived sync and one long-lived async HTTP client, so
+connections are pooled (keep-alive, optional HTTP/2) across requests instead of
+being opened per call. Responses are normalized to plain dicts so the service
+does not care which provider served them.
+"""
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def build_http_client_kwargs(settings) -> Dict[str, Any]:
+    """Build the shared httpx client options (pool limits, timeout, HTTP/2) from settings."""
+    http2 = bool(settings.HTTP2)
+    if http2 and not _http2_available():
+        logger.warning("HTTP/2 requested but the 'h2' package is not installed; falling back to HTTP/1.1.")
+        http2 = False
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(settings.REQUEST_TIMEOUT),
+        "http2": http2,
+    }
+
+
+def _field(obj, name: str):
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def _usage_dict(usage) -> Dict[str, int]:
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached_tokens": 0}
+    # Prompt tokens served from the provider's prompt prefix cache
+    details = _field(usage, "prompt_tokens_details")
+    return {
+        "prompt_tokens": _field(usage, "prompt_tokens") or 0,
+        "completion_tokens": _field(usage, "completion_tokens") or 0,
+        "total_tokens": _field(usage, "total_tokens") or 0,
+        "cached_tokens": (_field(details, "cached_tokens") if details is not None else 0) or 0,
+    }
+
+
+def _stream_events(model: Optional[str], choices, usage) -> Iterator[Dict[str, Any]]:
+    """Turn one streamed chunk into normalized ``delta`` / ``usage`` events."""
+    for choice in choices or []:
+        delta = choice.get("delta") if isinstance(choice, dict) else getattr(choice, "delta", None)
+        if delta is None:
+            continue
+        content = delta.get("content") if isinstance(delta, dict) else getattr(delta, "content", None)
+        if content:
+            yield {"type": "delta", "content": content}
+    if usage:
+        yield {"type": "usage", "model": model, "usage": _usage_dict(usage)}
+
+
+class OpenAIBackend:
+    """Backend that talks to the OpenAI API through the official SDK."""
+
+    kind = "openai"
+
+    def __init__(self, settings, api_key: str, organization: Optional[str] = None, name: str = "primary"):
+        self.name = name
+        self._settings = settings
+        self._api_key = api_key
+        self._organization = organization
+        self._client_kwargs = build_http_client_kwargs(settings)
+        self.client = OpenAI(
+            api_key=api_key,
+            organization=organization,
+            http_client=httpx.Client(**self._client_kwargs),
+            # Retries are handled by the service's RetryPolicy
+            max_retries=0,
+        )
+        self._async_client: Optional[AsyncOpenAI] = None
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                api_key=self._api_key,
+                organization=self._organization,
+                http_client=httpx.AsyncClient(**self._client_kwargs),
+                # Retries are handled by the service's RetryPolicy
+                max_retries=0,
+            )
+        return self._async_client
+
+    @staticmethod
+    def _parse_completion(response) -> Dict[str, Any]:
+        return {
+            "content": response.choices[0].message.content,
+            "model": response.model,
+            "usage": _usage_dict(response.usage),
+        }
+
+    @staticmethod
+    def _parse_embeddings(response) -> Dict[str, Any]:
+        return {
+            "embeddings": [item.embedding for item in response.data],
+            "usage": _usage_dict(getattr(response, "usage", None)),
+        }
+
+    def complete(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return self._parse_completion(self.client.chat.completions.create(**params))
+
+    async def acomplete(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return self._parse_completion(await self.async_client.chat.completions.create(**params))
+
+    def stream(self, params: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        stream = self.client.chat.completions.create(
+            **params, stream=True, stream_options={"include_usage": True}
+        )
+        try:
+            for chunk in stream:
+                yield {"type": "model", "model": chunk.model}
+                yield from _stream_events(chunk.model, chunk.choices, getattr(chunk, "usage", None))
+        finally:
+            stream.close()
+
+    async def astream(self, params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        stream = await self.async_client.chat.completions.create(
+            **params, stream=True, stream_options={"include_usage": True}
+        )
+        try:
+            async for chunk in stream:
+                yield {"type": "model", "model": chunk.model}
+                for event in _stream_events(chunk.model, chunk.choices, getattr(chunk, "usage", None)):
+                    yield event
+        finally:
+            await stream.close()
+
+    def embed(self, texts: List[str], model: str) -> Dict[str, Any]:
+        return self._parse_embeddings(self.client.embeddings.create(model=model, input=texts))
+
+    async def aembed(self, texts: List[str], model: str) -> Dict[str, Any]:
+        return self._parse_embeddings(await self.async_client.embeddings.create(model=model, input=texts))
+
+    def close(self) -> None:
+        self.client.close()
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
+
+class OpenRouterBackend:
+    """Backend that talks to the OpenAI-compatible OpenRouter REST API."""
+
+    kind = "openrouter"
+
+    def __init__(self, settings, api_key: str, base_url: str, name: str = "openrouter", model_prefix: str = ""):
+        self.name = name
+        # Vendor prefix for bare model names, e.g. "openai/" when standing in for OpenAI
+        self.model_prefix = model_prefix
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self._headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+        self._client_kwargs = build_http_client_kwargs(settings)
+        self.client = httpx.Client(base_url=self.base_url, headers=self._headers, **self._client_kwargs)
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url, headers=self._headers, **self._client_kwargs
+            )
+        return self._async_client
+
+    def _model(self, model: str) -> str:
+        if self.model_prefix and "/" not in model:
+            return self.model_prefix + model
+        return model
+
+    def _payload(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {**params, "model": self._model(params["model"])}
+
+    @staticmethod
+    def _parse_completion(data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "content": data["choices"][0]["message"]["content"],
+            "model": data["model"],
+            "usage": _usage_dict(data.get("usage")),
+        }
+
+    @staticmethod
+    def _parse_embeddings(data: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "embeddings": [item["embedding"] for item in data["data"]],
+            "usage": _usage_dict(data.get("usage")),
+        }
+
+    def complete(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        response = self.client.post("/chat/completions", json=self._payload(params))
+        response.raise_for_status()
+        return self._parse_completion(response.json())
+
+    async def acomplete(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        response = await self.async_client.post("/chat/completions", json=self._payload(params))
+        response.raise_for_status()
+        return self._parse_completion(response.json())
+
+    @staticmethod
+    def _parse_sse_line(line: str) -> Optional[Dict[str, Any]]:
+        """Parse one SSE line. Returns None for comments/keep-alives, {} for [DONE]."""
+        if not line.startswith("data:"):
+            return None
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return {}
+        return json.loads(data)
+
+    def _chunk_events(self, chunk: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        if "error" in chunk:
+            raise RuntimeError(f"OpenRouter stream error: {chunk['error']}")
+        if chunk.get("model"):
+            yield {"type": "model", "model": chunk["model"]}
+        yield from _stream_events(chunk.get("model"), chunk.get("choices"), chunk.get("usage"))
+
+    def _stream_payload(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {**self._payload(params), "stream": True, "stream_options": {"include_usage": True}}
+
+    def stream(self, params: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        with self.client.stream("POST", "/chat/completions", json=self._stream_payload(params)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                chunk = self._parse_sse_line(line)
+                if chunk is None:
+                    continue
+                if not chunk:
+                    break
+                yield from self._chunk_events(chunk)
+
+    async def astream(self, params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        async with self.async_client.stream(
+            "POST", "/chat/completions", json=self._stream_payload(params)
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                chunk = self._parse_sse_line(line)
+                if chunk is None:
+                    continue
+                if not chunk:
+                    break
+                for event in self._chunk_events(chunk):
+                    yield event
+
+    def embed(self, texts: List[str], model: str) -> Dict[str, Any]:
+        response = self.client.post("/embeddings", json={"model": self._model(model), "input": texts})
+        response.raise_for_status()
+        return self._parse_embeddings(response.json())
+
+    async def aembed(self, texts: List[str], model: str) -> Dict[str, Any]:
+        response = await self.async_client.post("/embeddings", json={"model": self._model(model), "input": texts})
+        response.raise_for_status()
+        return self._parse_embeddings(response.json())
+
+    def close(self) -> None:
+        self.client.close()
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
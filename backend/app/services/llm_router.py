@@ -0,0 +1,303 @@
+"""
+Failover routing across LLM backends.
+
+BackendRouter exposes the same interface as the backends in llm_backends, so
+OpenAIService can use it in place of a single backend. Each backend sits behind
+its own CircuitBreaker; calls go to the first backend whose breaker is closed,
+and backend failures (transport errors, 5xx, 429, auth errors) fail over to
+the next one in priority order.
+
+With ``hedge_after`` set, completions and embeddings are hedged: if the first
+backend has not answered within that many seconds, the same request is sent to
+the next backend and whichever answers first wins. Streams fail over only
+before their first event and are never hedged.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.utils.circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError
+from app.utils.retry_policy import classify_error
+
+logger = logging.getLogger(__name__)
+
+# Statuses that say "this backend/key is unusable right now" rather than "the request is bad"
+_FAILOVER_STATUS_CODES = frozenset({401, 403})
+
+Route = Tuple[Any, CircuitBreaker]
+
+
+def is_backend_failure(exc: BaseException) -> bool:
+    """Whether *exc* reflects on the backend's health (and another backend might succeed)."""
+    if isinstance(exc, CircuitOpenError):
+        return True
+    retryable, _ = classify_error(exc)
+    if retryable:
+        return True
+    response = getattr(exc, "response", None)
+    status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+    return status in _FAILOVER_STATUS_CODES
+
+
+class BackendRouter:
+    """
+    Routes calls over several backends with circuit breakers, failover and optional hedging.
+
+    Args:
+        routes: (backend, breaker) pairs in priority order; the first is the primary
+        hedge_after: Seconds to wait on a backend before hedging to the next one (None disables)
+    """
+
+    def __init__(self, routes: Sequence[Route], hedge_after: Optional[float] = None):
+        if not routes:
+            raise ValueError("BackendRouter needs at least one backend")
+        self.routes: List[Route] = list(routes)
+        self.hedge_after = hedge_after
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def primary(self):
+        return self.routes[0][0]
+
+    @property
+    def kind(self) -> str:
+        return self.primary.kind
+
+    @property
+    def name(self) -> str:
+        return self.primary.name
+
+    @property
+    def backends(self) -> List[Any]:
+        return [backend for backend, _ in self.routes]
+
+    def _candidates(self) -> List[Route]:
+        # Breakers are only consulted here; allow() (which takes half-open probe slots) runs per attempt
+        candidates = [(backend, breaker) for backend, breaker in self.routes if breaker.state != OPEN]
+        if not candidates:
+            retry_after = min(breaker.retry_after() for _, breaker in self.routes)
+            raise CircuitOpenError(
+                f"All LLM backends are unavailable (circuit open); retry in {retry_after:.1f}s",
+                retry_after=retry_after
+            )
+        return candidates
+
+    @staticmethod
+    def _record(breaker: CircuitBreaker, exc: BaseException, start: float) -> None:
+        if is_backend_failure(exc):
+            breaker.record_failure(time.monotonic() - start)
+        else:
+            # The request itself was bad; the backend answered normally
+            breaker.record_success(time.monotonic() - start)
+
+    @staticmethod
+    def _admit(route: Route) -> None:
+        backend, breaker = route
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit for backend '{backend.name}' is open", breaker.retry_after())
+
+    def _attempt(self, route: Route, call: Callable[[Any], Any]) -> Any:
+        self._admit(route)
+        backend, breaker = route
+        start = time.monotonic()
+        try:
+            result = call(backend)
+        except Exception as e:
+            self._record(breaker, e, start)
+            raise
+        breaker.record_success(time.monotonic() - start)
+        return result
+
+    async def _aattempt(self, route: Route, call: Callable[[Any], Any]) -> Any:
+        self._admit(route)
+        backend, breaker = route
+        start = time.monotonic()
+        try:
+            result = await call(backend)
+        except Exception as e:
+            # Cancellation (a lost hedge) is not an Exception and is not recorded
+            self._record(breaker, e, start)
+            raise
+        breaker.record_success(time.monotonic() - start)
+        return result
+
+    def _failover(self, route: Route, exc: BaseException, candidates: List[Route]) -> None:
+        """Re-raise *exc* unless it is a backend failure and another candidate is left."""
+        if not is_backend_failure(exc) or not candidates:
+            raise exc
+        self.failovers += 1
+        logger.warning(f"[Router] Backend '{route[0].name}' failed ({type(exc).__name__}: {exc}); failing over")
+
+    def _run(self, call: Callable[[Any], Any]) -> Any:
+        candidates = self._candidates()
+        if self.hedge_after is not None and len(candidates) > 1:
+            return self._run_hedged(call, candidates)
+        while True:
+            route = candidates.pop(0)
+            try:
+                return self._attempt(route, call)
+            except Exception as e:
+                self._failover(route, e, candidates)
+
+    def _run_hedged(self, call: Callable[[Any], Any], candidates: List[Route]) -> Any:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+        in_flight: Dict[Any, Route] = {}
+
+        def launch() -> None:
+            route = candidates.pop(0)
+            in_flight[self._executor.submit(self._attempt, route, call)] = route
+
+        launch()
+        first = next(iter(in_flight))
+        while in_flight:
+            done, _ = wait(list(in_flight), timeout=self.hedge_after if candidates else None, return_when=FIRST_COMPLETED)
+            if not done:
+                # Slow backend: hedge to the next one; the slow call keeps running and may still win
+                self.hedges += 1
+                launch()
+                continue
+            for future in done:
+                route = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if in_flight:
+                        if not is_backend_failure(e):
+                            raise
+                        continue
+                    self._failover(route, e, candidates)
+                    launch()
+                    continue
+                if future is not first:
+                    self.hedge_wins += 1
+                return result
+
+    async def _arun(self, call: Callable[[Any], Any]) -> Any:
+        candidates = self._candidates()
+        if self.hedge_after is not None and len(candidates) > 1:
+            return await self._arun_hedged(call, candidates)
+        while True:
+            route = candidates.pop(0)
+            try:
+                return await self._aattempt(route, call)
+            except Exception as e:
+                self._failover(route, e, candidates)
+
+    async def _arun_hedged(self, call: Callable[[Any], Any], candidates: List[Route]) -> Any:
+        in_flight: Dict[asyncio.Task, Route] = {}
+
+        def launch() -> None:
+            route = candidates.pop(0)
+            in_flight[asyncio.ensure_future(self._aattempt(route, call))] = route
+
+        launch()
+        first = next(iter(in_flight))
+        try:
+            while in_flight:
+                done, _ = await asyncio.wait(
+                    list(in_flight), timeout=self.hedge_after if candidates else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self.hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    route = in_flight.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        if in_flight:
+                            if not is_backend_failure(e):
+                                raise
+                            continue
+                        self._failover(route, e, candidates)
+                        launch()
+                        continue
+                    if task is not first:
+                        self.hedge_wins += 1
+                    return result
+        finally:
+            # Cancel the losing hedge, if any
+            for task in in_flight:
+                task.cancel()
+
+    def complete(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return self._run(lambda backend: backend.complete(params))
+
+    async def acomplete(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._arun(lambda backend: backend.acomplete(params))
+
+    def embed(self, texts: List[str], model: str) -> Dict[str, Any]:
+        return self._run(lambda backend: backend.embed(texts, model))
+
+    async def aembed(self, texts: List[str], model: str) -> Dict[str, Any]:
+        return await self._arun(lambda backend: backend.aembed(texts, model))
+
+    def stream(self, params: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        candidates = self._candidates()
+        while True:
+            route = candidates.pop(0)
+            backend, breaker = route
+            start = time.monotonic()
+            started = False
+            try:
+                self._admit(route)
+                for event in backend.stream(params):
+                    if not started:
+                        started = True
+                        breaker.record_success(time.monotonic() - start)
+                    yield event
+                return
+            except Exception as e:
+                if started:
+                    raise
+                if not isinstance(e, CircuitOpenError):
+                    self._record(breaker, e, start)
+                self._failover(route, e, candidates)
+
+    async def astream(self, params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        candidates = self._candidates()
+        while True:
+            route = candidates.pop(0)
+            backend, breaker = route
+            start = time.monotonic()
+            started = False
+            try:
+                self._admit(route)
+                async for event in backend.astream(params):
+                    if not started:
+                        started = True
+                        breaker.record_success(time.monotonic() - start)
+                    yield event
+                return
+            except Exception as e:
+                if started:
+                    raise
+                if not isinstance(e, CircuitOpenError):
+                    self._record(breaker, e, start)
+                self._failover(route, e, candidates)
+
+    def close(self) -> None:
+        for backend in self.backends:
+            backend.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def aclose(self) -> None:
+        for backend in self.backends:
+            await backend.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backends": [breaker.stats() for _, breaker in self.routes],
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
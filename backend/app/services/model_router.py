@@ -0,0 +1,211 @@
+"""
+Per-request model selection.
+
+ModelRouter picks the cheapest model that is good enough for a request:
+
+- the agent type sets the minimum quality tier (sentiment labels do not need a
+  frontier model; analysis does)
+- the prompt plus max output must fit the model's context window
+- JSON output needs a model with JSON mode
+- optional cost (USD) and latency (seconds) budgets rule out models
+
+Costs come from the ``pricing`` table in OpenAISettings (USD per 1K tokens).
+Latency is predicted as overhead + output tokens / throughput; the overhead of
+each model is an EWMA of what completions actually took, so a model that slows
+down loses latency-bound traffic until it recovers.
+"""
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ModelProfile:
+    """Static description of a chat model used for routing."""
+    name: str
+    quality: int  # 1 = small and fast, 2 = strong general model, 3 = frontier
+    context_window: int
+    json_mode: bool = True
+    # Priors for the latency model, refined by observed completions
+    overhead: float = 1.0  # seconds before/around generation
+    tokens_per_second: float = 50.0
+
+
+DEFAULT_MODEL_CATALOG: Dict[str, ModelProfile] = {
+    profile.name: profile for profile in (
+        ModelProfile("gpt-4o-mini", quality=1, context_window=128000, overhead=0.4, tokens_per_second=90.0),
+        ModelProfile("gpt-3.5-turbo", quality=1, context_window=16385, overhead=0.4, tokens_per_second=80.0),
+        ModelProfile("gpt-4o", quality=2, context_window=128000, overhead=0.6, tokens_per_second=60.0),
+        ModelProfile("gpt-4-turbo", quality=3, context_window=128000, overhead=1.0, tokens_per_second=30.0),
+        ModelProfile("gpt-4-turbo-preview", quality=3, context_window=128000, overhead=1.0, tokens_per_second=30.0),
+        ModelProfile("gpt-4", quality=3, context_window=8192, json_mode=False, overhead=1.0, tokens_per_second=20.0),
+    )
+}
+
+# Minimum quality tier per agent type; unknown agent types get the default model's tier
+DEFAULT_AGENT_POLICIES: Dict[str, Dict[str, Any]] = {
+    "sentiment": {"min_quality": 1},
+    "news": {"min_quality": 2},
+    "technical": {"min_quality": 2},
+}
+
+
+@dataclass
+class ModelChoice:
+    """Outcome of ModelRouter.select()."""
+    model: str
+    reason: str
+    estimated_cost: Optional[float] = None
+    estimated_latency: Optional[float] = None
+    rejected: Dict[str, str] = field(default_factory=dict)
+
+
+class ModelRouter:
+    """
+    Chooses a model per request from agent policy, prompt size, output format and budgets.
+
+    Args:
+        pricing: model -> {"input": USD per 1K tokens, "output": USD per 1K tokens}
+        default_model: Model used when routing has nothing to go on
+        catalog: Routable models (default DEFAULT_MODEL_CATALOG)
+        agent_policies: agent type -> {"min_quality", optional "max_cost", "max_latency"}
+        ewma_alpha: Weight of the newest observation in the latency EWMA
+    """
+
+    def __init__(
+        self,
+        pricing: Mapping[str, Mapping[str, float]],
+        default_model: str,
+        catalog: Optional[Mapping[str, ModelProfile]] = None,
+        agent_policies: Optional[Mapping[str, Mapping[str, Any]]] = None,
+        ewma_alpha: float = 0.2
+    ):
+        self.pricing = pricing
+        self.default_model = default_model
+        self.catalog = dict(catalog or DEFAULT_MODEL_CATALOG)
+        self.agent_policies = dict(agent_policies if agent_policies is not None else DEFAULT_AGENT_POLICIES)
+        self.ewma_alpha = ewma_alpha
+        self._lock = threading.Lock()
+        # model -> EWMA of observed overhead (latency not explained by output throughput)
+        self._overhead: Dict[str, float] = {}
+        self._samples: Dict[str, int] = {}
+        self.selections: Dict[str, int] = {}
+
+    def estimate_cost(self, model: str, prompt_tokens: int, output_tokens: int) -> Optional[float]:
+        prices = self.pricing.get(model)
+        if prices is None:
+            return None
+        return prompt_tokens / 1000.0 * prices["input"] + output_tokens / 1000.0 * prices["output"]
+
+    def estimate_latency(self, model: str, output_tokens: int) -> Optional[float]:
+        profile = self.catalog.get(model)
+        if profile is None:
+            return None
+        overhead = self._overhead.get(model, profile.overhead)
+        return overhead + output_tokens / profile.tokens_per_second
+
+    def record(self, model: str, latency: float, output_tokens: int) -> None:
+        """Feed an observed completion latency into the model's EWMA."""
+        profile = self.catalog.get(model)
+        if profile is None:
+            return
+        observed = max(0.0, latency - output_tokens / profile.tokens_per_second)
+        with self._lock:
+            previous = self._overhead.get(model)
+            self._overhead[model] = observed if previous is None else (
+                self.ewma_alpha * observed + (1 - self.ewma_alpha) * previous
+            )
+            self._samples[model] = self._samples.get(model, 0) + 1
+
+    def _min_quality(self, agent_type: Optional[str]) -> int:
+        policy = self.agent_policies.get(agent_type or "")
+        if policy and "min_quality" in policy:
+            return policy["min_quality"]
+        default = self.catalog.get(self.default_model)
+        return default.quality if default else max(p.quality for p in self.catalog.values())
+
+    def select(
+        self,
+        agent_type: Optional[str] = None,
+        prompt_tokens: int = 0,
+        max_output_tokens: int = 0,
+        response_format: Optional[str] = None,
+        max_cost: Optional[float] = None,
+        max_latency: Optional[float] = None
+    ) -> ModelChoice:
+        """
+        Pick the cheapest eligible model (ties go to the faster one).
+
+        Args:
+            agent_type: Agent making the request (see agent policies)
+            prompt_tokens: Estimated prompt size
+            max_output_tokens: Completion budget
+            response_format: "json" requires JSON mode; "text" and "label" do not
+            max_cost: Maximum estimated cost of the request in USD
+            max_latency: Maximum predicted latency in seconds
+
+        Returns:
+            ModelChoice; falls back to the default model when nothing qualifies
+        """
+        policy = self.agent_policies.get(agent_type or "", {})
+        max_cost = max_cost if max_cost is not None else policy.get("max_cost")
+        max_latency = max_latency if max_latency is not None else policy.get("max_latency")
+        min_quality = self._min_quality(agent_type)
+        needed_context = prompt_tokens + max_output_tokens
+
+        rejected: Dict[str, str] = {}
+        eligible: List[tuple] = []
+        within_budget: List[tuple] = []
+        for name, profile in self.catalog.items():
+            if profile.quality < min_quality:
+                rejected[name] = f"quality {profile.quality} < {min_quality}"
+                continue
+            if needed_context > profile.context_window:
+                rejected[name] = f"context {needed_context} > {profile.context_window}"
+                continue
+            if response_format == "json" and not profile.json_mode:
+                rejected[name] = "no JSON mode"
+                continue
+            cost = self.estimate_cost(name, prompt_tokens, max_output_tokens)
+            if cost is None:
+                rejected[name] = "no pricing"
+                continue
+            latency = self.estimate_latency(name, max_output_tokens)
+            candidate = (cost, latency, name)
+            eligible.append(candidate)
+            if max_cost is not None and cost > max_cost:
+                rejected[name] = f"cost {cost:.5f} > {max_cost}"
+            elif max_latency is not None and latency > max_latency:
+                rejected[name] = f"latency {latency:.2f}s > {max_latency}s"
+            else:
+                within_budget.append(candidate)
+
+        if within_budget:
+            cost, latency, name = min(within_budget)
+            reason = f"cheapest model with quality >= {min_quality} within budget"
+        elif eligible:
+            # Budgets cannot be met; prefer meeting the latency budget, then the cheapest
+            cost, latency, name = min(eligible, key=lambda c: (c[1] if max_latency is not None else 0, c[0]))
+            reason = "no model meets the budget; closest eligible model"
+        else:
+            logger.warning(f"[ModelRouter] No routable model for agent_type={agent_type}; using {self.default_model}")
+            choice = ModelChoice(self.default_model, "no eligible model; default", rejected=rejected)
+            self._count(choice.model)
+            return choice
+        self._count(name)
+        return ModelChoice(name, reason, estimated_cost=cost, estimated_latency=latency, rejected=rejected)
+
+    def _count(self, model: str) -> None:
+        with self._lock:
+            self.selections[model] = self.selections.get(model, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "selections": dict(self.selections),
+                "latency_overhead": dict(self._overhead),
+                "samples": dict(self._samples),
+            }
@@ -1,18 +1,38 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator
 import time
+import asyncio
+import hashlib
+import json
 import logging
-from openai import OpenAI
+import re
+from concurrent.futures import ThreadPoolExecutor
 from app.config.openai_config import get_openai_settings
-import httpx
-from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
-from collections import deque
+from app.services.llm_backends import OpenAIBackend, OpenRouterBackend
+from app.services.llm_router import BackendRouter
+from app.services.model_router import ModelRouter
+from app.utils.cost_tracker import CostTracker
+from app.utils.embedding_batcher import EmbeddingBatcher, AsyncEmbeddingBatcher
+from app.utils.embedding_cache import EmbeddingCache, normalize_text
+from app.utils.token_bucket import Limit, RateLimitExceeded, TokenBucketLimiter
+from app.utils.limiter_backends import get_limiter_backend
+from app.utils.singleflight import SingleFlight, AsyncSingleFlight
+from app.utils.completion_cache import CompletionCache, build_completion_cache
+from app.utils.sentiment_classifier import EmbeddingSentimentModel, LocalSentimentClassifier
+from app.utils.retry_policy import RetryBudget, RetryPolicy
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.token_counter import get_token_counter
 import openai
 import logging
-import backoff
 import os
 
 logger = logging.getLogger(__name__)
 
+# Batch sentiment reply parsing: "3: positive", "3. Negative", "(3) neutral", or a bare label
+_NUMBERED_LABEL_RE = re.compile(r"^\W*(\d+)\W+(positive|negative|neutral)\b", re.IGNORECASE)
+_BARE_LABEL_RE = re.compile(r"^\W*(positive|negative|neutral)\W*$", re.IGNORECASE)
+# Keep a single batched sentiment prompt well inside the context window
+SENTIMENT_BATCH_MAX_TOKENS = 6000
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 # Removed module-level client initialization to prevent import-time errors
 
@@ -35,54 +55,510 @@ class OpenAIService:
         self.use_openrouter = self.settings.USE_OPENROUTER
         self.max_retries = self.settings.max_retries
         self.retry_delay = self.settings.retry_delay
+        # One retry engine (and budget) for every upstream call of this instance
+        self.retry_policy = RetryPolicy(
+            max_attempts=self.max_retries,
+            base_delay=self.retry_delay,
+            max_delay=self.settings.RETRY_MAX_DELAY,
+            max_retry_after=self.settings.RETRY_MAX_RETRY_AFTER,
+            budget=RetryBudget(
+                ratio=self.settings.RETRY_BUDGET_RATIO,
+                min_retries=self.settings.RETRY_BUDGET_MIN_RETRIES,
+                window=self.settings.RETRY_BUDGET_WINDOW
+            )
+        )
         self.rate_limit_rpm = self.settings.RATE_LIMIT_RPM
-        self.rate_limit_tpm = getattr(self.settings, 'RATE_LIMIT_TPM', 1000000)  # Default 1M tokens/min
-        self._call_timestamps = deque()
-        self._token_timestamps = deque()  # (timestamp, tokens)
+        self.rate_limit_tpm = self.settings.RATE_LIMIT_TPM
+        self.rate_limit_max_wait = self.settings.RATE_LIMIT_MAX_WAIT
+        # Budget is shared by every worker using the same limiter backend (RATE_LIMIT_BACKEND)
+        self.rate_limiter = TokenBucketLimiter([
+            Limit("rpm", self.rate_limit_rpm, 60.0),
+            Limit("tpm", self.rate_limit_tpm, 60.0)
+        ], backend=get_limiter_backend())
+        self.rate_limit_key = "openrouter" if self.use_openrouter else "openai"
+        self.cost_tracker = CostTracker() if self.settings.ENABLE_COST_TRACKING else None
+        # One long-lived backend (and connection pool) per service instance
         if not self.use_openrouter:
-            self.client = OpenAI(
+            primary = OpenAIBackend(
+                self.settings,
                 api_key=self.settings.api_key,
                 organization=self.settings.organization
             )
+            self.client = primary.client
         else:
             self.openrouter_base_url = self.settings.OPENROUTER_BASE_URL
             self.openrouter_api_key = self.settings.OPENROUTER_API_KEY
+            primary = OpenRouterBackend(
+                self.settings,
+                api_key=self.openrouter_api_key,
+                base_url=self.openrouter_base_url,
+                model_prefix="openai/"
+            )
+        self.backends = [primary]
+        if self.settings.FAILOVER_ENABLED:
+            self.backends.extend(self._fallback_backends())
+        # With fallbacks configured, route through per-backend circuit breakers
+        self.backend = BackendRouter(
+            [(backend, self._circuit_breaker(backend.name)) for backend in self.backends],
+            hedge_after=self.settings.HEDGE_AFTER_MS / 1000.0 if self.settings.HEDGE_AFTER_MS is not None else None
+        ) if len(self.backends) > 1 else primary
+
+        # Shared, self-calibrating token counts for the limiter, batch packers and estimates
+        self.token_counter = get_token_counter()
+
+        # Picks a model per request for agent-typed calls (see _select_model)
+        self.model_router = ModelRouter(
+            self.settings.pricing,
+            default_model=self.settings.default_model,
+            agent_policies=self.settings.agent_model_policies
+        )
+
+        # Identical concurrent completions share one upstream request
+        self.singleflight_enabled = self.settings.SINGLEFLIGHT_ENABLED
+        self._singleflight = SingleFlight()
+        self._async_singleflight = AsyncSingleFlight()
+
+        # Opt-in response cache for deterministic (temperature 0) or explicitly flagged completions
+        self.completion_cache_enabled = self.settings.COMPLETION_CACHE_ENABLED
+        self._completion_cache: Optional[CompletionCache] = None
+
+        # Optional local classifier that answers confident sentiment calls without the LLM
+        self.sentiment_local_mode = self.settings.SENTIMENT_LOCAL_MODE
+        self._sentiment_classifier: Optional[LocalSentimentClassifier] = None
+        self.sentiment_local_hits = 0
+        self.sentiment_escalations = 0
+
+        # Provider-side prompt prefix caching, from usage.prompt_tokens_details.cached_tokens
+        self._prompt_cache = {
+            "requests": 0, "requests_with_hits": 0, "prompt_tokens": 0, "cached_tokens": 0,
+            "latency_with_hits": 0.0, "latency_without_hits": 0.0, "savings": 0.0
+        }
+
+        self.embedding_batching = self.settings.EMBEDDING_BATCH_ENABLED
+        self._embedding_batcher: Optional[EmbeddingBatcher] = None
+        self._async_embedding_batcher: Optional[AsyncEmbeddingBatcher] = None
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        if self.settings.EMBEDDING_CACHE_ENABLED:
+            self.embedding_cache = EmbeddingCache(
+                max_bytes=self.settings.EMBEDDING_CACHE_MAX_BYTES,
+                disk_path=self.settings.EMBEDDING_CACHE_PATH
+            )
+
+    def _fallback_backends(self) -> list:
+        """Backends to fail over to, in priority order: the backup OpenAI key, then OpenRouter."""
+        fallbacks = []
+        if self.settings.BACKUP_API_KEY and not self.use_openrouter:
+            fallbacks.append(OpenAIBackend(
+                self.settings,
+                api_key=self.settings.BACKUP_API_KEY,
+                organization=self.settings.organization,
+                name="backup"
+            ))
+        if self.settings.OPENROUTER_API_KEY and not self.use_openrouter:
+            fallbacks.append(OpenRouterBackend(
+                self.settings,
+                api_key=self.settings.OPENROUTER_API_KEY,
+                base_url=self.settings.OPENROUTER_BASE_URL,
+                model_prefix="openai/"
+            ))
+        return fallbacks
+
+    def _circuit_breaker(self, name: str) -> CircuitBreaker:
+        latency_ms = self.settings.BREAKER_LATENCY_P95_MS
+        return CircuitBreaker(
+            name,
+            failure_rate=self.settings.BREAKER_FAILURE_RATE,
+            latency_p95=latency_ms / 1000.0 if latency_ms is not None else None,
+            window=self.settings.BREAKER_WINDOW,
+            min_calls=self.settings.BREAKER_MIN_CALLS,
+            open_seconds=self.settings.BREAKER_OPEN_SECONDS
+        )
+
+    @property
+    def completion_cache(self) -> CompletionCache:
+        if self._completion_cache is None:
+            self._completion_cache = build_completion_cache(
+                self.settings.COMPLETION_CACHE_BACKEND,
+                ttl=self.settings.COMPLETION_CACHE_TTL,
+                max_entries=self.settings.COMPLETION_CACHE_MAX_ENTRIES,
+                path=self.settings.COMPLETION_CACHE_PATH
+            )
+        return self._completion_cache
+
+    @property
+    def sentiment_classifier(self) -> LocalSentimentClassifier:
+        if self._sentiment_classifier is None:
+            model = None
+            if self.sentiment_local_mode == "embedding" and self.settings.SENTIMENT_MODEL_PATH:
+                model = EmbeddingSentimentModel.load(self.settings.SENTIMENT_MODEL_PATH)
+            self._sentiment_classifier = LocalSentimentClassifier(
+                model=model,
+                threshold=self.settings.SENTIMENT_LOCAL_THRESHOLD
+            )
+        return self._sentiment_classifier
+
+    def _use_completion_cache(self, params: Dict[str, Any], cache: Optional[bool]) -> bool:
+        if cache is not None:
+            return cache
+        return self.completion_cache_enabled and params["temperature"] == 0
+
+    def _batcher_kwargs(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.settings.EMBEDDING_BATCH_MAX_SIZE,
+            "max_batch_tokens": self.settings.EMBEDDING_BATCH_MAX_TOKENS,
+            "max_wait": self.settings.EMBEDDING_BATCH_MAX_WAIT_MS / 1000.0,
+            "count_tokens": lambda text: self.token_counter.count(text, self.settings.embedding_model)
+        }
+
+    @property
+    def embedding_batcher(self) -> EmbeddingBatcher:
+        if self._embedding_batcher is None:
+            self._embedding_batcher = EmbeddingBatcher(
+                lambda texts: self._fetch_embeddings(texts, self.settings.embedding_model),
+                **self._batcher_kwargs()
+            )
+        return self._embedding_batcher
+
+    @property
+    def async_embedding_batcher(self) -> AsyncEmbeddingBatcher:
+        if self._async_embedding_batcher is None:
+            self._async_embedding_batcher = AsyncEmbeddingBatcher(
+                lambda texts: self._afetch_embeddings(texts, self.settings.embedding_model),
+                **self._batcher_kwargs()
+            )
+        return self._async_embedding_batcher
+
+    async def astart(self) -> None:
+        """Open the pooled async HTTP clients. Called from the FastAPI lifespan hook."""
+        for backend in self.backends:
+            _ = backend.async_client
+
+    async def aclose(self) -> None:
+        """Close the pooled async HTTP clients. Called from the FastAPI lifespan hook."""
+        await self.backend.aclose()
+
+    def close(self) -> None:
+        """Flush pending embedding batches and close the pooled sync HTTP clients."""
+        if self._embedding_batcher is not None:
+            self._embedding_batcher.close()
+            self._embedding_batcher = None
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
+        self.backend.close()
     
-    def _enforce_rate_limit(self, tokens_needed=0):
-        now = time.time()
-        window_start = now - 60
-        # Remove timestamps outside the 1-minute window
-        while self._call_timestamps and self._call_timestamps[0] < window_start:
-            self._call_timestamps.popleft()
-        while self._token_timestamps and self._token_timestamps[0][0] < window_start:
-            self._token_timestamps.popleft()
-        # Check RPM
-        if len(self._call_timestamps) >= self.rate_limit_rpm:
-            logger.error(f"[RateLimit] RPM exceeded. Raising RateLimitException.")
-            raise RateLimitException("OpenAIService: Requests per minute rate limit exceeded.")
-        # Check TPM
-        tokens_used = sum(t for ts, t in self._token_timestamps)
-        if tokens_used + tokens_needed > self.rate_limit_tpm:
-            logger.error(f"[RateLimit] TPM exceeded. Used: {tokens_used}, Needed: {tokens_needed}. Raising RateLimitException.")
-            raise RateLimitException("OpenAIService: Tokens per minute rate limit exceeded.")
-        self._call_timestamps.append(now)
-        if tokens_needed > 0:
-            self._token_timestamps.append((now, tokens_needed))
-    
-    def _retry_decorator(self):
-        return retry(
-            stop=stop_after_attempt(self.max_retries),
-            wait=wait_fixed(self.retry_delay),
-            retry=retry_if_exception_type((httpx.HTTPError, Exception)),
-            reraise=True
+    def _enforce_rate_limit(self, tokens_needed=0, block=True):
+        """
+        Take one request and *tokens_needed* tokens from the RPM/TPM budget.
+
+        Waits up to RATE_LIMIT_MAX_WAIT seconds for capacity (or not at all when
+        *block* is False) and raises RateLimitException if the wait would be longer.
+        """
+        try:
+            self.rate_limiter.acquire(
+                {"rpm": 1, "tpm": tokens_needed},
+                key=self.rate_limit_key,
+                timeout=self.rate_limit_max_wait if block else 0
+            )
+        except RateLimitExceeded as e:
+            logger.error(f"[RateLimit] {e}. Raising RateLimitException.")
+            raise RateLimitException(f"OpenAIService: rate limit exceeded, retry in {e.retry_after:.2f}s.") from e
+
+    async def _aenforce_rate_limit(self, tokens_needed=0):
+        """Async variant of _enforce_rate_limit; waits without blocking the event loop."""
+        try:
+            await self.rate_limiter.aacquire(
+                {"rpm": 1, "tpm": tokens_needed},
+                key=self.rate_limit_key,
+                timeout=self.rate_limit_max_wait
+            )
+        except RateLimitExceeded as e:
+            logger.error(f"[RateLimit] {e}. Raising RateLimitException.")
+            raise RateLimitException(f"OpenAIService: rate limit exceeded, retry in {e.retry_after:.2f}s.") from e
+
+    def _reconcile_tokens(self, estimated: int, actual: int) -> None:
+        """Correct the TPM budget once the real token usage is known."""
+        if actual:
+            self.rate_limiter.adjust({"tpm": actual - estimated}, key=self.rate_limit_key)
+
+    def _completion_params(
+        self,
+        messages: list[Dict[str, str]],
+        model: Optional[str],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        agent_type: Optional[str] = None,
+        response_format: Optional[str] = None,
+        max_cost: Optional[float] = None,
+        max_latency: Optional[float] = None
+    ) -> Dict[str, Any]:
+        max_tokens = max_tokens or 2000
+        if temperature is None:
+            temperature = self.settings.agent_temperatures.get(agent_type, self.settings.default_temperature)
+        params = {
+            "model": model or self._select_model(
+                messages, max_tokens, agent_type, response_format, max_cost, max_latency
+            ),
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if response_format == "json":
+            params["response_format"] = {"type": "json_object"}
+        return params
+
+    def _select_model(
+        self,
+        messages: list[Dict[str, str]],
+        max_tokens: int,
+        agent_type: Optional[str],
+        response_format: Optional[str],
+        max_cost: Optional[float],
+        max_latency: Optional[float]
+    ) -> str:
+        """Model for a request that does not pin one: routed when there is something to route on."""
+        routable = agent_type is not None or max_cost is not None or max_latency is not None
+        if not self.settings.MODEL_ROUTING_ENABLED or not routable:
+            return self.settings.agent_models.get(agent_type, self.settings.default_model)
+        prompt_tokens = self.token_counter.count_messages(messages, self.settings.default_model)
+        choice = self.model_router.select(
+            agent_type=agent_type,
+            prompt_tokens=prompt_tokens,
+            max_output_tokens=max_tokens,
+            response_format=response_format,
+            max_cost=max_cost,
+            max_latency=max_latency
+        )
+        logger.debug(f"[ModelRouter] agent_type={agent_type} -> {choice.model} ({choice.reason})")
+        return choice.model
+
+    @staticmethod
+    def _completion_fingerprint(params: Dict[str, Any]) -> str:
+        """Stable hash of (model, messages, temperature, max_tokens) identifying identical requests."""
+        payload = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _estimate_completion_tokens(self, params: Dict[str, Any]) -> int:
+        """Upper-bound TPM cost of a completion: prompt tokens plus max_tokens."""
+        return self.token_counter.count_messages(params["messages"], params["model"]) + params["max_tokens"]
+
+    def _track_prompt_cache(self, model: str, usage: Dict[str, int], latency: float) -> None:
+        stats = self._prompt_cache
+        cached = usage.get("cached_tokens", 0)
+        stats["requests"] += 1
+        stats["prompt_tokens"] += usage["prompt_tokens"]
+        stats["cached_tokens"] += cached
+        if cached:
+            stats["requests_with_hits"] += 1
+            stats["latency_with_hits"] += latency
+            prices = self.settings.pricing.get((model or "").split("/")[-1])
+            if prices is not None:
+                stats["savings"] += cached / 1000.0 * prices["input"] * self.settings.PROMPT_CACHE_DISCOUNT
+        else:
+            stats["latency_without_hits"] += latency
+
+    def _prompt_cache_metrics(self) -> Dict[str, Any]:
+        stats = self._prompt_cache
+        misses = stats["requests"] - stats["requests_with_hits"]
+        return {
+            "requests": stats["requests"],
+            "requests_with_hits": stats["requests_with_hits"],
+            "prompt_tokens": stats["prompt_tokens"],
+            "cached_tokens": stats["cached_tokens"],
+            "cached_ratio": stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0,
+            "avg_latency_with_hits": (
+                stats["latency_with_hits"] / stats["requests_with_hits"] if stats["requests_with_hits"] else None
+            ),
+            "avg_latency_without_hits": stats["latency_without_hits"] / misses if misses else None,
+            "estimated_savings_usd": stats["savings"]
+        }
+
+    def _track_usage(self, model: str, usage: Dict[str, int], latency: float) -> None:
+        self._track_prompt_cache(model, usage, latency)
+        if self.cost_tracker is None:
+            return
+        self.cost_tracker.track_request(
+            model=model,
+            tokens_used=usage["total_tokens"],
+            latency=latency,
+            input_tokens=usage["prompt_tokens"],
+            output_tokens=usage["completion_tokens"]
+        )
+
+    def _finish_completion(self, params: Dict[str, Any], result: Dict[str, Any], start_time: float) -> Dict[str, Any]:
+        latency = time.time() - start_time
+        self.model_router.record(params["model"], latency, result["usage"]["completion_tokens"])
+        self.token_counter.observe_messages(params["messages"], result["usage"]["prompt_tokens"])
+        logger.info(
+            f"OpenAI request completed: model={result['model']}, "
+            f"tokens={result['usage']['total_tokens']}, latency={latency:.2f}s"
+        )
+        self._track_usage(result["model"], result["usage"], latency)
+        return {**result, "latency": latency}
+
+    def _finish_stream(
+        self,
+        params: Dict[str, Any],
+        state: Dict[str, Any],
+        start_time: float
+    ) -> Dict[str, Any]:
+        """Build the final stream record and feed the cost tracker once the stream closes."""
+        latency = time.time() - start_time
+        content = "".join(state["chunks"])
+        usage = state["usage"]
+        if usage is None:
+            # Provider did not report usage; count it ourselves
+            prompt_tokens = self.token_counter.count_messages(params["messages"], params["model"])
+            completion_tokens = self.token_counter.count(content, params["model"]) if content else 0
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "cached_tokens": 0
+            }
+        model = state["model"] or params["model"]
+        self.model_router.record(params["model"], latency, usage["completion_tokens"])
+        logger.info(
+            f"OpenAI stream completed: model={model}, tokens={usage['total_tokens']}, "
+            f"latency={latency:.2f}s, ttft={state['ttft'] if state['ttft'] is not None else -1:.2f}s"
         )
+        self._track_usage(model, usage, latency)
+        return {
+            "type": "done",
+            "content": content,
+            "model": model,
+            "usage": usage,
+            "latency": latency,
+            "time_to_first_token": state["ttft"]
+        }
+
+    @staticmethod
+    def _new_stream_state() -> Dict[str, Any]:
+        return {"chunks": [], "usage": None, "model": None, "ttft": None}
+
+    @staticmethod
+    def _apply_stream_event(state: Dict[str, Any], event: Dict[str, Any], start_time: float) -> Optional[Dict[str, Any]]:
+        """Fold a backend event into *state*; return the event to emit to the caller, if any."""
+        if event["type"] == "model":
+            state["model"] = event["model"] or state["model"]
+            return None
+        if event["type"] == "usage":
+            state["usage"] = event["usage"]
+            state["model"] = event["model"] or state["model"]
+            return None
+        if state["ttft"] is None:
+            state["ttft"] = time.time() - start_time
+        state["chunks"].append(event["content"])
+        return event
+
+    def stream_completion(
+        self,
+        messages: list[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        agent_type: Optional[str] = None,
+        response_format: Optional[str] = None,
+        max_cost: Optional[float] = None,
+        max_latency: Optional[float] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream a chat completion as it is generated.
+
+        Yields ``{"type": "delta", "content": str}`` events as tokens arrive, then one
+        final ``{"type": "done", ...}`` record with the full content, model, usage,
+        latency and time_to_first_token. Connection errors are retried only until the
+        first token has been yielded.
+
+        Args:
+            messages: List of message dictionaries
+            model: Optional model override
+            temperature: Optional temperature override
+            max_tokens: Optional max tokens override
+            agent_type: Agent making the request ("sentiment", "news", "technical", ...);
+                without a pinned model, the model router picks one for it
+            response_format: "json" for a JSON object reply, "text" or "label" otherwise
+            max_cost: Cost budget in USD for model routing
+            max_latency: Latency budget in seconds for model routing
+        """
+        params = self._completion_params(
+            messages, model, temperature, max_tokens, agent_type, response_format, max_cost, max_latency
+        )
+        tokens_needed = self._estimate_completion_tokens(params)
+        self._enforce_rate_limit(tokens_needed)
+        retry = self.retry_policy.start()
+        while True:
+            start_time = time.time()
+            state = self._new_stream_state()
+            try:
+                for event in self.backend.stream(params):
+                    emitted = self._apply_stream_event(state, event, start_time)
+                    if emitted is not None:
+                        yield emitted
+                break
+            except Exception as e:
+                delay = None if state["chunks"] else retry.backoff(e)
+                if delay is None:
+                    logger.error(f"Error in OpenAI stream: {str(e)}")
+                    raise
+                logger.warning(f"OpenAI stream failed before first token (attempt {retry.attempt - 1}): {e}")
+                time.sleep(delay)
+        final = self._finish_stream(params, state, start_time)
+        self._reconcile_tokens(tokens_needed, final["usage"]["total_tokens"])
+        yield final
+
+    async def astream_completion(
+        self,
+        messages: list[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        agent_type: Optional[str] = None,
+        response_format: Optional[str] = None,
+        max_cost: Optional[float] = None,
+        max_latency: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Async variant of stream_completion, backed by the pooled async client.
+
+        Yields the same ``delta`` events and final ``done`` record as stream_completion.
+        """
+        params = self._completion_params(
+            messages, model, temperature, max_tokens, agent_type, response_format, max_cost, max_latency
+        )
+        tokens_needed = self._estimate_completion_tokens(params)
+        await self._aenforce_rate_limit(tokens_needed)
+        retry = self.retry_policy.start()
+        while True:
+            start_time = time.time()
+            state = self._new_stream_state()
+            try:
+                async for event in self.backend.astream(params):
+                    emitted = self._apply_stream_event(state, event, start_time)
+                    if emitted is not None:
+                        yield emitted
+                break
+            except Exception as e:
+                delay = None if state["chunks"] else retry.backoff(e)
+                if delay is None:
+                    logger.error(f"Error in OpenAI stream: {str(e)}")
+                    raise
+                logger.warning(f"OpenAI stream failed before first token (attempt {retry.attempt - 1}): {e}")
+                await asyncio.sleep(delay)
+        final = self._finish_stream(params, state, start_time)
+        self._reconcile_tokens(tokens_needed, final["usage"]["total_tokens"])
+        yield final
 
     def create_completion(
         self,
         messages: list[Dict[str, str]],
         model: Optional[str] = None,
         temperature: Optional[float] = None,
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        cache: Optional[bool] = None,
+        agent_type: Optional[str] = None,
+        response_format: Optional[str] = None,
+        max_cost: Optional[float] = None,
+        max_latency: Optional[float] = None
     ) -> Dict[str, Any]:
         """
         Create a chat completion
@@ -92,68 +568,46 @@ class OpenAIService:
             model: Optional model override
             temperature: Optional temperature override
             max_tokens: Optional max tokens override
+            cache: Force (True) or skip (False) the completion cache. By default only
+                temperature-0 requests are cached, and only if COMPLETION_CACHE_ENABLED
+            agent_type: Agent making the request ("sentiment", "news", "technical", ...);
+                without a pinned model, the model router picks one for it
+            response_format: "json" for a JSON object reply, "text" or "label" otherwise
+            max_cost: Cost budget in USD for model routing
+            max_latency: Latency budget in seconds for model routing
             
         Returns:
-            Dictionary containing the API response
+            Dictionary containing the API response; ``cache_hit`` tells whether it
+            was served from the completion cache
         """
-        @self._retry_decorator()
+        params = self._completion_params(
+            messages, model, temperature, max_tokens, agent_type, response_format, max_cost, max_latency
+        )
+        use_cache = self._use_completion_cache(params, cache)
+        fingerprint = self._completion_fingerprint(params)
+        if use_cache:
+            start_time = time.time()
+            cached = self.completion_cache.get(fingerprint)
+            if cached is not None:
+                return {**cached, "latency": time.time() - start_time, "cache_hit": True}
+
+        @self.retry_policy
         def _do_request():
-            self._enforce_rate_limit()
+            tokens_needed = self._estimate_completion_tokens(params)
+            self._enforce_rate_limit(tokens_needed)
             start_time = time.time()
-            if self.use_openrouter:
-                # OpenRouter API call
-                url = f"{self.openrouter_base_url}/chat/completions"
-                headers = {
-                    "Authorization": f"Bearer {self.openrouter_api_key}",
-                    "Content-Type": "application/json"
-                }
-                payload = {
-                    "model": model or self.settings.default_model,
-                    "messages": messages,
-                    "temperature": temperature or self.settings.default_temperature,
-                    "max_tokens": max_tokens or 2000
-                }
-                with httpx.Client() as client:
-                    response = client.post(url, headers=headers, json=payload)
-                    response.raise_for_status()
-                    data = response.json()
-                end_time = time.time()
-                latency = end_time - start_time
-                return {
-                    "content": data["choices"][0]["message"]["content"],
-                    "model": data["model"],
-                    "usage": data["usage"],
-                    "latency": latency
-                }
-            else:
-                response = self.client.chat.completions.create(
-                    model=model or self.settings.default_model,
-                    messages=messages,
-                    temperature=temperature or self.settings.default_temperature,
-                    max_tokens=max_tokens or 2000
-                )
-                end_time = time.time()
-                latency = end_time - start_time
-                logger.info(
-                    f"OpenAI request completed: model={response.model}, "
-                    f"tokens={response.usage.total_tokens}, latency={latency:.2f}s"
-                )
-                return {
-                    "content": response.choices[0].message.content,
-                    "model": response.model,
-                    "usage": {
-                        "prompt_tokens": response.usage.prompt_tokens,
-                        "completion_tokens": response.usage.completion_tokens,
-                        "total_tokens": response.usage.total_tokens
-                    },
-                    "latency": latency
-                }
+            result = self.backend.complete(params)
+            self._reconcile_tokens(tokens_needed, result["usage"]["total_tokens"])
+            result = self._finish_completion(params, result, start_time)
+            if use_cache:
+                self.completion_cache.set(fingerprint, result)
+            return result
 
         # --- BEGIN ADDITIONAL DEBUG LOGGING ---
         try:
             logger.info(
-                "[OpenAIService.create_completion] Prepared _do_request. Type: %s | Callable: %s | Decorated by tenacity: %s",
-                type(_do_request), callable(_do_request), hasattr(_do_request, "retry")
+                "[OpenAIService.create_completion] Prepared _do_request. Type: %s | Callable: %s | Wrapped by retry policy: %s",
+                type(_do_request), callable(_do_request), hasattr(_do_request, "__wrapped__")
             )
         except Exception as _log_exc:
             # Safeguard to ensure logging itself never breaks the flow.
@@ -162,7 +616,63 @@ class OpenAIService:
             )
         # --- END ADDITIONAL DEBUG LOGGING ---
         try:
-            return _do_request()
+            if not self.singleflight_enabled:
+                return {**_do_request(), "cache_hit": False}
+            result, _ = self._singleflight.do(fingerprint, _do_request)
+            return {**result, "cache_hit": False}
+        except RateLimitException as e:
+            logger.error(str(e))
+            raise
+        except Exception as e:
+            logger.error(f"Error in OpenAI service: {str(e)}")
+            raise
+
+    async def acreate_completion(
+        self,
+        messages: list[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        cache: Optional[bool] = None,
+        agent_type: Optional[str] = None,
+        response_format: Optional[str] = None,
+        max_cost: Optional[float] = None,
+        max_latency: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Async variant of create_completion that does not block the event loop.
+
+        Uses the pooled async client, so many requests can be in flight on one worker.
+        Arguments and return value are the same as create_completion.
+        """
+        params = self._completion_params(
+            messages, model, temperature, max_tokens, agent_type, response_format, max_cost, max_latency
+        )
+        use_cache = self._use_completion_cache(params, cache)
+        fingerprint = self._completion_fingerprint(params)
+        if use_cache:
+            start_time = time.time()
+            cached = self.completion_cache.get(fingerprint)
+            if cached is not None:
+                return {**cached, "latency": time.time() - start_time, "cache_hit": True}
+
+        @self.retry_policy
+        async def _do_request():
+            tokens_needed = self._estimate_completion_tokens(params)
+            await self._aenforce_rate_limit(tokens_needed)
+            start_time = time.time()
+            result = await self.backend.acomplete(params)
+            self._reconcile_tokens(tokens_needed, result["usage"]["total_tokens"])
+            result = self._finish_completion(params, result, start_time)
+            if use_cache:
+                self.completion_cache.set(fingerprint, result)
+            return result
+
+        try:
+            if not self.singleflight_enabled:
+                return {**await _do_request(), "cache_hit": False}
+            result, _ = await self._async_singleflight.do(fingerprint, _do_request)
+            return {**result, "cache_hit": False}
         except RateLimitException as e:
             logger.error(str(e))
             raise
@@ -173,6 +683,10 @@ class OpenAIService:
     def get_embedding(self, text: str) -> List[float]:
         """
         Get embeddings for text using OpenAI's or OpenRouter's embedding model.
+
+        Cached vectors are returned without an API call. Concurrent cache misses
+        are coalesced into batched upstream requests unless EMBEDDING_BATCH_ENABLED
+        is off.
         
         Args:
             text: Text to get embeddings for
@@ -181,110 +695,482 @@ class OpenAIService:
             List of embedding floats
         """
         logger.info(f"get_embedding called with text: {text}")
-        @self._retry_decorator()
-        @rate_limited_openai_call
+        model = self.settings.embedding_model
+        try:
+            if self.embedding_cache is not None:
+                cached = self.embedding_cache.get(model, text)
+                if cached is not None:
+                    return cached
+            if self.embedding_batching:
+                vector = self.embedding_batcher.embed(text)
+            else:
+                vector = self._fetch_embeddings([text], model)[0]
+            if self.embedding_cache is not None:
+                self.embedding_cache.put(model, text, vector)
+            return vector
+        except RateLimitException as e:
+            logger.error(str(e))
+            raise
+        except Exception as e:
+            logger.error(f"Error getting embedding: {str(e)}")
+            raise
+
+    def _cache_lookup(self, texts: List[str], model: str):
+        """Return cached vectors (None for misses) and one text per distinct cache key that missed."""
+        if self.embedding_cache is None:
+            return [None] * len(texts), list(dict.fromkeys(texts))
+        cached = self.embedding_cache.get_many(model, texts)
+        misses: Dict[str, str] = {}
+        for text, vector in zip(texts, cached):
+            if vector is None:
+                misses.setdefault(normalize_text(text), text)
+        return cached, list(misses.values())
+
+    def _cache_fill(self, texts: List[str], model: str, cached, misses: List[str], fetched) -> List[List[float]]:
+        if self.embedding_cache is None:
+            by_text = dict(zip(misses, fetched))
+            return [by_text[t] for t in texts]
+        if misses:
+            self.embedding_cache.put_many(model, misses, fetched)
+        by_key = {normalize_text(t): v for t, v in zip(misses, fetched)}
+        return [v if v is not None else by_key[normalize_text(t)] for t, v in zip(texts, cached)]
+
+    def get_embeddings(self, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        """
+        Get embeddings for a list of texts; only cache misses are sent, in a single request.
+
+        Args:
+            texts: Texts to get embeddings for
+            model: Optional embedding model override
+
+        Returns:
+            One list of embedding floats per input text, in input order
+        """
+        if not texts:
+            return []
+        model = model or self.settings.embedding_model
+        try:
+            cached, misses = self._cache_lookup(texts, model)
+            fetched = self._fetch_embeddings(misses, model) if misses else []
+            return self._cache_fill(texts, model, cached, misses, fetched)
+        except RateLimitException as e:
+            logger.error(str(e))
+            raise
+        except Exception as e:
+            logger.error(f"Error getting embeddings: {str(e)}")
+            raise
+
+    def _fetch_embeddings(self, texts: List[str], model: str) -> List[List[float]]:
+        """Send one upstream embeddings request for *texts* (no cache)."""
+        @self.retry_policy
         def _do_request():
-            # Estimate tokens needed (roughly 4 chars per token)
-            tokens_needed = max(1, len(text) // 4)
+            tokens_needed = sum(self.token_counter.count_many(texts, model))
             self._enforce_rate_limit(tokens_needed)
-            if self.use_openrouter:
-                url = f"{self.openrouter_base_url}/embeddings"
-                headers = {
-                    "Authorization": f"Bearer {self.openrouter_api_key}",
-                    "Content-Type": "application/json"
-                }
-                payload = {
-                    "model": self.settings.embedding_model,
-                    "input": text
-                }
-                with httpx.Client() as client:
-                    response = client.post(url, headers=headers, json=payload)
-                    response.raise_for_status()
-                    data = response.json()
-                return data["data"][0]["embedding"]
-            else:
-                response = self.client.embeddings.create(
-                    model=self.settings.embedding_model,
-                    input=text
-                )
-                # Track actual tokens used if available
-                tokens_used = getattr(response, 'usage', None)
-                if tokens_used and hasattr(tokens_used, 'total_tokens'):
-                    self._enforce_rate_limit(tokens_used.total_tokens)
-                return response.data[0].embedding
+            result = self.backend.embed(texts, model)
+            # Correct the estimate with actual tokens used if available
+            self._reconcile_tokens(tokens_needed, result["usage"]["total_tokens"])
+            self.token_counter.observe(texts, result["usage"]["total_tokens"])
+            return result["embeddings"]
+        return _do_request()
+
+    async def aget_embedding(self, text: str) -> List[float]:
+        """
+        Async variant of get_embedding; cached vectors skip the API and concurrent
+        misses are coalesced into batches.
+
+        Args:
+            text: Text to get embeddings for
+
+        Returns:
+            List of embedding floats
+        """
+        model = self.settings.embedding_model
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get(model, text)
+            if cached is not None:
+                return cached
+        if self.embedding_batching:
+            vector = await self.async_embedding_batcher.embed(text)
+        else:
+            vector = (await self._afetch_embeddings([text], model))[0]
+        if self.embedding_cache is not None:
+            self.embedding_cache.put(model, text, vector)
+        return vector
+
+    async def aget_embeddings(self, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        """
+        Get embeddings for a list of texts; only cache misses are sent, in a single async request.
+
+        Args:
+            texts: Texts to get embeddings for
+            model: Optional embedding model override
+
+        Returns:
+            One list of embedding floats per input text, in input order
+        """
+        if not texts:
+            return []
+        model = model or self.settings.embedding_model
         try:
-            result = _do_request()
-            return result
+            cached, misses = self._cache_lookup(texts, model)
+            fetched = await self._afetch_embeddings(misses, model) if misses else []
+            return self._cache_fill(texts, model, cached, misses, fetched)
         except RateLimitException as e:
             logger.error(str(e))
             raise
         except Exception as e:
-            logger.error(f"Error getting embedding: {str(e)}")
+            logger.error(f"Error getting embeddings: {str(e)}")
             raise
 
-    def analyze_sentiment(self, text):
-        """Analyze sentiment of the given text using OpenAI API. Returns 'positive', 'negative', or 'neutral'."""
+    async def _afetch_embeddings(self, texts: List[str], model: str) -> List[List[float]]:
+        """Send one async upstream embeddings request for *texts* (no cache)."""
+        @self.retry_policy
+        async def _do_request():
+            tokens_needed = sum(self.token_counter.count_many(texts, model))
+            await self._aenforce_rate_limit(tokens_needed)
+            result = await self.backend.aembed(texts, model)
+            # Correct the estimate with actual tokens used if available
+            self._reconcile_tokens(tokens_needed, result["usage"]["total_tokens"])
+            self.token_counter.observe(texts, result["usage"]["total_tokens"])
+            return result["embeddings"]
+        return await _do_request()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Runtime metrics of the service's request-shaping layers."""
+        calls = self._singleflight.calls + self._async_singleflight.calls
+        shared = self._singleflight.shared + self._async_singleflight.shared
+        metrics = {
+            "singleflight": {
+                "calls": calls,
+                "shared": shared,
+                "upstream_calls": calls - shared,
+                "dedupe_ratio": shared / calls if calls else 0.0,
+                "sync": self._singleflight.stats(),
+                "async": self._async_singleflight.stats()
+            },
+            "embedding_batching": {
+                "sync": self._embedding_batcher.stats() if self._embedding_batcher else None,
+                "async": self._async_embedding_batcher.stats() if self._async_embedding_batcher else None
+            },
+            "embedding_cache": self.embedding_cache.stats() if self.embedding_cache else None,
+            "completion_cache": self._completion_cache.stats() if self._completion_cache else None,
+            "retries": self.retry_policy.stats(),
+            "routing": self.backend.stats() if isinstance(self.backend, BackendRouter) else None,
+            "model_routing": self.model_router.stats(),
+            "token_counter": self.token_counter.stats(),
+            "prompt_cache": self._prompt_cache_metrics(),
+            "sentiment": {
+                "local_mode": self.sentiment_local_mode,
+                "local_hits": self.sentiment_local_hits,
+                "escalations": self.sentiment_escalations
+            }
+        }
+        return metrics
+
+    def analyze_sentiment(self, text, local: Optional[bool] = None):
+        """
+        Analyze sentiment of the given text. Returns 'positive', 'negative', or 'neutral'.
+
+        With a local mode configured (SENTIMENT_LOCAL_MODE) confident texts are
+        classified locally and only the rest go to the OpenAI API; *local*
+        overrides that setting for this call.
+        """
+        if self._use_local_sentiment(local):
+            label = self._local_sentiment([text])[0]
+            if label is not None:
+                return label
+        return self._llm_sentiment(text)
+
+    async def aanalyze_sentiment(self, text, local: Optional[bool] = None):
+        """Async variant of analyze_sentiment. Returns 'positive', 'negative', or 'neutral'."""
+        if self._use_local_sentiment(local):
+            label = (await self._alocal_sentiment([text]))[0]
+            if label is not None:
+                return label
+        return await self._allm_sentiment(text)
+
+    def _llm_sentiment(self, text):
+        try:
+            response = self.create_completion(
+                messages=self._sentiment_messages(text), max_tokens=1, temperature=0,
+                agent_type="sentiment", response_format="label"
+            )
+            return self._parse_sentiment_label(response)
+        except Exception as e:
+            logger.error(f"Sentiment analysis failed: {e}")
+            return "neutral"
+
+    async def _allm_sentiment(self, text):
+        try:
+            response = await self.acreate_completion(
+                messages=self._sentiment_messages(text), max_tokens=1, temperature=0,
+                agent_type="sentiment", response_format="label"
+            )
+            return self._parse_sentiment_label(response)
+        except Exception as e:
+            logger.error(f"Sentiment analysis failed: {e}")
+            return "neutral"
+
+    def _use_local_sentiment(self, local: Optional[bool]) -> bool:
+        if local is not None:
+            return local
+        return self.sentiment_local_mode in ("lexicon", "embedding")
+
+    def _count_local_sentiment(self, labels: List[Optional[str]]) -> List[Optional[str]]:
+        hits = sum(1 for label in labels if label is not None)
+        self.sentiment_local_hits += hits
+        self.sentiment_escalations += len(labels) - hits
+        return labels
+
+    def _local_sentiment(self, texts: List[str]) -> List[Optional[str]]:
+        """Local labels for confident texts, None for texts that need the LLM."""
+        classifier = self.sentiment_classifier
+        embeddings = None
+        if classifier.uses_embeddings:
+            try:
+                embeddings = self.get_embeddings(texts)
+            except Exception as e:
+                logger.warning(f"Embedding sentiment unavailable, using the lexicon: {e}")
+        return self._count_local_sentiment(classifier.classify(texts, embeddings))
+
+    async def _alocal_sentiment(self, texts: List[str]) -> List[Optional[str]]:
+        classifier = self.sentiment_classifier
+        embeddings = None
+        if classifier.uses_embeddings:
+            try:
+                embeddings = await self.aget_embeddings(texts)
+            except Exception as e:
+                logger.warning(f"Embedding sentiment unavailable, using the lexicon: {e}")
+        return self._count_local_sentiment(classifier.classify(texts, embeddings))
+
+    @staticmethod
+    def _sentiment_messages(text: str) -> list[Dict[str, str]]:
         prompt = (
             "Classify the sentiment of the following text as strictly one of: positive, negative, or neutral. "
             "Respond with only the single word label.\n\nText: " + text
         )
+        return [{"role": "user", "content": prompt}]
+
+    @staticmethod
+    def _parse_sentiment_label(response) -> str:
+        label = response["content"].strip().lower() if isinstance(response, dict) and "content" in response else str(response).strip().lower()
+        if label in ("positive", "negative", "neutral"):
+            return label
+        return "neutral"
+
+    @staticmethod
+    def _sentiment_batch_messages(texts: List[str]) -> list[Dict[str, str]]:
+        numbered = "\n".join(f"{i}. {' '.join(text.split())}" for i, text in enumerate(texts, 1))
+        prompt = (
+            "Classify the sentiment of each numbered text below as strictly one of: positive, negative, or neutral. "
+            f"Respond with exactly {len(texts)} lines in the form '<number>: <label>' and nothing else.\n\n"
+            "Texts:\n" + numbered
+        )
+        return [{"role": "user", "content": prompt}]
+
+    @staticmethod
+    def _parse_sentiment_batch(content: str, count: int) -> Optional[List[str]]:
+        """Parse numbered labels; returns None unless every item 1..count got a valid label."""
+        labels: Dict[int, str] = {}
+        unnumbered: List[str] = []
+        for line in (content or "").splitlines():
+            match = _NUMBERED_LABEL_RE.match(line)
+            if match:
+                labels.setdefault(int(match.group(1)), match.group(2).lower())
+                continue
+            match = _BARE_LABEL_RE.match(line)
+            if match:
+                unnumbered.append(match.group(1).lower())
+        if all(i in labels for i in range(1, count + 1)):
+            return [labels[i] for i in range(1, count + 1)]
+        # Some models drop the numbers; accept that only if the line count matches exactly
+        if not labels and len(unnumbered) == count:
+            return unnumbered
+        return None
+
+    def _sentiment_batches(self, texts: List[str], batch_size: int) -> List[List[str]]:
+        """Pack texts into batches bounded by item count and an estimated prompt size."""
+        batches: List[List[str]] = []
+        current: List[str] = []
+        tokens = 0
+        for text, text_tokens in zip(texts, self.token_counter.count_many(texts)):
+            if current and (len(current) >= batch_size or tokens + text_tokens > SENTIMENT_BATCH_MAX_TOKENS):
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(text)
+            tokens += text_tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _classify_sentiment_batch(self, texts: List[str]) -> List[str]:
+        """Classify one batch; re-split it in halves while the reply cannot be parsed."""
+        if len(texts) == 1:
+            return [self._llm_sentiment(texts[0])]
         try:
-            response = self.create_completion(messages=[{"role": "user", "content": prompt}], max_tokens=1, temperature=0)
-            label = response["content"].strip().lower() if isinstance(response, dict) and "content" in response else str(response).strip().lower()
-            if label in ("positive", "negative", "neutral"):
-                return label
-            return "neutral"
+            response = self.create_completion(
+                messages=self._sentiment_batch_messages(texts),
+                max_tokens=8 * len(texts) + 16,
+                temperature=0,
+                agent_type="sentiment"
+            )
+            labels = self._parse_sentiment_batch(response["content"], len(texts))
         except Exception as e:
-            print(f"Sentiment analysis failed: {e}")
-            return "neutral"
+            logger.error(f"Batch sentiment analysis failed for {len(texts)} texts: {e}")
+            return ["neutral"] * len(texts)
+        if labels is not None:
+            return labels
+        logger.warning(f"Could not parse batch sentiment reply for {len(texts)} texts; re-splitting")
+        middle = len(texts) // 2
+        return self._classify_sentiment_batch(texts[:middle]) + self._classify_sentiment_batch(texts[middle:])
+
+    async def _aclassify_sentiment_batch(self, texts: List[str]) -> List[str]:
+        """Async variant of _classify_sentiment_batch."""
+        if len(texts) == 1:
+            return [await self._allm_sentiment(texts[0])]
+        try:
+            response = await self.acreate_completion(
+                messages=self._sentiment_batch_messages(texts),
+                max_tokens=8 * len(texts) + 16,
+                temperature=0,
+                agent_type="sentiment"
+            )
+            labels = self._parse_sentiment_batch(response["content"], len(texts))
+        except Exception as e:
+            logger.error(f"Batch sentiment analysis failed for {len(texts)} texts: {e}")
+            return ["neutral"] * len(texts)
+        if labels is not None:
+            return labels
+        logger.warning(f"Could not parse batch sentiment reply for {len(texts)} texts; re-splitting")
+        middle = len(texts) // 2
+        halves = await asyncio.gather(
+            self._aclassify_sentiment_batch(texts[:middle]),
+            self._aclassify_sentiment_batch(texts[middle:])
+        )
+        return halves[0] + halves[1]
+
+    def analyze_sentiment_batch(
+        self,
+        texts: List[str],
+        batch_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        local: Optional[bool] = None
+    ) -> List[str]:
+        """
+        Classify many texts with a few batched completions instead of one call per text.
+
+        Texts are packed into numbered prompts, batches run concurrently (within the
+        service rate limits), and batches whose reply cannot be parsed are re-split.
+        With a local mode configured, only texts the local classifier is unsure
+        about are sent to the LLM.
+
+        Args:
+            texts: Texts to classify
+            batch_size: Maximum texts per prompt (default SENTIMENT_BATCH_SIZE)
+            max_concurrency: Maximum batches in flight (default SENTIMENT_BATCH_CONCURRENCY)
+            local: Use the local classifier first (default: SENTIMENT_LOCAL_MODE is not off)
+
+        Returns:
+            One of 'positive', 'negative' or 'neutral' per input text, in input order
+        """
+        unique = [t for t in dict.fromkeys(texts) if t and t.strip()]
+        labels: Dict[str, str] = {}
+        if unique and self._use_local_sentiment(local):
+            for text, label in zip(unique, self._local_sentiment(unique)):
+                if label is not None:
+                    labels[text] = label
+            unique = [t for t in unique if t not in labels]
+        batches = self._sentiment_batches(unique, batch_size or self.settings.SENTIMENT_BATCH_SIZE)
+        workers = max(1, min(len(batches), max_concurrency or self.settings.SENTIMENT_BATCH_CONCURRENCY))
+        if batches:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sentiment-batch") as executor:
+                for batch, batch_labels in zip(batches, executor.map(self._classify_sentiment_batch, batches)):
+                    labels.update(zip(batch, batch_labels))
+        return [labels.get(t, "neutral") for t in texts]
+
+    async def aanalyze_sentiment_batch(
+        self,
+        texts: List[str],
+        batch_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        local: Optional[bool] = None
+    ) -> List[str]:
+        """Async variant of analyze_sentiment_batch, backed by the pooled async client."""
+        unique = [t for t in dict.fromkeys(texts) if t and t.strip()]
+        labels: Dict[str, str] = {}
+        if unique and self._use_local_sentiment(local):
+            for text, label in zip(unique, await self._alocal_sentiment(unique)):
+                if label is not None:
+                    labels[text] = label
+            unique = [t for t in unique if t not in labels]
+        batches = self._sentiment_batches(unique, batch_size or self.settings.SENTIMENT_BATCH_SIZE)
+        semaphore = asyncio.Semaphore(max_concurrency or self.settings.SENTIMENT_BATCH_CONCURRENCY)
+
+        async def _run(batch: List[str]) -> List[str]:
+            async with semaphore:
+                return await self._aclassify_sentiment_batch(batch)
+
+        results = await asyncio.gather(*[_run(batch) for batch in batches])
+        for batch, batch_labels in zip(batches, results):
+            labels.update(zip(batch, batch_labels))
+        return [labels.get(t, "neutral") for t in texts]
+
+    @staticmethod
+    def summarize_sentiment(labels: List[str]) -> Dict[str, float]:
+        """Turn labels into the {'positive', 'neutral', 'negative'} fractions used as ``sentiment_summary``."""
+        total = len(labels)
+        return {
+            label: (sum(1 for l in labels if l == label) / total if total else 0.0)
+            for label in ("positive", "neutral", "negative")
+        }
 
 # Removed module-level service initialization to prevent import-time errors 
 
 # --- Rate limit config ---
 OPENAI_RATE_LIMIT_PER_MIN = 60  # adjust to your OpenAI plan
-OPENAI_MIN_INTERVAL = 60.0 / OPENAI_RATE_LIMIT_PER_MIN
-_last_openai_call = 0
+_openai_call_limiter: Optional[TokenBucketLimiter] = None
+
+def _get_openai_call_limiter() -> TokenBucketLimiter:
+    global _openai_call_limiter
+    if _openai_call_limiter is None:
+        # Burst of 1 keeps calls evenly spaced; shared by all threads, tasks and (via the backend) workers
+        _openai_call_limiter = TokenBucketLimiter(
+            [Limit("rpm", OPENAI_RATE_LIMIT_PER_MIN, 60.0, burst=1)], backend=get_limiter_backend()
+        )
+    return _openai_call_limiter
 
 # --- Helper: Rate limit decorator for all OpenAI API calls ---
 def rate_limited_openai_call(func):
     import functools
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            await _get_openai_call_limiter().aacquire({"rpm": 1}, key="openai-helpers")
+            return await func(*args, **kwargs)
+        return async_wrapper
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        global _last_openai_call
-        import time
-        now = time.time()
-        elapsed = now - _last_openai_call
-        if elapsed < OPENAI_MIN_INTERVAL:
-            time.sleep(OPENAI_MIN_INTERVAL - elapsed)
-        _last_openai_call = time.time()
+        _get_openai_call_limiter().acquire({"rpm": 1}, key="openai-helpers")
         return func(*args, **kwargs)
     return wrapper
 
-# --- Use batching for embeddings ---
-# (get_embeddings_with_retry already batches, but clarify in comments)
-import backoff
-
-OPENAI_RETRY_EXCEPTIONS = (
-    openai.RateLimitError,
-    openai.Timeout,
-    openai.APIError,
-    openai.APIConnectionError,
+# --- Retry policy shared by the module-level helpers ---
+OPENAI_HELPER_MAX_ATTEMPTS = 5
+_helper_retry_policy = RetryPolicy(
+    max_attempts=OPENAI_HELPER_MAX_ATTEMPTS,
+    base_delay=1.0,
+    budget=RetryBudget()
 )
 
-@backoff.on_exception(
-    backoff.expo,
-    Exception,
-    max_tries=5,
-    jitter=None
-)
+@_helper_retry_policy
 @rate_limited_openai_call
+def _create_embedding(text, model, timeout):
+    return get_openai_client().embeddings.create(input=[text], model=model, timeout=timeout)
+
 def get_embedding_with_retry(text, model="text-embedding-ada-002", timeout=20):
     try:
-        client = get_openai_client()
-        response = client.embeddings.create(
-            input=[text],
-            model=model
-        )
+        response = _create_embedding(text, model, timeout)
         embedding = response.data[0].embedding
         logging.info(f"[OpenAI] Embedding created for text (len={len(text)})")
         return embedding
@@ -294,39 +1180,21 @@ def get_embedding_with_retry(text, model="text-embedding-ada-002", timeout=20):
 
 def get_openai_client():
     api_key = os.getenv("OPENAI_API_KEY")
-    return openai.OpenAI(api_key=api_key)
+    # Retries are handled by _helper_retry_policy
+    return openai.OpenAI(api_key=api_key, max_retries=0)
 
 # Correct embedding function for OpenAI v1+
 def get_embeddings_with_retry(texts, model=None):
     """
     Get embeddings for a list of texts using OpenAI, with retry and batching.
+
+    Delegates to the shared OpenAIService so the whole list goes out as one
+    request through its pooled client and rate limiter.
     """
-    from openai import OpenAIError
-    client = get_openai_client()
-    model = model or get_openai_settings().embedding_model
-    # Estimate total tokens needed for batch
-    tokens_needed = sum(max(1, len(t) // 4) for t in texts)
-    # Enforce rate limit before batch call
-    service = OpenAIService()
-    service._enforce_rate_limit(tokens_needed)
-    try:
-        response = client.embeddings.create(input=texts, model=model)
-        # Use attribute access for v1+ SDK
-        # Track actual tokens used if available
-        tokens_used = getattr(response, 'usage', None)
-        if tokens_used and hasattr(tokens_used, 'total_tokens'):
-            service._enforce_rate_limit(tokens_used.total_tokens)
-        return [item.embedding for item in response.data]
-    except OpenAIError as e:
-        logging.error(f"[OpenAI] Embedding error: {e}")
-        raise
+    from app.dependencies import get_openai_service
+    return get_openai_service().get_embeddings(list(texts), model=model)
 
-@backoff.on_exception(
-    backoff.expo,
-    Exception,
-    max_tries=5,
-    jitter=None
-)
+@_helper_retry_policy
 @rate_limited_openai_call
 def get_completion_with_retry(messages, model="gpt-3.5-turbo", timeout=30, **kwargs):
     try:
@@ -337,7 +1205,7 @@ def get_completion_with_retry(messages, model="gpt-3.5-turbo", timeout=30, **kwa
             timeout=timeout,
             **kwargs
         )
-        return response['choices'][0]['message']['content']
+        return response.choices[0].message.content
     except openai.RateLimitError as e:
         logging.warning(f"[OpenAI] Rate limit hit: {e}")
         raise
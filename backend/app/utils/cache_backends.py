@@ -0,0 +1,361 @@
+"""
+Shared (L2) backends for CacheService.
+
+Every uvicorn worker has its own in-process cache, so with N workers each one
+warms the same LLM results separately and the hit rate drops about N-fold. An
+L2 backend sits under the per-process LRU (L1) and is shared by the workers:
+
+- SQLiteCacheBackend: a SQLite file (WAL mode) shared by all workers on one host
+- RedisCacheBackend: a Redis-protocol server shared by a whole cluster
+
+Values are stored as msgpack (JSON when msgpack is not installed), zlib
+compressed above a size threshold. Only values that come back with the same
+types are accepted (see encode_value); anything else stays in L1. Writes and deletes also publish an
+invalidation message (Redis pub/sub, or a polled table in SQLite) so other
+workers drop their stale L1 copies.
+
+Select one with the CACHE_L2_BACKEND environment variable
+(``none`` | ``sqlite`` | ``redis``), see get_cache_backend().
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional
+
+try:
+    import msgpack
+except ImportError:  # optional; JSON is used instead
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+_FLAG_ZLIB = 0x01
+_FLAG_MSGPACK = 0x02
+# Stay well below SQLite's bound-parameter limit
+_SQLITE_CHUNK = 500
+# Characters with a meaning in Redis SCAN MATCH patterns
+_GLOB_SPECIAL_RE = re.compile(r"[*?\[\]\\]")
+
+
+class CacheSerializationError(Exception):
+    """Raised when a value cannot be encoded for, or decoded from, the L2 store."""
+
+
+def _check_portable(value: Any, path: str = "value") -> None:
+    """Raise CacheSerializationError unless *value* decodes back with the same types."""
+    if value is None or type(value) in (bool, int, float, str):
+        return
+    if type(value) is bytes and msgpack is not None:
+        return
+    if type(value) is list:
+        for index, item in enumerate(value):
+            _check_portable(item, f"{path}[{index}]")
+        return
+    if type(value) is dict:
+        for key, item in value.items():
+            if type(key) is not str:
+                raise CacheSerializationError(f"{path} has a non-str key {key!r}")
+            _check_portable(item, f"{path}[{key!r}]")
+        return
+    # Tuples would come back as lists, sets and objects not at all
+    raise CacheSerializationError(f"{path} is a {type(value).__name__}, which does not round-trip")
+
+
+def encode_value(value: Any, compress_min_bytes: int = 1024) -> bytes:
+    """
+    Serialize *value* for the L2 store: one flag byte, then the msgpack (or JSON) payload.
+
+    Only values that decode back with the same types are accepted: None, bool,
+    int, float, str, bytes (with msgpack), lists, and dicts with str keys,
+    nested. Anything else (tuples, sets, other dict keys, objects) raises
+    CacheSerializationError. Payloads of at least *compress_min_bytes* are
+    zlib compressed when that makes them smaller.
+    """
+    _check_portable(value)
+    try:
+        if msgpack is not None:
+            payload, flags = msgpack.packb(value, use_bin_type=True), _FLAG_MSGPACK
+        else:
+            payload, flags = json.dumps(value, separators=(",", ":")).encode("utf-8"), 0
+    except (TypeError, ValueError, OverflowError) as e:
+        raise CacheSerializationError(f"Value of type {type(value).__name__} is not serializable: {e}") from e
+    if len(payload) >= compress_min_bytes:
+        compressed = zlib.compress(payload, 6)
+        if len(compressed) < len(payload):
+            payload, flags = compressed, flags | _FLAG_ZLIB
+    return bytes([flags]) + payload
+
+
+def decode_value(data: bytes) -> Any:
+    if not data:
+        raise CacheSerializationError("Empty cache payload")
+    flags, payload = data[0], data[1:]
+    if flags & _FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    if flags & _FLAG_MSGPACK:
+        if msgpack is None:
+            raise CacheSerializationError("Payload was written with msgpack, which is not installed here")
+        return msgpack.unpackb(payload, raw=False)
+    return json.loads(payload)
+
+
+class CacheBackend:
+    """
+    Interface for shared cache storage (opaque bytes per string key) plus invalidation fan-out.
+
+    Subscribers are held weakly, so a cache that goes away stops receiving messages.
+    """
+
+    def __init__(self):
+        self._subscribers: List[weakref.WeakMethod] = []
+        self._subscribers_lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        raise NotImplementedError
+
+    def set_many(self, items: Mapping[str, bytes], ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str) -> None:
+        """Delete every entry whose key starts with *prefix*."""
+        raise NotImplementedError
+
+    def publish(self, message: str) -> None:
+        """Send an invalidation message to every subscriber, in every process."""
+        raise NotImplementedError
+
+    def _start_listener(self) -> None:
+        raise NotImplementedError
+
+    def subscribe(self, callback: Callable[[str], None]) -> None:
+        """Call the bound method *callback* with every invalidation message."""
+        with self._subscribers_lock:
+            self._subscribers.append(weakref.WeakMethod(callback))
+        self._start_listener()
+
+    def _dispatch(self, message: str) -> None:
+        with self._subscribers_lock:
+            self._subscribers = [ref for ref in self._subscribers if ref() is not None]
+            callbacks = [ref() for ref in self._subscribers]
+        for callback in callbacks:
+            if callback is None:
+                continue
+            try:
+                callback(message)
+            except Exception as e:
+                logger.warning(f"[CacheBackend] Invalidation handler failed: {e}")
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    SQLite file shared by all workers on a host.
+
+    Invalidations go to a table that each process polls every *poll_interval*
+    seconds; rows older than a minute are pruned.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.5):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " expires_at REAL"
+            ") WITHOUT ROWID"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache_invalidations ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " message TEXT NOT NULL,"
+            " created_at REAL NOT NULL"
+            ")"
+        )
+        self._writes = 0
+        self._listener: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(keys)
+        now = time.time()
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQLITE_CHUNK):
+                chunk = keys[start:start + _SQLITE_CHUNK]
+                rows = self._db.execute(
+                    f"SELECT key, value FROM cache_entries WHERE key IN ({','.join('?' * len(chunk))})"
+                    " AND (expires_at IS NULL OR expires_at > ?)",
+                    (*chunk, now),
+                ).fetchall()
+                found.update((key, bytes(value)) for key, value in rows)
+        return found
+
+    def set_many(self, items: Mapping[str, bytes], ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, value, expires_at) for key, value in items.items()],
+            )
+            self._writes += 1
+            if self._writes % 256 == 0:
+                self._db.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        with self._lock:
+            for start in range(0, len(keys), _SQLITE_CHUNK):
+                chunk = keys[start:start + _SQLITE_CHUNK]
+                self._db.execute(f"DELETE FROM cache_entries WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM cache_entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def publish(self, message: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO cache_invalidations (message, created_at) VALUES (?, ?)", (message, now)
+            )
+            self._db.execute("DELETE FROM cache_invalidations WHERE created_at < ?", (now - 60.0,))
+
+    def _start_listener(self) -> None:
+        with self._lock:
+            if self._listener is not None:
+                return
+            row = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM cache_invalidations").fetchone()
+            self._listener = threading.Thread(
+                target=self._poll, args=(row[0],), name="cache-l2-invalidations", daemon=True
+            )
+            self._listener.start()
+
+    def _poll(self, last_id: int) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                with self._lock:
+                    rows = self._db.execute(
+                        "SELECT id, message FROM cache_invalidations WHERE id > ? ORDER BY id", (last_id,)
+                    ).fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"[SQLiteCacheBackend] Polling invalidations failed: {e}")
+                continue
+            for row_id, message in rows:
+                last_id = row_id
+                self._dispatch(message)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM cache_entries")
+
+    def close(self) -> None:
+        self._stop.set()
+        with self._lock:
+            self._db.close()
+
+
+class RedisCacheBackend(CacheBackend):
+    """Redis-protocol store shared by a cluster; invalidations use pub/sub."""
+
+    def __init__(self, client, prefix: str = "cache:"):
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        self.channel = f"{prefix}invalidate"
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.mget([self.prefix + key for key in keys])
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, items: Mapping[str, bytes], ttl: Optional[float] = None) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(self.prefix + key, value, px=max(1, int(ttl * 1000)) if ttl else None)
+        pipe.execute()
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        keys = [self.prefix + key for key in keys]
+        if keys:
+            self.client.delete(*keys)
+
+    def delete_prefix(self, prefix: str) -> None:
+        pattern = _GLOB_SPECIAL_RE.sub(r"\\\g<0>", self.prefix + prefix) + "*"
+        batch: List[bytes] = []
+        for key in self.client.scan_iter(match=pattern, count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+
+    def publish(self, message: str) -> None:
+        self.client.publish(self.channel, message)
+
+    def _start_listener(self) -> None:
+        with self._listener_lock:
+            if self._listener is not None:
+                return
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+
+            def handle(message) -> None:
+                data = message["data"]
+                self._dispatch(data.decode("utf-8") if isinstance(data, bytes) else data)
+
+            pubsub.subscribe(**{self.channel: handle})
+            self._listener = pubsub.run_in_thread(sleep_time=0.1, daemon=True)
+
+    def clear(self) -> None:
+        self.delete_prefix("")
+
+    def close(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+
+@lru_cache()
+def get_cache_backend() -> Optional[CacheBackend]:
+    """
+    Get the process-wide L2 cache backend selected by environment variables (None when disabled).
+
+    CACHE_L2_BACKEND: ``none`` (default), ``sqlite`` or ``redis``
+    CACHE_L2_PATH: SQLite file for the sqlite backend (default: <tmp>/bellatry-cache.sqlite3)
+    CACHE_L2_REDIS_URL: URL for the redis backend (falls back to REDIS_URL)
+    """
+    kind = os.getenv("CACHE_L2_BACKEND", "none").lower()
+    if kind in ("", "none"):
+        return None
+    if kind == "sqlite":
+        path = os.getenv("CACHE_L2_PATH", os.path.join(tempfile.gettempdir(), "bellatry-cache.sqlite3"))
+        return SQLiteCacheBackend(path)
+    if kind == "redis":
+        from app.utils.redis_client import get_redis_client
+        url = os.getenv("CACHE_L2_REDIS_URL") or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        return RedisCacheBackend(get_redis_client(url))
+    raise ValueError(f"Unknown CACHE_L2_BACKEND: {kind!r} (expected none, sqlite or redis)")
@@ -1,27 +1,581 @@
 """
-Simple in-memory cache service for /ai/analyze and other use cases.
-See: PLANNING.md Phase 4. Replace with Redis or distributed cache for production.
+In-memory cache service for /ai/analyze and other use cases.
+See: PLANNING.md Phase 4.
+
+Bounded and sharded: keys hash to one of ``shards`` independent LRU shards,
+each with its own lock, so concurrent callers rarely contend. Every shard
+holds at most its share of ``max_entries`` and ``max_bytes`` and evicts the
+least recently used entries beyond that. Expired entries are dropped when
+read and, in the background, by a reaper thread that sweeps one shard per
+tick (every shard once per ``reap_interval``), so keys that are never read
+again do not pile up and no sweep holds up more than one shard's callers.
+
+``get_or_compute`` is the async read-through API for expensive values (LLM
+results). Concurrent misses for one key share a single computation; after
+``ttl`` an entry turns stale and, for ``stale_ttl`` more seconds, is still
+served while one background task refreshes it. Entries can also refresh
+early with probability rising towards expiry (XFetch), which spreads the
+refreshes of popular keys out instead of letting them expire together.
+
+With an ``l2`` backend (see app.utils.cache_backends) the LRU becomes the L1
+of a two-tier cache: L1 misses read through to the shared store, writes go
+to both, and writes/deletes are broadcast so other workers drop their L1
+copies. Only keys built from plain data (str, int, float, bool, bytes, None
+and tuples of those) go to L2; any other key, e.g. one holding an object,
+stays L1-only, because its identity cannot be carried to another process.
+Likewise only values that decode back with the same types (see
+``encode_value``) are written to L2. In ``get_or_compute`` the L2 round-trips
+run in the default executor, so they never block the event loop.
 """
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import math
+import random
+import sys
+import threading
 import time
-from threading import Lock
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Mapping, Optional, Union
+
+from app.utils.cache_backends import CacheBackend, decode_value, encode_value
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry bookkeeping cost (key, _Entry, OrderedDict node)
+_ENTRY_OVERHEAD_BYTES = 120
+_MISSING = object()
+# Key types whose repr identifies them and is the same in every process
+_PLAIN_KEY_TYPES = (str, int, float, bool, bytes, type(None))
+
+
+def _is_plain_key(key: Hashable) -> bool:
+    if type(key) is tuple:
+        return all(_is_plain_key(item) for item in key)
+    return type(key) in _PLAIN_KEY_TYPES
+
+
+def approx_size(value: Any, _depth: int = 0) -> int:
+    """Approximate memory footprint of *value* in bytes (containers are followed three levels deep)."""
+    size = sys.getsizeof(value)
+    if _depth >= 3:
+        return size
+    if isinstance(value, dict):
+        size += sum(approx_size(k, _depth + 1) + approx_size(v, _depth + 1) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item, _depth + 1) for item in value)
+    return size
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "size", "fresh_until", "delta")
+
+    def __init__(
+        self,
+        value: Any,
+        expires_at: Optional[float],
+        size: int,
+        fresh_until: Optional[float] = None,
+        delta: float = 0.0
+    ):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+        # get_or_compute entries: served as fresh until fresh_until, stale until expires_at;
+        # delta is how long the value took to compute (scales early refresh)
+        self.fresh_until = fresh_until if fresh_until is not None else expires_at
+        self.delta = delta
+
+
+class _Shard:
+    __slots__ = ("lock", "entries", "bytes", "hits", "misses", "evictions", "expirations")
 
-class CacheService:
     def __init__(self):
-        self._store = {}
-        self._lock = Lock()
-
-    def get(self, key):
-        with self._lock:
-            entry = self._store.get(key)
-            if not entry:
-                return None
-            value, expiry = entry
-            if expiry is not None and time.time() > expiry:
-                del self._store[key]
-                return None
-            return value
-
-    def set(self, key, value, ttl=None):
-        expiry = time.time() + ttl if ttl else None
-        with self._lock:
-            self._store[key] = (value, expiry) 
\ No newline at end of file
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def remove(self, key: Hashable) -> None:
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+
+
+class CacheService:
+    """
+    Sharded, bounded LRU cache with per-entry TTL.
+
+    Args:
+        max_entries: Entry limit across all shards
+        max_bytes: Approximate memory limit across all shards
+        shards: Number of independently locked shards
+        default_ttl: TTL in seconds for entries set without one (None = no expiry)
+        reap_interval: Seconds in which the background reaper sweeps every shard once (None disables it)
+        sizeof: Estimates an entry's value size in bytes (default approx_size)
+        l2: Shared backend under this cache (None keeps it in-process only)
+        namespace: Prefix of this cache's keys in the L2 store
+        compress_min_bytes: L2 payloads from this size on are zlib compressed
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        shards: int = 16,
+        default_ttl: Optional[float] = None,
+        reap_interval: Optional[float] = 30.0,
+        sizeof: Callable[[Any], int] = approx_size,
+        l2: Optional[CacheBackend] = None,
+        namespace: str = "",
+        compress_min_bytes: int = 1024
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.reap_interval = reap_interval
+        self._sizeof = sizeof
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._shard_max_entries = max(1, -(-max_entries // len(self._shards)))
+        self._shard_max_bytes = max(1, max_bytes // len(self._shards))
+        self._reaper: Optional[threading.Thread] = None
+        self._reaper_lock = threading.Lock()
+        self._next_reap = 0
+        self._stop = threading.Event()
+        # get_or_compute: key -> task computing it (on the loop that started it)
+        self._inflight: Dict[Hashable, "asyncio.Task"] = {}
+        self.computes = 0
+        self.coalesced = 0
+        self.stale_served = 0
+        self.early_refreshes = 0
+        self.refresh_failures = 0
+        self.l2 = l2
+        self.namespace = namespace
+        self.compress_min_bytes = compress_min_bytes
+        self._origin = uuid.uuid4().hex
+        self.l2_hits = 0
+        self.l2_errors = 0
+        self.invalidations = 0
+        if l2 is not None:
+            l2.subscribe(self._on_invalidate)
+
+    def _shard(self, key: Hashable) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _expires_at(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = ttl if ttl else self.default_ttl
+        return time.time() + ttl if ttl else None
+
+    def _ensure_reaper(self) -> None:
+        if self.reap_interval is None or self._reaper is not None:
+            return
+        with self._reaper_lock:
+            if self._reaper is None:
+                # The thread holds only a weak reference, so an unused cache can still be collected
+                self._reaper = threading.Thread(
+                    target=_reap_loop,
+                    args=(weakref.ref(self), self._stop, self.reap_interval / len(self._shards)),
+                    name="cache-reaper", daemon=True
+                )
+                self._reaper.start()
+
+    def _lookup_entry(self, shard: _Shard, key: Hashable, now: float) -> Optional[_Entry]:
+        # Caller holds shard.lock
+        entry = shard.entries.get(key)
+        if entry is None:
+            shard.misses += 1
+            return None
+        if entry.expires_at is not None and now > entry.expires_at:
+            shard.remove(key)
+            shard.expirations += 1
+            shard.misses += 1
+            return None
+        shard.entries.move_to_end(key)
+        shard.hits += 1
+        return entry
+
+    def _store(self, shard: _Shard, key: Hashable, entry: _Entry) -> None:
+        # Caller holds shard.lock
+        if key in shard.entries:
+            shard.remove(key)
+        shard.entries[key] = entry
+        shard.bytes += entry.size
+        while len(shard.entries) > self._shard_max_entries or (
+            shard.bytes > self._shard_max_bytes and len(shard.entries) > 1
+        ):
+            _, evicted = shard.entries.popitem(last=False)
+            shard.bytes -= evicted.size
+            shard.evictions += 1
+
+    def _key(self, key: Hashable) -> Hashable:
+        """Storage key: with an L2, a process-independent string for plain-data keys; others stay L1-only."""
+        if self.l2 is None or not _is_plain_key(key):
+            return key
+        if type(key) is str:
+            return self.namespace + key
+        return self.namespace + hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    def _l2_eligible(self, skey: Hashable) -> bool:
+        return self.l2 is not None and isinstance(skey, str)
+
+    @staticmethod
+    async def _off_loop(fn: Callable[..., Any], *args: Any) -> Any:
+        # Redis round-trips and SQLite writes (busy timeout of seconds) must not stall the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    def _l2_failed(self, operation: str, exc: Exception) -> None:
+        # The shared tier is an optimization; its failures never fail the caller
+        self.l2_errors += 1
+        logger.warning(f"[CacheService] L2 {operation} failed: {exc}")
+
+    def _l2_load(self, skeys: Iterable[Hashable], now: float) -> Dict[str, _Entry]:
+        """Read L1 misses from L2 and copy what is found into L1."""
+        keys = [skey for skey in skeys if isinstance(skey, str)]
+        if self.l2 is None or not keys:
+            return {}
+        try:
+            raw = self.l2.get_many(keys)
+        except Exception as e:
+            self._l2_failed("read", e)
+            return {}
+        found: Dict[str, _Entry] = {}
+        for skey, data in raw.items():
+            try:
+                value, expires_at, fresh_until, delta = decode_value(data)
+            except Exception as e:
+                logger.debug(f"[CacheService] Ignoring undecodable L2 entry {skey}: {e}")
+                continue
+            if expires_at is not None and now > expires_at:
+                continue
+            entry = _Entry(value, expires_at, self._sizeof(value) + _ENTRY_OVERHEAD_BYTES, fresh_until, delta)
+            shard = self._shard(skey)
+            with shard.lock:
+                self._store(shard, skey, entry)
+            found[skey] = entry
+        self.l2_hits += len(found)
+        return found
+
+    def _l2_store(self, entries: Mapping[Hashable, _Entry], expires_at: Optional[float]) -> None:
+        """Write *entries* (sharing one expiry) to L2 and tell other workers to drop their L1 copies."""
+        if self.l2 is None:
+            return
+        payloads: Dict[str, bytes] = {}
+        for skey, entry in entries.items():
+            if not isinstance(skey, str):
+                continue
+            try:
+                payloads[skey] = encode_value(
+                    [entry.value, entry.expires_at, entry.fresh_until, entry.delta], self.compress_min_bytes
+                )
+            except Exception as e:
+                logger.debug(f"[CacheService] Not storing {skey} in L2: {e}")
+        if not payloads:
+            return
+        ttl = max(0.001, expires_at - time.time()) if expires_at is not None else None
+        try:
+            self.l2.set_many(payloads, ttl)
+            self._publish(list(payloads))
+        except Exception as e:
+            self._l2_failed("write", e)
+
+    def _publish(self, skeys: List[str], namespace: Optional[str] = None) -> None:
+        message = [self._origin, skeys] if namespace is None else [self._origin, skeys, namespace]
+        self.l2.publish(json.dumps(message))
+
+    def _on_invalidate(self, message: str) -> None:
+        origin, skeys, *cleared = json.loads(message)
+        if origin == self._origin:
+            return
+        if cleared and cleared[0] == self.namespace:
+            self.invalidations += self._l1_clear()
+            return
+        for skey in skeys:
+            if self._l1_delete(skey):
+                self.invalidations += 1
+
+    def _l1_delete(self, skey: Hashable) -> bool:
+        shard = self._shard(skey)
+        with shard.lock:
+            if skey not in shard.entries:
+                return False
+            shard.remove(skey)
+            return True
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        skey = self._key(key)
+        now = time.time()
+        shard = self._shard(skey)
+        with shard.lock:
+            entry = self._lookup_entry(shard, skey, now)
+        if entry is None:
+            entry = self._l2_load([skey], now).get(skey)
+        return default if entry is None else entry.value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        skey = self._key(key)
+        entry = _Entry(value, self._expires_at(ttl), self._sizeof(value) + _ENTRY_OVERHEAD_BYTES)
+        shard = self._shard(skey)
+        with shard.lock:
+            self._store(shard, skey, entry)
+        self._l2_store({skey: entry}, entry.expires_at)
+        self._ensure_reaper()
+
+    def delete(self, key: Hashable) -> bool:
+        """Remove *key* here, from L2 and from other workers' L1; returns whether it was in L1."""
+        skey = self._key(key)
+        removed = self._l1_delete(skey)
+        if self.l2 is not None and isinstance(skey, str):
+            try:
+                self.l2.delete_many([skey])
+                self._publish([skey])
+            except Exception as e:
+                self._l2_failed("delete", e)
+        return removed
+
+    def _group(self, keys: Iterable[Hashable]) -> Dict[int, List[Hashable]]:
+        groups: Dict[int, List[Hashable]] = {}
+        for key in keys:
+            groups.setdefault(hash(key) % len(self._shards), []).append(key)
+        return groups
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """Values of the keys that are cached (missing and expired keys are left out), one lock per shard."""
+        now = time.time()
+        skeys = {self._key(key): key for key in keys}
+        found: Dict[Hashable, Any] = {}
+        missing: List[Hashable] = []
+        for index, shard_keys in self._group(skeys).items():
+            shard = self._shards[index]
+            with shard.lock:
+                for skey in shard_keys:
+                    entry = self._lookup_entry(shard, skey, now)
+                    if entry is None:
+                        missing.append(skey)
+                    else:
+                        found[skeys[skey]] = entry.value
+        for skey, entry in self._l2_load(missing, now).items():
+            found[skeys[skey]] = entry.value
+        return found
+
+    def set_many(self, items: Mapping[Hashable, Any], ttl: Optional[float] = None) -> None:
+        expires_at = self._expires_at(ttl)
+        entries = {
+            self._key(key): _Entry(value, expires_at, self._sizeof(value) + _ENTRY_OVERHEAD_BYTES)
+            for key, value in items.items()
+        }
+        for index, shard_keys in self._group(entries).items():
+            shard = self._shards[index]
+            with shard.lock:
+                for skey in shard_keys:
+                    self._store(shard, skey, entries[skey])
+        self._l2_store(entries, expires_at)
+        self._ensure_reaper()
+
+    async def get_or_compute(
+        self,
+        key: Hashable,
+        fn: Callable[[], Union[Awaitable[Any], Any]],
+        ttl: Optional[float] = None,
+        stale_ttl: float = 0.0,
+        early_refresh_beta: float = 1.0
+    ) -> Any:
+        """
+        Cached value of *key*, computing it with *fn* on a miss.
+
+        Args:
+            key: Cache key
+            fn: Zero-argument callable returning the value or an awaitable of it
+            ttl: Seconds the value is fresh (default: default_ttl)
+            stale_ttl: Seconds after that the stale value is still served while it refreshes in the background
+            early_refresh_beta: XFetch aggressiveness; 0 disables probabilistic early refresh
+
+        Concurrent callers missing the same key await one shared computation;
+        its exception, if any, reaches all of them and nothing is cached.
+        """
+        key = self._key(key)
+        now = time.time()
+        shard = self._shard(key)
+        with shard.lock:
+            entry = self._lookup_entry(shard, key, now)
+        if entry is None and self._l2_eligible(key):
+            entry = (await self._off_loop(self._l2_load, [key], now)).get(key)
+        if entry is None:
+            return await self._compute(key, fn, ttl, stale_ttl)
+        if entry.fresh_until is not None and now >= entry.fresh_until:
+            self.stale_served += 1
+            self._refresh(key, fn, ttl, stale_ttl)
+        elif entry.fresh_until is not None and early_refresh_beta > 0 and entry.delta > 0:
+            # XFetch: refresh early with probability rising as expiry approaches
+            if now - entry.delta * early_refresh_beta * math.log(1.0 - random.random()) >= entry.fresh_until:
+                if self._refresh(key, fn, ttl, stale_ttl):
+                    self.early_refreshes += 1
+        return entry.value
+
+    def _inflight_task(self, key: Hashable) -> Optional["asyncio.Task"]:
+        task = self._inflight.get(key)
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            return task
+        return None
+
+    def _start_compute(self, key, fn, ttl, stale_ttl) -> "asyncio.Task":
+        task = asyncio.get_running_loop().create_task(self._run_compute(key, fn, ttl, stale_ttl))
+        self._inflight[key] = task
+
+        def _done(finished: "asyncio.Task") -> None:
+            if self._inflight.get(key) is finished:
+                del self._inflight[key]
+
+        task.add_done_callback(_done)
+        return task
+
+    async def _compute(self, key, fn, ttl, stale_ttl) -> Any:
+        task = self._inflight_task(key)
+        if task is None:
+            task = self._start_compute(key, fn, ttl, stale_ttl)
+        else:
+            self.coalesced += 1
+        # A cancelled caller must not cancel the computation other callers await
+        return await asyncio.shield(task)
+
+    def _refresh(self, key, fn, ttl, stale_ttl) -> bool:
+        """Start a background refresh of *key* unless one is already running."""
+        if self._inflight_task(key) is not None:
+            return False
+        task = self._start_compute(key, fn, ttl, stale_ttl)
+
+        def _log_failure(finished: "asyncio.Task") -> None:
+            if not finished.cancelled() and finished.exception() is not None:
+                self.refresh_failures += 1
+                logger.warning(f"[CacheService] Background refresh of {key!r} failed: {finished.exception()}")
+
+        task.add_done_callback(_log_failure)
+        return True
+
+    async def _run_compute(self, key, fn, ttl, stale_ttl) -> Any:
+        self.computes += 1
+        start = time.monotonic()
+        value = fn()
+        if inspect.isawaitable(value):
+            value = await value
+        delta = time.monotonic() - start
+        ttl = ttl if ttl else self.default_ttl
+        now = time.time()
+        fresh_until = now + ttl if ttl else None
+        expires_at = fresh_until + stale_ttl if fresh_until is not None else None
+        entry = _Entry(value, expires_at, self._sizeof(value) + _ENTRY_OVERHEAD_BYTES, fresh_until, delta)
+        shard = self._shard(key)
+        with shard.lock:
+            self._store(shard, key, entry)
+        if self._l2_eligible(key):
+            await self._off_loop(self._l2_store, {key: entry}, expires_at)
+        self._ensure_reaper()
+        return value
+
+    @staticmethod
+    def _reap_shard(shard: _Shard) -> int:
+        now = time.time()
+        with shard.lock:
+            expired = [
+                key for key, entry in shard.entries.items()
+                if entry.expires_at is not None and now > entry.expires_at
+            ]
+            for key in expired:
+                shard.remove(key)
+            shard.expirations += len(expired)
+        return len(expired)
+
+    def reap(self) -> int:
+        """Drop every expired entry now; returns how many were removed."""
+        return sum(self._reap_shard(shard) for shard in self._shards)
+
+    def reap_next(self) -> int:
+        """Drop the expired entries of the next shard in turn; returns how many were removed."""
+        index = self._next_reap
+        self._next_reap = (index + 1) % len(self._shards)
+        return self._reap_shard(self._shards[index])
+
+    def _l1_clear(self) -> int:
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                removed += len(shard.entries)
+                shard.entries.clear()
+                shard.bytes = 0
+        return removed
+
+    def clear(self, l2: bool = False) -> None:
+        """
+        Empty this process's L1.
+
+        With *l2*, also delete this cache's namespace from the L2 store and
+        clear the L1 of every worker using the same namespace; otherwise L2
+        entries stay until they expire or are deleted.
+        """
+        self._l1_clear()
+        if not l2 or self.l2 is None:
+            return
+        if not self.namespace:
+            raise ValueError("Refusing to clear a shared L2 store without a namespace")
+        try:
+            self.l2.delete_prefix(self.namespace)
+            self._publish([], namespace=self.namespace)
+        except Exception as e:
+            self._l2_failed("clear", e)
+
+    def close(self) -> None:
+        """Stop the background reaper."""
+        self._stop.set()
+
+    def __len__(self) -> int:
+        return sum(len(shard.entries) for shard in self._shards)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def stats(self) -> Dict[str, Any]:
+        totals = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "entries": 0, "bytes": 0}
+        for shard in self._shards:
+            with shard.lock:
+                totals["hits"] += shard.hits
+                totals["misses"] += shard.misses
+                totals["evictions"] += shard.evictions
+                totals["expirations"] += shard.expirations
+                totals["entries"] += len(shard.entries)
+                totals["bytes"] += shard.bytes
+        lookups = totals["hits"] + totals["misses"]
+        return {
+            **totals,
+            "hit_rate": totals["hits"] / lookups if lookups else 0.0,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "shards": len(self._shards),
+            "computes": self.computes,
+            "coalesced": self.coalesced,
+            "stale_served": self.stale_served,
+            "early_refreshes": self.early_refreshes,
+            "refresh_failures": self.refresh_failures,
+            "l2": type(self.l2).__name__ if self.l2 is not None else None,
+            "l2_hits": self.l2_hits,
+            "l2_errors": self.l2_errors,
+            "invalidations": self.invalidations,
+        }
+
+
+def _reap_loop(ref: "weakref.ref[CacheService]", stop: threading.Event, interval: float) -> None:
+    while not stop.wait(interval):
+        cache = ref()
+        if cache is None:
+            return
+        try:
+            removed = cache.reap_next()
+            if removed:
+                logger.debug(f"[CacheService] Reaped {removed} expired entries")
+        except Exception as e:
+            logger.warning(f"[CacheService] Reaper failed: {e}")
+        del cache
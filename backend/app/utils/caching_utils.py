@@ -3,63 +3,148 @@ In-memory caching and rate limiting utilities for agent methods.
 See: PLANNING.md, Phase 3 - Core Agent Logic, Step 6: Rate Limiting, Caching, and Fallbacks
 TODO: Extend to distributed cache/rate limiting for production.
 """
-import time
 import functools
-from typing import Any, Callable, Dict, Tuple
+import inspect
+from collections import namedtuple
+from typing import Any, Callable, Hashable, Optional
 import os
 import asyncio
+from app.utils.cache_backends import get_cache_backend
+from app.utils.cache_service import CacheService
+from app.utils.token_bucket import Limit, TokenBucketLimiter
+from app.utils.limiter_backends import MemoryLimiterBackend, get_limiter_backend
 
-# Simple in-memory cache: {(args, kwargs): (result, expiry)}
-_cache_store: Dict[Tuple, Tuple[Any, float]] = {}
+# Rate limits not tied to an instance live in the shared limiter backend (RATE_LIMIT_BACKEND),
+# so they hold across workers when a file or redis backend is configured.
 
-# Simple in-memory rate limiter: {key: last_call_time}
-_rate_limit_store: Dict[str, float] = {}
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
 
-def in_memory_cache(ttl: int = 60):
+
+class _Uncacheable(Exception):
+    """Raised by the default key function for arguments that have no reliable cache key."""
+
+
+def _canonical(value: Any) -> Hashable:
+    """Hashable, order-insensitive form of an argument value for cache keys."""
+    if isinstance(value, dict):
+        # Ordered by repr only; the keys themselves decide equality
+        items = sorted(((repr(k), _canonical(k), _canonical(v)) for k, v in value.items()), key=lambda item: item[0])
+        return ("__dict__", tuple(item[1:] for item in items))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_canonical(v) for v in value))
+    if isinstance(value, (set, frozenset)):
+        return ("__set__", tuple(sorted((_canonical(v) for v in value), key=repr)))
+    try:
+        hash(value)
+    except TypeError:
+        # Unhashable objects (e.g. numpy arrays): a repr can elide the contents and an id() is
+        # reused once the object dies, so neither identifies the value; such calls are not cached
+        raise _Uncacheable(type(value).__qualname__) from None
+    return value
+
+
+def _make_key_fn(func: Callable) -> Callable[..., Hashable]:
+    """Key function binding call arguments to *func*'s signature, so f(1) and f(x=1) share an entry."""
+    signature = inspect.signature(func)
+
+    def key_fn(*args, **kwargs) -> Hashable:
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return tuple((name, _canonical(value)) for name, value in bound.arguments.items())
+
+    return key_fn
+
+
+def in_memory_cache(ttl: int = 60, maxsize: int = 256, key_fn: Optional[Callable[..., Hashable]] = None):
     """
-    Decorator to cache function results in memory for `ttl` seconds.
+    Decorator to cache coroutine results in memory for `ttl` seconds.
     Args:
         ttl: Time-to-live for cache entries (seconds).
+        maxsize: Entries kept per decorated function (least recently used are evicted).
+        key_fn: Builds the cache key from the call's arguments. Defaults to the
+            arguments bound to the signature and canonicalized; `self` is keyed
+            by identity (its hash), so each instance gets its own entries. Calls
+            with unhashable arguments other than dicts, lists, tuples and sets
+            (e.g. numpy arrays) are not cached.
+            Return plain data (str, numbers, tuples of those) to share entries
+            through the L2 store.
+    Notes:
+        - Concurrent calls with the same key share one in-flight await.
+        - Exposes `cache_info()` and `cache_clear()` like functools.lru_cache;
+          `cache_clear()` also clears the function's entries in the L2 store.
+        - With CACHE_L2_BACKEND configured, results are also shared with other
+          workers through the L2 store, but only for keys made of plain data:
+          with the default key_fn, methods (keyed by `self`) and calls with
+          other object arguments stay in this process.
     """
     def decorator(func: Callable):
+        def new_cache() -> CacheService:
+            # Bounded by maxsize, so no reaper thread per decorated function; with
+            # CACHE_L2_BACKEND set, results are shared with the other workers
+            return CacheService(
+                max_entries=maxsize, shards=1, default_ttl=ttl, reap_interval=None,
+                l2=get_cache_backend(), namespace=f"{func.__module__}.{func.__qualname__}:"
+            )
+
+        cache = new_cache()
+        make_key = key_fn or _make_key_fn(func)
+
         @functools.wraps(func)
         async def wrapper(*args, **kwargs):
-            key = (func.__name__, str(args), str(kwargs))
-            now = time.time()
-            if key in _cache_store:
-                result, expiry = _cache_store[key]
-                if now < expiry:
-                    return result
-            result = await func(*args, **kwargs)
-            _cache_store[key] = (result, now + ttl)
-            return result
+            try:
+                key = make_key(*args, **kwargs)
+            except _Uncacheable:
+                return await func(*args, **kwargs)
+            return await cache.get_or_compute(key, lambda: func(*args, **kwargs), ttl=ttl, early_refresh_beta=0)
+
+        def cache_info() -> CacheInfo:
+            stats = cache.stats()
+            return CacheInfo(stats["hits"], stats["misses"], maxsize, stats["entries"])
+
+        def cache_clear() -> None:
+            # Drops the entries and resets the statistics, as functools.lru_cache does; with an
+            # L2, the function's shared entries and the other workers' copies go too
+            nonlocal cache
+            cache.close()
+            cache = new_cache()
+            cache.clear(l2=True)
+
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
         return wrapper
     return decorator
 
-def rate_limit(min_interval: float = 5.0):
+def rate_limit(min_interval: float = 5.0, key: Optional[str] = None):
     """
     Decorator to rate limit function calls to once per `min_interval` seconds.
     Args:
         min_interval: Minimum seconds between calls.
+        key: Budget to charge instead of the default one; every function and worker using it shares the limit.
     Notes:
-        - Rate limiting is keyed per agent instance (if used as a method), otherwise per function.
+        - Without `key`, methods are limited per instance and plain functions per function name.
+        - Per-instance limits stay in this process: an instance only exists here, and its id() means
+          nothing to other workers. Named budgets live in the shared limiter backend (RATE_LIMIT_BACKEND).
         - Set environment variable DISABLE_RATE_LIMIT=1 to disable rate limiting (for tests).
     """
     def decorator(func: Callable):
+        limits = [Limit("calls", 1, min_interval, burst=1)]
+        params = list(inspect.signature(func).parameters)
+        per_instance = key is None and bool(params) and params[0] == "self"
+        name = key or f"{func.__module__}.{func.__qualname__}"
+        limiter = None
+
         @functools.wraps(func)
         async def wrapper(*args, **kwargs):
+            nonlocal limiter
             if os.environ.get("DISABLE_RATE_LIMIT") == "1":
                 return await func(*args, **kwargs)
-            # Key by (func name, id(self)) if first arg is a class instance, else just func name
-            if args and hasattr(args[0], '__class__'):
-                key = (func.__name__, id(args[0]))
-            else:
-                key = (func.__name__,)
-            now = time.time()
-            last_call = _rate_limit_store.get(key, 0)
-            if now - last_call < min_interval:
+            if limiter is None:
+                # A bucket of size 1 refilling once per interval == one call per interval
+                backend = MemoryLimiterBackend() if per_instance else get_limiter_backend()
+                limiter = TokenBucketLimiter(limits, backend=backend)
+            bucket = f"{name}:{id(args[0])}" if per_instance and args else name
+            if not limiter.try_acquire({"calls": 1}, key=bucket):
                 raise Exception(f"Rate limit exceeded: {min_interval}s between calls for {func.__name__}")
-            _rate_limit_store[key] = now
             return await func(*args, **kwargs)
         return wrapper
     return decorator
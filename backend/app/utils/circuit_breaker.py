@@ -0,0 +1,200 @@
+"""
+Circuit breaker for upstream backends.
+
+A breaker watches the outcomes of recent calls (a sliding time window) and
+opens when the error rate or the p95 latency crosses its threshold. While open
+it rejects calls so traffic can fail over elsewhere; after ``open_seconds`` it
+lets a few probe calls through (half-open) and closes again once they succeed.
+"""
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when an open breaker rejects a call."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Error-rate and latency circuit breaker.
+
+    Args:
+        name: Name used in stats and logs
+        failure_rate: Open when this fraction of calls in the window failed
+        latency_p95: Open when the p95 latency in the window exceeds this many seconds (None disables)
+        window: Seconds of history considered
+        min_calls: Calls required in the window before the breaker may open
+        open_seconds: How long the breaker stays open before probing
+        half_open_calls: Probe calls allowed while half-open
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = 0.5,
+        latency_p95: Optional[float] = None,
+        window: float = 60.0,
+        min_calls: int = 10,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 1,
+        clock=time.monotonic
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.latency_p95 = latency_p95
+        self.window = window
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (time, ok, latency)
+        self._calls: Deque[Tuple[float, bool, float]] = deque()
+        # Running counts over the window, so evaluating after each call needs no scan or sort
+        self._failures = 0
+        self._slow = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_started = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.window
+        while self._calls and self._calls[0][0] < cutoff:
+            self._forget(*self._calls.popleft()[1:])
+
+    def _is_slow(self, ok: bool, latency: float) -> bool:
+        return ok and self.latency_p95 is not None and latency > self.latency_p95
+
+    def _remember(self, now: float, ok: bool, latency: float) -> None:
+        self._calls.append((now, ok, latency))
+        self._failures += not ok
+        self._slow += self._is_slow(ok, latency)
+
+    def _forget(self, ok: bool, latency: float) -> None:
+        self._failures -= not ok
+        self._slow -= self._is_slow(ok, latency)
+
+    def _clear(self) -> None:
+        self._calls.clear()
+        self._failures = 0
+        self._slow = 0
+
+    def _refresh(self, now: float) -> None:
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh(self._clock())
+            return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker starts probing (0 unless open)."""
+        with self._lock:
+            now = self._clock()
+            self._refresh(now)
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.open_seconds - now)
+
+    def allow(self) -> bool:
+        """Whether a call may go to this backend now; reserves a probe slot when half-open."""
+        with self._lock:
+            now = self._clock()
+            self._refresh(now)
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN:
+                if self._probes >= self.half_open_calls and now - self._probe_started >= self.open_seconds:
+                    # The probes never reported back (e.g. a cancelled hedge); allow new ones
+                    self._probes = 0
+                if self._probes < self.half_open_calls:
+                    self._probes += 1
+                    self._probe_started = now
+                    return True
+            self.rejected += 1
+            return False
+
+    def _open(self, now: float) -> None:
+        self._state = OPEN
+        self._opened_at = now
+        self.times_opened += 1
+
+    def _p95(self) -> float:
+        latencies = sorted(latency for _, ok, latency in self._calls if ok)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, math.ceil(0.95 * len(latencies)) - 1)]
+
+    def _p95_too_slow(self) -> bool:
+        # Same test as _p95() > latency_p95 without sorting: the p95 sample (rank ceil(0.95 n))
+        # is over the threshold exactly when more than n - ceil(0.95 n) samples are
+        successes = len(self._calls) - self._failures
+        return self._slow > successes - math.ceil(0.95 * successes)
+
+    def _evaluate(self, now: float) -> None:
+        self._prune(now)
+        if len(self._calls) < self.min_calls:
+            return
+        if self._failures / len(self._calls) >= self.failure_rate:
+            self._open(now)
+        elif self.latency_p95 is not None and self._p95_too_slow():
+            self._open(now)
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            now = self._clock()
+            if self._state == HALF_OPEN:
+                # Probe succeeded: start over with a clean window
+                self._state = CLOSED
+                self._clear()
+            self._remember(now, True, latency)
+            if self._state == CLOSED:
+                self._evaluate(now)
+
+    def record_failure(self, latency: float = 0.0) -> None:
+        with self._lock:
+            now = self._clock()
+            if self._state == HALF_OPEN:
+                self._open(now)
+                return
+            self._remember(now, False, latency)
+            if self._state == CLOSED:
+                self._evaluate(now)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = self._clock()
+            self._refresh(now)
+            self._prune(now)
+            calls = len(self._calls)
+            return {
+                "name": self.name,
+                "state": self._state,
+                "calls": calls,
+                "error_rate": self._failures / calls if calls else 0.0,
+                "latency_p95": self._p95(),
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,201 @@
+"""
+Response cache for deterministic LLM completions.
+
+Keys are request fingerprints (model, messages, temperature, max_tokens).
+Entries expire after a TTL and the cache is bounded by entry count with LRU
+eviction. Two interchangeable backends:
+
+- MemoryCompletionCache: per process
+- DiskCompletionCache: SQLite file, survives restarts and is shared by workers on a host
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionCache:
+    """Interface and hit/miss accounting shared by the completion cache backends."""
+
+    def __init__(self, ttl: float = 3600.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        self._set(key, value, time.time() + (ttl if ttl is not None else self.ttl))
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+        }
+
+
+class MemoryCompletionCache(CompletionCache):
+    """In-process LRU with per-entry expiry."""
+
+    def __init__(self, ttl: float = 3600.0, max_entries: int = 1024):
+        super().__init__(ttl, max_entries)
+        self._store: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._store.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if time.time() > expires_at:
+                del self._store[key]
+                return None
+            self._store.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        with self._lock:
+            self._store[key] = (value, expires_at)
+            self._store.move_to_end(key)
+            while len(self._store) > self.max_entries:
+                self._store.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._store.clear()
+
+
+class DiskCompletionCache(CompletionCache):
+    """
+    SQLite-backed cache; least recently used rows are deleted once over max_entries.
+
+    Writes keep a running entry count instead of counting rows each time.
+    Expired rows are swept when the cache is full and every ``prune_every``
+    writes, which also resyncs the count with rows written by other workers.
+    """
+
+    def __init__(self, path: str, ttl: float = 3600.0, max_entries: int = 10000, prune_every: int = 256):
+        super().__init__(ttl, max_entries)
+        self.path = path
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL"
+            ")"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS completions_expires ON completions (expires_at)")
+        self._count = len(self)
+        self._writes = 0
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM completions WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        now = time.time()
+        data = json.dumps(value)
+        with self._lock:
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO completions (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, data, expires_at, now),
+            ).rowcount
+            if inserted:
+                self._count += 1
+            else:
+                self._db.execute(
+                    "UPDATE completions SET value = ?, expires_at = ?, accessed_at = ? WHERE key = ?",
+                    (data, expires_at, now, key),
+                )
+            self._writes += 1
+            if self._writes >= self.prune_every:
+                self._writes = 0
+                self._prune_expired(now)
+                self._count = len(self)
+            if self._count > self.max_entries:
+                self._prune_expired(now)
+                overflow = self._count - self.max_entries
+                if overflow > 0:
+                    evicted = self._db.execute(
+                        "DELETE FROM completions WHERE key IN ("
+                        " SELECT key FROM completions ORDER BY accessed_at LIMIT ?)",
+                        (overflow,),
+                    ).rowcount
+                    self._count -= evicted
+                    self.evictions += evicted
+
+    def _prune_expired(self, now: float) -> None:
+        self._count -= self._db.execute("DELETE FROM completions WHERE expires_at <= ?", (now,)).rowcount
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM completions")
+            self._count = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def build_completion_cache(backend: str, ttl: float, max_entries: int, path: Optional[str] = None) -> CompletionCache:
+    """Create the completion cache backend named by *backend* (``memory`` or ``disk``)."""
+    if backend == "memory":
+        return MemoryCompletionCache(ttl=ttl, max_entries=max_entries)
+    if backend == "disk":
+        if not path:
+            raise ValueError("A path is required for the disk completion cache")
+        return DiskCompletionCache(path, ttl=ttl, max_entries=max_entries)
+    raise ValueError(f"Unknown completion cache backend: {backend!r} (expected memory or disk)")
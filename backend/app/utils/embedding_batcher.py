@@ -0,0 +1,263 @@
+"""
+Micro-batching coalescer for embedding requests.
+
+Concurrent single-text embedding calls are collected into one
+``embeddings.create(input=[...])`` request. A batch is flushed when it reaches
+``max_batch_size`` texts, ``max_batch_tokens`` estimated tokens, or when the
+oldest queued text has waited ``max_wait`` seconds. Every caller gets its own
+vector back; if the upstream rejects a batch because of one bad input, the batch
+is bisected so only the offending caller sees the error.
+
+EmbeddingBatcher serves sync (thread) callers, AsyncEmbeddingBatcher serves
+asyncio callers.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upstream status codes that mean "this input is bad", not "the service is unhealthy"
+_INPUT_ERROR_STATUS = {400, 413, 422}
+
+
+def _estimate_tokens(text: str) -> int:
+    # Roughly 4 chars per token
+    return max(1, len(text) // 4)
+
+
+def _is_input_error(exc: Exception) -> bool:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status in _INPUT_ERROR_STATUS
+
+
+class _PendingItem:
+    __slots__ = ("text", "tokens", "future", "enqueued_at")
+
+    def __init__(self, text: str, tokens: int, future):
+        self.text = text
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _BatchPolicy:
+    """Flush policy and stats shared by the sync and async batchers."""
+
+    def __init__(
+        self,
+        max_batch_size: int = 64,
+        max_batch_tokens: int = 8000,
+        max_wait: float = 0.01,
+        count_tokens: Optional[Callable[[str], int]] = None
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_wait = max_wait
+        self.count_tokens = count_tokens or _estimate_tokens
+        self._pending: List[_PendingItem] = []
+        self._pending_tokens = 0
+        self.batches = 0
+        self.items = 0
+        self.isolated_failures = 0
+
+    def _is_full(self) -> bool:
+        return len(self._pending) >= self.max_batch_size or self._pending_tokens >= self.max_batch_tokens
+
+    def _take_batch(self) -> List[_PendingItem]:
+        """Pop the longest prefix of pending items that fits the size and token limits."""
+        batch: List[_PendingItem] = []
+        tokens = 0
+        for item in self._pending:
+            if batch and (len(batch) >= self.max_batch_size or tokens + item.tokens > self.max_batch_tokens):
+                break
+            batch.append(item)
+            tokens += item.tokens
+        del self._pending[:len(batch)]
+        self._pending_tokens -= tokens
+        self.batches += 1
+        self.items += len(batch)
+        return batch
+
+    def _check_result(self, batch: List[_PendingItem], vectors: List[List[float]]) -> None:
+        if len(vectors) != len(batch):
+            raise ValueError(f"Embedding batch returned {len(vectors)} vectors for {len(batch)} inputs")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "isolated_failures": self.isolated_failures,
+            "pending": len(self._pending),
+        }
+
+
+class EmbeddingBatcher(_BatchPolicy):
+    """
+    Coalesces embedding requests from many threads into batched upstream calls.
+
+    Args:
+        embed_batch: Function embedding a list of texts, returning one vector per text
+        max_batch_size: Maximum texts per upstream request
+        max_batch_tokens: Maximum estimated tokens per upstream request
+        max_wait: Maximum seconds a text waits for companions before its batch is flushed
+        count_tokens: Token estimator for a single text
+        max_concurrent_batches: Upstream requests that may be in flight at once
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], List[List[float]]],
+        max_batch_size: int = 64,
+        max_batch_tokens: int = 8000,
+        max_wait: float = 0.01,
+        count_tokens: Optional[Callable[[str], int]] = None,
+        max_concurrent_batches: int = 4
+    ):
+        super().__init__(max_batch_size, max_batch_tokens, max_wait, count_tokens)
+        self._embed_batch = embed_batch
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_batches, thread_name_prefix="embedding-batch"
+        )
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+
+    def submit(self, text: str) -> Future:
+        """Queue *text* for embedding and return a Future resolving to its vector."""
+        future: Future = Future()
+        item = _PendingItem(text, self.count_tokens(text), future)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("EmbeddingBatcher is closed")
+            self._pending.append(item)
+            self._pending_tokens += item.tokens
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+        return future
+
+    def embed(self, text: str) -> List[float]:
+        """Embed a single text, blocking until its batch completes."""
+        return self.submit(text).result()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                deadline = self._pending[0].enqueued_at + self.max_wait
+                while not self._is_full() and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take_batch()
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch: List[_PendingItem]) -> None:
+        try:
+            vectors = self._embed_batch([item.text for item in batch])
+            self._check_result(batch, vectors)
+        except Exception as e:
+            if len(batch) > 1 and _is_input_error(e):
+                # Bisect so only the caller with the bad input gets the error
+                self.isolated_failures += 1
+                middle = len(batch) // 2
+                self._run_batch(batch[:middle])
+                self._run_batch(batch[middle:])
+                return
+            for item in batch:
+                item.future.set_exception(e)
+            return
+        for item, vector in zip(batch, vectors):
+            item.future.set_result(vector)
+
+    def close(self) -> None:
+        """Flush queued texts and stop the background worker."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+        self._executor.shutdown(wait=True)
+
+
+class AsyncEmbeddingBatcher(_BatchPolicy):
+    """
+    Coalesces embedding requests from many asyncio tasks into batched upstream calls.
+
+    Takes the same arguments as EmbeddingBatcher, except that ``embed_batch`` is a
+    coroutine function. Must be used from a single event loop.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], Awaitable[List[List[float]]]],
+        max_batch_size: int = 64,
+        max_batch_tokens: int = 8000,
+        max_wait: float = 0.01,
+        count_tokens: Optional[Callable[[str], int]] = None
+    ):
+        super().__init__(max_batch_size, max_batch_tokens, max_wait, count_tokens)
+        self._embed_batch = embed_batch
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed a single text, awaiting until its batch completes."""
+        loop = asyncio.get_running_loop()
+        item = _PendingItem(text, self.count_tokens(text), loop.create_future())
+        self._pending.append(item)
+        self._pending_tokens += item.tokens
+        if self._is_full():
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await item.future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch = self._take_batch()
+            task = asyncio.ensure_future(self._run_batch(batch))
+            # Keep a reference so the task is not garbage collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            if not self._is_full():
+                break
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+    async def _run_batch(self, batch: List[_PendingItem]) -> None:
+        try:
+            vectors = await self._embed_batch([item.text for item in batch])
+            self._check_result(batch, vectors)
+        except Exception as e:
+            if len(batch) > 1 and _is_input_error(e):
+                # Bisect so only the caller with the bad input gets the error
+                self.isolated_failures += 1
+                middle = len(batch) // 2
+                await asyncio.gather(self._run_batch(batch[:middle]), self._run_batch(batch[middle:]))
+                return
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+        for item, vector in zip(batch, vectors):
+            if not item.future.done():
+                item.future.set_result(vector)
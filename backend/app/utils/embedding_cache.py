@@ -0,0 +1,169 @@
+"""
+Content-addressed embedding cache.
+
+Entries are keyed by (embedding model, SHA-256 of the normalized text), so the
+same headline or filing preview is only embedded once per model. Two tiers:
+
+- L1: in-process LRU bounded by bytes, vectors stored as packed float32 arrays
+- L2: optional SQLite file shared by all workers on the host (WAL mode)
+
+Vectors come back as plain lists of floats, rounded to float32 precision.
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry bookkeeping cost (key tuple, digest string, OrderedDict node)
+_ENTRY_OVERHEAD_BYTES = 200
+# Stay well below SQLite's bound-parameter limit
+_SQLITE_CHUNK = 500
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text before hashing: Unicode NFC and collapsed whitespace."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache.
+
+    Args:
+        max_bytes: Byte budget of the in-process LRU tier
+        disk_path: Optional SQLite file for the persistent tier
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self._lru: "OrderedDict[Tuple[str, str], array]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " text_hash TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, text_hash)"
+                ") WITHOUT ROWID"
+            )
+
+    @staticmethod
+    def _entry_size(vector: array) -> int:
+        return vector.itemsize * len(vector) + _ENTRY_OVERHEAD_BYTES
+
+    def _lru_put(self, key: Tuple[str, str], vector: array) -> None:
+        old = self._lru.pop(key, None)
+        if old is not None:
+            self._bytes -= self._entry_size(old)
+        self._lru[key] = vector
+        self._bytes += self._entry_size(vector)
+        while self._bytes > self.max_bytes and self._lru:
+            _, evicted = self._lru.popitem(last=False)
+            self._bytes -= self._entry_size(evicted)
+            self.evictions += 1
+
+    def _disk_get_many(self, model: str, digests: Sequence[str]) -> Dict[str, array]:
+        found: Dict[str, array] = {}
+        for i in range(0, len(digests), _SQLITE_CHUNK):
+            chunk = digests[i:i + _SQLITE_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._db.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                (model, *chunk),
+            ).fetchall()
+            for digest, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                found[digest] = vector
+        return found
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Look up *texts*; returns one vector or None (miss) per text, in input order."""
+        digests = [text_digest(t) for t in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            missing: Dict[str, List[int]] = {}
+            for i, digest in enumerate(digests):
+                key = (model, digest)
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    results[i] = vector.tolist()
+                    self.hits += 1
+                else:
+                    missing.setdefault(digest, []).append(i)
+            if missing and self._db is not None:
+                for digest, vector in self._disk_get_many(model, list(missing)).items():
+                    self._lru_put((model, digest), vector)
+                    as_list = vector.tolist()
+                    for i in missing.pop(digest):
+                        results[i] = as_list
+                        self.hits += 1
+                        self.disk_hits += 1
+            self.misses += sum(len(idx) for idx in missing.values())
+        return results
+
+    def put(self, model: str, text: str, vector: Sequence[float]) -> None:
+        self.put_many(model, [text], [vector])
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                digest = text_digest(text)
+                packed = array("f", vector)
+                self._lru_put((model, digest), packed)
+                rows.append((model, digest, packed.tobytes()))
+            if self._db is not None and rows:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)", rows
+                )
+
+    def clear(self) -> None:
+        """Drop the in-process tier. The disk tier is kept."""
+        with self._lock:
+            self._lru.clear()
+            self._bytes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._lru),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,435 @@
+"""
+Pluggable state backends for TokenBucketLimiter.
+
+Per-process counters let every uvicorn worker / Cloud Run instance spend the
+full budget, so the real upstream rate is N times the configured one. These
+backends keep the bucket state where all workers can see it:
+
+- MemoryLimiterBackend: per process (default)
+- FileLockLimiterBackend: shared by all processes on one host (fcntl file locks)
+- RedisLimiterBackend: shared by a whole cluster (atomic Lua script)
+
+Select one with the RATE_LIMIT_BACKEND environment variable
+(``memory`` | ``file`` | ``redis``), see get_limiter_backend().
+"""
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.utils.token_bucket import Limit, RateLimitExceeded
+
+# (limit, cost) pairs charged in one atomic reservation
+Charges = Sequence[Tuple[Limit, float]]
+
+
+def _refill(tokens: Optional[float], updated: Optional[float], limit: Limit, now: float) -> float:
+    if tokens is None:
+        return limit.capacity
+    return min(limit.capacity, tokens + max(0.0, now - updated) * limit.per_second)
+
+
+def _plan(
+    key: str,
+    states: List[Tuple[Optional[float], Optional[float]]],
+    charges: Charges,
+    now: float,
+    max_wait: Optional[float],
+    debt: bool = True
+) -> Tuple[float, List[float]]:
+    """Compute the wait and new token counts for *charges*; raise if the wait exceeds *max_wait*."""
+    wait = 0.0
+    new_tokens = []
+    for (tokens, updated), (limit, cost) in zip(states, charges):
+        tokens = _refill(tokens, updated, limit, now)
+        if debt and tokens < cost:
+            wait = max(wait, (cost - tokens) / limit.per_second)
+        new_tokens.append(min(limit.capacity, tokens - cost))
+    if max_wait is not None and wait > max_wait:
+        raise RateLimitExceeded(f"Rate limit exceeded for '{key}': retry in {wait:.2f}s", retry_after=wait)
+    return wait, new_tokens
+
+
+class LimiterBackend:
+    """Interface for token-bucket state storage. Every method must be atomic across its charges."""
+
+    def reserve(self, key: str, charges: Charges, max_wait: Optional[float] = None) -> float:
+        """Debit *charges* and return the seconds to wait; raise RateLimitExceeded if over *max_wait*."""
+        raise NotImplementedError
+
+    def try_reserve(self, key: str, charges: Charges) -> Tuple[float, List[float]]:
+        """
+        Debit *charges* only if they are available right now.
+
+        Returns ``(0, units left per charge)`` when debited, else ``(seconds until
+        they would be available, units available now)`` with nothing debited.
+        """
+        raise NotImplementedError
+
+    def adjust(self, key: str, charges: Charges) -> None:
+        """Debit or refund *charges* without waiting."""
+        raise NotImplementedError
+
+    def available(self, key: str, limits: Sequence[Limit]) -> Dict[str, float]:
+        """Units currently available per limit."""
+        raise NotImplementedError
+
+
+def _current(states: List[Tuple[Optional[float], Optional[float]]], charges: Charges, now: float) -> List[float]:
+    return [_refill(tokens, updated, limit, now) for (tokens, updated), (limit, _) in zip(states, charges)]
+
+
+class MemoryLimiterBackend(LimiterBackend):
+    """
+    In-process state: a dict guarded by a lock that is never held while sleeping.
+
+    A bucket that has refilled completely carries no state (it reads the same as
+    a missing one), so idle keys are dropped: buckets are kept in order of last
+    update and each call evicts up to *max_evictions* refilled ones from the
+    oldest end. Memory follows the number of recently active keys, and no call
+    ever scans the whole table.
+    """
+
+    def __init__(self, clock=time.monotonic, max_evictions: int = 64):
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (key, limit name) -> (available units, last refill time, time the bucket is full again),
+        # least recently updated first
+        self._buckets: "OrderedDict[Tuple[str, str], Tuple[float, float, float]]" = OrderedDict()
+        self.max_evictions = max_evictions
+
+    def _state(self, key: str, limit: Limit) -> Tuple[Optional[float], Optional[float]]:
+        state = self._buckets.get((key, limit.name))
+        return (None, None) if state is None else state[:2]
+
+    def _evict(self, now: float) -> None:
+        # Stops at the first bucket still refilling; anything behind it was updated later
+        # and is evicted by a later call once the buckets ahead of it have refilled
+        for _ in range(self.max_evictions):
+            if not self._buckets:
+                return
+            bucket, state = next(iter(self._buckets.items()))
+            if state[2] > now:
+                return
+            del self._buckets[bucket]
+
+    def _apply(
+        self, key: str, charges: Charges, max_wait: Optional[float], debt: bool, try_only: bool = False
+    ) -> Tuple[float, List[float]]:
+        with self._lock:
+            now = self._clock()
+            self._evict(now)
+            states = [self._state(key, limit) for limit, _ in charges]
+            wait, new_tokens = _plan(key, states, charges, now, max_wait, debt)
+            if try_only and wait > 0:
+                return wait, _current(states, charges, now)
+            for (limit, _), tokens in zip(charges, new_tokens):
+                bucket = (key, limit.name)
+                self._buckets[bucket] = (tokens, now, now + (limit.capacity - tokens) / limit.per_second)
+                self._buckets.move_to_end(bucket)
+            return wait, new_tokens
+
+    def reserve(self, key: str, charges: Charges, max_wait: Optional[float] = None) -> float:
+        return self._apply(key, charges, max_wait, debt=True)[0]
+
+    def try_reserve(self, key: str, charges: Charges) -> Tuple[float, List[float]]:
+        return self._apply(key, charges, None, debt=True, try_only=True)
+
+    def adjust(self, key: str, charges: Charges) -> None:
+        self._apply(key, charges, None, debt=False)
+
+    def available(self, key: str, limits: Sequence[Limit]) -> Dict[str, float]:
+        with self._lock:
+            now = self._clock()
+            return {limit.name: _refill(*self._state(key, limit), limit, now) for limit in limits}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class FileLockLimiterBackend(LimiterBackend):
+    """
+    Host-wide state: one small file per bucket, updated under fcntl.flock.
+
+    All processes pointing at the same directory share the budget. Files are
+    locked in sorted order, so multi-limit reservations cannot deadlock.
+
+    At most *max_open_files* descriptors stay cached (least recently used are
+    closed first). Every *sweep_interval* seconds, bucket files that have
+    refilled completely are deleted: a full bucket reads the same as a missing
+    file, so the directory only holds recently active keys.
+    """
+
+    _STATE = struct.Struct("<ddd")  # available units, last refill, time the bucket is full again (unix time)
+
+    def __init__(self, directory: str, max_open_files: int = 256, sweep_interval: float = 60.0):
+        import fcntl  # POSIX only; imported here so other backends work everywhere
+        self._fcntl = fcntl
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.max_open_files = max_open_files
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.time() + sweep_interval
+        self._fds: "OrderedDict[str, int]" = OrderedDict()
+        # flock does not exclude threads sharing one descriptor, so also lock in-process
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _name(key: str, limit: Limit) -> str:
+        return hashlib.sha1(f"{key}\0{limit.name}".encode("utf-8")).hexdigest()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.bucket")
+
+    def _fd(self, name: str) -> int:
+        fd = self._fds.get(name)
+        if fd is None:
+            fd = os.open(self._path(name), os.O_RDWR | os.O_CREAT, 0o600)
+            self._fds[name] = fd
+        else:
+            self._fds.move_to_end(name)
+        return fd
+
+    def _drop(self, name: str) -> None:
+        fd = self._fds.pop(name, None)
+        if fd is not None:
+            os.close(fd)
+
+    def _trim(self) -> None:
+        while len(self._fds) > self.max_open_files:
+            _, fd = self._fds.popitem(last=False)
+            os.close(fd)
+
+    def _read(self, fd: int) -> Tuple[Optional[float], Optional[float]]:
+        data = os.pread(fd, self._STATE.size, 0)
+        if len(data) < self._STATE.size:
+            return None, None
+        return self._STATE.unpack(data)[:2]
+
+    def _lock_fds(self, names: List[str]) -> Optional[List[int]]:
+        """Lock the files for *names* in sorted order; None if one was pruned meanwhile (retry)."""
+        fds = [self._fd(name) for name in names]
+        locked = []
+        for name in sorted(set(names)):
+            fd = self._fds[name]
+            self._fcntl.flock(fd, self._fcntl.LOCK_EX)
+            locked.append(fd)
+            if os.fstat(fd).st_nlink == 0:
+                # Another process deleted the file while we held its descriptor
+                for held in reversed(locked):
+                    self._fcntl.flock(held, self._fcntl.LOCK_UN)
+                self._drop(name)
+                return None
+        return fds
+
+    def _apply(
+        self,
+        key: str,
+        charges: Charges,
+        max_wait: Optional[float],
+        debt: bool,
+        write: bool = True,
+        try_only: bool = False
+    ) -> Tuple[float, List[float]]:
+        names = [self._name(key, limit) for limit, _ in charges]
+        with self._lock:
+            try:
+                fds = self._lock_fds(names)
+                while fds is None:
+                    fds = self._lock_fds(names)
+                try:
+                    now = time.time()
+                    states = [self._read(fd) for fd in fds]
+                    wait, new_tokens = _plan(key, states, charges, now, max_wait, debt)
+                    if try_only and wait > 0:
+                        return wait, _current(states, charges, now)
+                    if write:
+                        for fd, (limit, _), tokens in zip(fds, charges, new_tokens):
+                            full_at = now + (limit.capacity - tokens) / limit.per_second
+                            os.pwrite(fd, self._STATE.pack(tokens, now, full_at), 0)
+                    return wait, new_tokens
+                finally:
+                    for fd in sorted(set(fds), reverse=True):
+                        self._fcntl.flock(fd, self._fcntl.LOCK_UN)
+            finally:
+                self._trim()
+                if time.time() >= self._next_sweep:
+                    self._sweep()
+
+    def _sweep(self) -> None:
+        """Delete bucket files that have refilled completely; skips files locked by anyone else."""
+        now = time.time()
+        self._next_sweep = now + self.sweep_interval
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".bucket"):
+                continue
+            try:
+                fd = os.open(entry.path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                self._fcntl.flock(fd, self._fcntl.LOCK_EX | self._fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                continue
+            try:
+                data = os.pread(fd, self._STATE.size, 0)
+                # Short files carry no state (created by a read, or by an older version)
+                if len(data) < self._STATE.size or self._STATE.unpack(data)[2] <= now:
+                    os.unlink(entry.path)
+                    self._drop(entry.name[:-len(".bucket")])
+            finally:
+                self._fcntl.flock(fd, self._fcntl.LOCK_UN)
+                os.close(fd)
+
+    def reserve(self, key: str, charges: Charges, max_wait: Optional[float] = None) -> float:
+        return self._apply(key, charges, max_wait, debt=True)[0]
+
+    def try_reserve(self, key: str, charges: Charges) -> Tuple[float, List[float]]:
+        return self._apply(key, charges, None, debt=True, try_only=True)
+
+    def adjust(self, key: str, charges: Charges) -> None:
+        self._apply(key, charges, None, debt=False)
+
+    def available(self, key: str, limits: Sequence[Limit]) -> Dict[str, float]:
+        _, tokens = self._apply(key, [(limit, 0.0) for limit in limits], None, debt=False, write=False)
+        return {limit.name: t for limit, t in zip(limits, tokens)}
+
+    def __len__(self) -> int:
+        return sum(1 for entry in os.scandir(self.directory) if entry.name.endswith(".bucket"))
+
+    def close(self) -> None:
+        with self._lock:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds.clear()
+
+
+# Atomic multi-bucket reservation, timed by the Redis server clock so all hosts agree.
+# KEYS: one hash per bucket. ARGV: mode ("reserve" | "try" | "adjust" | "peek"), max_wait (-1 = none),
+# then (units per second, capacity, cost) per key. A rejected "try" returns the units available now.
+_REDIS_RESERVE_SCRIPT = """
+if redis.replicate_commands then pcall(redis.replicate_commands) end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local mode = ARGV[1]
+local max_wait = tonumber(ARGV[2])
+local wait = 0
+local new_tokens = {}
+local current = {}
+for i = 1, #KEYS do
+    local base = 3 + (i - 1) * 3
+    local rate = tonumber(ARGV[base])
+    local capacity = tonumber(ARGV[base + 1])
+    local cost = tonumber(ARGV[base + 2])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'updated')
+    local tokens = tonumber(state[1])
+    if tokens == nil then
+        tokens = capacity
+    else
+        tokens = math.min(capacity, tokens + math.max(0, now - tonumber(state[2])) * rate)
+    end
+    current[i] = tokens
+    if (mode == 'reserve' or mode == 'try') and tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+    end
+    new_tokens[i] = math.min(capacity, tokens - cost)
+end
+if mode == 'try' and wait > 0 then
+    local rejected = {0, tostring(wait)}
+    for i = 1, #KEYS do
+        rejected[#rejected + 1] = tostring(current[i])
+    end
+    return rejected
+end
+if mode == 'reserve' and max_wait >= 0 and wait > max_wait then
+    return {0, tostring(wait)}
+end
+local result = {1, tostring(wait)}
+for i = 1, #KEYS do
+    local base = 3 + (i - 1) * 3
+    if mode ~= 'peek' then
+        redis.call('HSET', KEYS[i], 'tokens', tostring(new_tokens[i]), 'updated', tostring(now))
+        -- A bucket that has refilled completely carries no state; let it expire
+        local refill_ms = math.ceil((tonumber(ARGV[base + 1]) - new_tokens[i]) / tonumber(ARGV[base]) * 1000)
+        redis.call('PEXPIRE', KEYS[i], refill_ms + 1000)
+    end
+    result[#result + 1] = tostring(new_tokens[i])
+end
+return result
+"""
+
+
+class RedisLimiterBackend(LimiterBackend):
+    """
+    Cluster-wide state in Redis (or any server speaking the Redis protocol with EVAL).
+
+    Args:
+        client: redis-py compatible client (``redis.Redis``, ``fakeredis.FakeRedis``, ...)
+        prefix: Key prefix for bucket hashes
+    """
+
+    def __init__(self, client, prefix: str = "ratelimit"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(_REDIS_RESERVE_SCRIPT)
+
+    def _keys(self, key: str, charges: Charges) -> List[str]:
+        # Hash tag keeps all buckets of one key in the same cluster slot
+        return [f"{self.prefix}:{{{key}}}:{limit.name}" for limit, _ in charges]
+
+    def _eval(
+        self, mode: str, key: str, charges: Charges, max_wait: Optional[float]
+    ) -> Tuple[bool, float, List[float]]:
+        args: List = [mode, -1 if max_wait is None else max_wait]
+        for limit, cost in charges:
+            args.extend([limit.per_second, limit.capacity, cost])
+        reply = self._script(keys=self._keys(key, charges), args=args)
+        return bool(int(reply[0])), float(reply[1]), [float(v) for v in reply[2:]]
+
+    def _run(self, mode: str, key: str, charges: Charges, max_wait: Optional[float]) -> List[float]:
+        ok, wait, tokens = self._eval(mode, key, charges, max_wait)
+        if not ok:
+            raise RateLimitExceeded(f"Rate limit exceeded for '{key}': retry in {wait:.2f}s", retry_after=wait)
+        return [wait] + tokens
+
+    def reserve(self, key: str, charges: Charges, max_wait: Optional[float] = None) -> float:
+        return self._run("reserve", key, charges, max_wait)[0]
+
+    def try_reserve(self, key: str, charges: Charges) -> Tuple[float, List[float]]:
+        _, wait, tokens = self._eval("try", key, charges, None)
+        return wait, tokens
+
+    def adjust(self, key: str, charges: Charges) -> None:
+        self._run("adjust", key, charges, None)
+
+    def available(self, key: str, limits: Sequence[Limit]) -> Dict[str, float]:
+        tokens = self._run("peek", key, [(limit, 0.0) for limit in limits], None)[1:]
+        return {limit.name: t for limit, t in zip(limits, tokens)}
+
+
+@lru_cache()
+def get_limiter_backend() -> LimiterBackend:
+    """
+    Get the process-wide limiter backend selected by environment variables.
+
+    RATE_LIMIT_BACKEND: ``memory`` (default), ``file`` or ``redis``
+    RATE_LIMIT_STATE_DIR: directory for the file backend (default: <tmp>/bellatry-ratelimit)
+    RATE_LIMIT_REDIS_URL: URL for the redis backend (falls back to REDIS_URL)
+    """
+    kind = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+    if kind == "memory":
+        return MemoryLimiterBackend()
+    if kind == "file":
+        directory = os.getenv("RATE_LIMIT_STATE_DIR", os.path.join(tempfile.gettempdir(), "bellatry-ratelimit"))
+        return FileLockLimiterBackend(directory)
+    if kind == "redis":
+        from app.utils.redis_client import get_redis_client
+        url = os.getenv("RATE_LIMIT_REDIS_URL") or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        return RedisLimiterBackend(get_redis_client(url))
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {kind!r} (expected memory, file or redis)")
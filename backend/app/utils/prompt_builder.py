@@ -11,7 +11,9 @@ Rules followed:
 • Fully deterministic – easy to snapshot in unit tests.
 """
 
-from typing import Dict, Sequence, List
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, Sequence, List
 import textwrap
 import json
 import re
@@ -54,22 +56,60 @@ def render_value(value):
             return ""
         headers = list(value.keys())
         rows = zip(*[v if isinstance(v, list) else [v] for v in value.values()])
-        table = "| " + " | ".join(headers) + " |\n"
-        table += "| " + " | ".join("---" for _ in headers) + " |\n"
-        for row in rows:
-            table += "| " + " | ".join(str(cell) for cell in row) + " |\n"
-        return table
+        # Collect lines and join once, so the table is built in linear time
+        lines = [
+            "| " + " | ".join(headers) + " |\n",
+            "| " + " | ".join("---" for _ in headers) + " |\n",
+        ]
+        lines.extend("| " + " | ".join(str(cell) for cell in row) + " |\n" for row in rows)
+        return "".join(lines)
     return str(value) if value is not None else ""
 
+
+_PLACEHOLDER_RE = re.compile(r"\{\{(\w+)\}\}")
+
+
+class CompiledTemplate:
+    """A template parsed once into alternating literal text and placeholder keys.
+
+    ``literals`` has one more entry than ``keys``: rendering interleaves
+    ``literals[0], value(keys[0]), literals[1], ...`` and joins once.
+    """
+
+    __slots__ = ("literals", "keys")
+
+    def __init__(self, template: str):
+        parts = _PLACEHOLDER_RE.split(template)
+        self.literals = tuple(parts[0::2])
+        self.keys = tuple(parts[1::2])
+
+    def render(self, context: dict) -> str:
+        out = [self.literals[0]]
+        for key, literal in zip(self.keys, self.literals[1:]):
+            # Unknown placeholders are left in place, as the regex path did
+            out.append(render_value(context[key]) if key in context else f"{{{{{key}}}}}")
+            out.append(literal)
+        return "".join(out)
+
+
+@lru_cache(maxsize=128)
+def compile_template(template: str) -> CompiledTemplate:
+    """Parse *template* once; later calls with the same template hit the cache."""
+    return CompiledTemplate(template)
+
+
 def build_markdown_report(template: str, context: dict) -> str:
     """
     Replace all {{placeholders}} in the template with values from context.
     Supports scalars, lists (as bullet lists), and dicts (as tables).
     """
-    def replacer(match):
-        key = match.group(1)
-        return render_value(context.get(key, f"{{{{{key}}}}}"))
-    return re.sub(r"\{\{(\w+)\}\}", replacer, template)
+    return compile_template(template).render(context)
+
+
+def render_many(template: str, contexts: Iterable[dict]) -> List[str]:
+    """Render *template* once per context (e.g. one report per ticker), compiling it only once."""
+    compiled = compile_template(template)
+    return [compiled.render(context) for context in contexts]
 
 # Update SUMMARY_TEMPLATE to use Pinecone metadata field names
 SUMMARY_TEMPLATE = """
@@ -142,12 +182,105 @@ SUMMARY_TEMPLATE = """
 """
 
 
+_ROLE_DEFAULT = (
+    "You are a seasoned equity research analyst. Provide concise, "
+    "actionable insights for retail investors. Use plain English, "
+    "avoid jargon."
+)
+
+_METRIC_TABLE_KEYS: Sequence[str] = (
+    "52WeekHigh", "52WeekLow", "DividendYield", "ForwardPE", "PEGRatio", "PriceToBookRatio", "TrailingPE"
+)
+
+_OVERVIEW_KEYS: Sequence[str] = ("Name", "symbol", "Sector", "Industry", "MarketCapitalization")
+
+_INSTRUCTIONS: Dict[str, str] = {
+    "markdown": (
+        "You MUST copy the following sample format EXACTLY. Do not invent your own structure. Only use Markdown headings, bullet points, and tables as shown. Do NOT use dashes or run-on text.\n\n"
+        "Sample output (copy this format):\n"
+        "**Summary:** Apple Inc. (AAPL) is a leading technology company...\n\n"
+        "## Overview\n"
+        "- **Name**: Apple Inc.\n"
+        "- **Symbol**: AAPL\n"
+        "- **Sector**: Technology\n"
+        "- **Industry**: Electronic Computers\n"
+        "- **Market Capitalization**: $2.94 trillion\n\n"
+        "## Key Metrics\n"
+        "| 52-Week High | 52-Week Low | Dividend Yield | Forward PE | PEG Ratio | Price to Book Ratio | Trailing PE |\n"
+        "|-------------|-------------|---------------|------------|-----------|---------------------|-------------|\n"
+        "| $259.47     | $168.99     | 0.53%         | 24.45      | 1.77      | 43.75               | 30.48       |\n\n"
+        "## Analyst Sentiment\n"
+        "- **StrongBuy**: 7\n"
+        "- **Buy**: 21\n"
+        "- **Hold**: 16\n"
+        "- **Sell**: 2\n"
+        "- **StrongSell**: 1\n\n"
+        "## Risks\n"
+        "- Market volatility can impact stock price.\n"
+        "- Competition in the technology sector.\n"
+        "- Changes in consumer preferences could impact product demand.\n\n"
+        "You MUST use the same headings, table, and bullet structure. Do NOT use any other format.\n"
+    ),
+    "bullets": "Answer in short, clear bullet points for each section.",
+    "json": "Respond with a JSON object containing keys: overview, metrics, sentiment, risks.",
+}
+
+# Same structure as the markdown sample, described instead of shown; used when the
+# sample would not fit the prompt budget
+_COMPACT_MARKDOWN_INSTRUCTION = (
+    "Answer in Markdown: start with a one-line **Summary:**, then the headings "
+    "## Overview (bullets: Name, Symbol, Sector, Industry, Market Capitalization), "
+    "## Key Metrics (one table: 52-Week High, 52-Week Low, Dividend Yield, Forward PE, "
+    "PEG Ratio, Price to Book Ratio, Trailing PE), ## Analyst Sentiment (bullets: StrongBuy, "
+    "Buy, Hold, Sell, StrongSell) and ## Risks (bullets). Use no other structure.\n"
+)
+
+_BLOCK_SEPARATOR = "\n\n---\n\n"
+_NO_CONTEXT = "(no metadata)"
+
+
+def _metrics_table(meta: dict) -> str:
+    header = "| " + " | ".join(_METRIC_TABLE_KEYS) + " |"
+    sep = "|" + "---|" * len(_METRIC_TABLE_KEYS)
+    row = "| " + " | ".join(str(meta.get(k, "-")) for k in _METRIC_TABLE_KEYS) + " |"
+    return f"\n{header}\n{sep}\n{row}\n"
+
+
+def _render_doc_block(filtered: dict) -> str:
+    """Context block for one document's (filtered) metadata."""
+    # Overview bullets, each on its own line
+    overview = "\n".join([
+        f"- **{k}**: {filtered.get(k, '-')}" for k in _OVERVIEW_KEYS if k in filtered
+    ])
+    # Table for metrics
+    table = _metrics_table(filtered)
+    # Analyst sentiment, each on its own line
+    sentiment = "\n".join([
+        f"- **StrongBuy**: {filtered.get('AnalystRatingStrongBuy', '-')}\n",
+        f"- **Buy**: {filtered.get('AnalystRatingBuy', '-')}\n",
+        f"- **Hold**: {filtered.get('AnalystRatingHold', '-')}\n",
+        f"- **Sell**: {filtered.get('AnalystRatingSell', '-')}\n",
+        f"- **StrongSell**: {filtered.get('AnalystRatingStrongSell', '-')}\n"
+    ])
+    return f"\n## Overview\n{overview}\n\n## Key Metrics\n{table}\n\n## Analyst Sentiment\n{sentiment}\n"
+
+
+def _assemble_prompt(model_role: str, context_str: str, question: str, instruction: str) -> str:
+    template = textwrap.dedent(
+        f"""
+        <system>\n{model_role}\n</system>\n\n<context>\n{context_str}\n</context>\n\nUser question: {question}\n\n{instruction}\n"""
+    ).strip()
+    return template
+
+
 def build_stock_prompt(
     *,
     docs: List[Dict],  # matches list from Pinecone or other source
     question: str,
     style: str = "markdown",
     model_role: str | None = None,
+    max_prompt_tokens: int | None = None,
+    count_tokens: Callable[[str], int] | None = None,
 ) -> str:
     """Build a structured prompt for stock analysis.
 
@@ -162,24 +295,25 @@ def build_stock_prompt(
         *not* enforced here - the caller includes it in the instruction.
     model_role
         Optional custom system role.  Defaults to a seasoned equity analyst.
+    max_prompt_tokens
+        Optional prompt-token budget.  When set, ``docs`` go through
+        :func:`build_stock_prompt_with_budget` (ranked, collapsed per symbol
+        and truncated to fit).
+    count_tokens
+        Token counter used with ``max_prompt_tokens``.
     """
+    if max_prompt_tokens is not None:
+        return build_stock_prompt_with_budget(
+            docs=docs,
+            question=question,
+            style=style,
+            model_role=model_role,
+            max_prompt_tokens=max_prompt_tokens,
+            count_tokens=count_tokens,
+        ).prompt
 
     if model_role is None:
-        model_role = (
-            "You are a seasoned equity research analyst. Provide concise, "
-            "actionable insights for retail investors. Use plain English, "
-            "avoid jargon."
-        )
-
-    # Build context as Markdown table for key metrics, bullets for others
-    def _as_table(meta: dict) -> str:
-        keys = [
-            "52WeekHigh", "52WeekLow", "DividendYield", "ForwardPE", "PEGRatio", "PriceToBookRatio", "TrailingPE"
-        ]
-        header = "| " + " | ".join(keys) + " |"
-        sep = "|" + "---|" * len(keys)
-        row = "| " + " | ".join(str(meta.get(k, "-")) for k in keys) + " |"
-        return f"\n{header}\n{sep}\n{row}\n"
+        model_role = _ROLE_DEFAULT
 
     context_blocks: List[str] = []
     for doc in docs:
@@ -187,165 +321,349 @@ def build_stock_prompt(
         filtered = _filter_metadata(meta)
         if not filtered:
             continue
-        # Overview bullets, each on its own line
-        overview_keys = ["Name", "symbol", "Sector", "Industry", "MarketCapitalization"]
-        overview = "\n".join([
-            f"- **{k}**: {filtered.get(k, '-')}" for k in overview_keys if k in filtered
-        ])
-        # Table for metrics
-        table = _as_table(filtered)
-        # Analyst sentiment, each on its own line
-        sentiment = "\n".join([
-            f"- **StrongBuy**: {filtered.get('AnalystRatingStrongBuy', '-')}\n",
-            f"- **Buy**: {filtered.get('AnalystRatingBuy', '-')}\n",
-            f"- **Hold**: {filtered.get('AnalystRatingHold', '-')}\n",
-            f"- **Sell**: {filtered.get('AnalystRatingSell', '-')}\n",
-            f"- **StrongSell**: {filtered.get('AnalystRatingStrongSell', '-')}\n"
-        ])
-        context_blocks.append(
-            f"\n## Overview\n{overview}\n\n## Key Metrics\n{table}\n\n## Analyst Sentiment\n{sentiment}\n"
+        context_blocks.append(_render_doc_block(filtered))
+
+    context_str = _BLOCK_SEPARATOR.join(context_blocks) if context_blocks else _NO_CONTEXT
+
+    instruction = _INSTRUCTIONS.get(style, _INSTRUCTIONS["markdown"])
+
+    return _assemble_prompt(model_role, context_str, question, instruction)
+
+
+# ---------------------------------------------------------------------------
+# Prefix-cache friendly chat layout
+# ---------------------------------------------------------------------------
+
+
+def _system_message(model_role: str, instruction: str) -> str:
+    return f"{model_role}\n\n{instruction}"
+
+
+def _user_message(context_str: str, question: str) -> str:
+    return f"<context>\n{context_str}\n</context>\n\nUser question: {question}"
+
+
+def build_stock_messages(
+    *,
+    docs: List[Dict],
+    question: str,
+    style: str = "markdown",
+    model_role: str | None = None,
+    max_prompt_tokens: int | None = None,
+    count_tokens: Callable[[str], int] | None = None,
+) -> List[Dict[str, str]]:
+    """Build the stock-analysis prompt as chat messages, static part first.
+
+    :func:`build_stock_prompt` puts the per-request context before the long
+    answer-format instruction, so no two prompts share a prefix.  Here the
+    system message holds only the role and the instruction - byte-identical
+    for a given ``style`` and ``model_role`` - and the context and question
+    follow in the user message, which lets provider-side prompt caching reuse
+    the prefix across requests.
+
+    Parameters are those of :func:`build_stock_prompt`.  Under a tight
+    ``max_prompt_tokens`` the budgeter may swap in the compact instruction,
+    which changes the prefix for that request.
+    """
+    role = model_role if model_role is not None else _ROLE_DEFAULT
+    if max_prompt_tokens is not None:
+        budgeted = build_stock_prompt_with_budget(
+            docs=docs,
+            question=question,
+            style=style,
+            model_role=role,
+            max_prompt_tokens=max_prompt_tokens,
+            count_tokens=count_tokens,
         )
+        context_str, instruction = budgeted.context, budgeted.instruction
+    else:
+        blocks = [
+            _render_doc_block(filtered)
+            for filtered in (_filter_metadata(doc.get("metadata", {})) for doc in docs)
+            if filtered
+        ]
+        context_str = _BLOCK_SEPARATOR.join(blocks) if blocks else _NO_CONTEXT
+        instruction = _INSTRUCTIONS.get(style, _INSTRUCTIONS["markdown"])
+    return [
+        {"role": "system", "content": _system_message(role, instruction)},
+        {"role": "user", "content": _user_message(context_str, question)},
+    ]
 
-    context_str = "\n\n---\n\n".join(context_blocks) if context_blocks else "(no metadata)"
-
-    instruction_map = {
-        "markdown": (
-            "You MUST copy the following sample format EXACTLY. Do not invent your own structure. Only use Markdown headings, bullet points, and tables as shown. Do NOT use dashes or run-on text.\n\n"
-            "Sample output (copy this format):\n"
-            "**Summary:** Apple Inc. (AAPL) is a leading technology company...\n\n"
-            "## Overview\n"
-            "- **Name**: Apple Inc.\n"
-            "- **Symbol**: AAPL\n"
-            "- **Sector**: Technology\n"
-            "- **Industry**: Electronic Computers\n"
-            "- **Market Capitalization**: $2.94 trillion\n\n"
-            "## Key Metrics\n"
-            "| 52-Week High | 52-Week Low | Dividend Yield | Forward PE | PEG Ratio | Price to Book Ratio | Trailing PE |\n"
-            "|-------------|-------------|---------------|------------|-----------|---------------------|-------------|\n"
-            "| $259.47     | $168.99     | 0.53%         | 24.45      | 1.77      | 43.75               | 30.48       |\n\n"
-            "## Analyst Sentiment\n"
-            "- **StrongBuy**: 7\n"
-            "- **Buy**: 21\n"
-            "- **Hold**: 16\n"
-            "- **Sell**: 2\n"
-            "- **StrongSell**: 1\n\n"
-            "## Risks\n"
-            "- Market volatility can impact stock price.\n"
-            "- Competition in the technology sector.\n"
-            "- Changes in consumer preferences could impact product demand.\n\n"
-            "You MUST use the same headings, table, and bullet structure. Do NOT use any other format.\n"
-        ),
-        "bullets": "Answer in short, clear bullet points for each section.",
-        "json": "Respond with a JSON object containing keys: overview, metrics, sentiment, risks.",
-    }
-    instruction = instruction_map.get(style, instruction_map["markdown"])
 
-    template = textwrap.dedent(
-        f"""
-        <system>\n{model_role}\n</system>\n\n<context>\n{context_str}\n</context>\n\nUser question: {question}\n\n{instruction}\n"""
-    ).strip()
+# ---------------------------------------------------------------------------
+# Context budgeting
+# ---------------------------------------------------------------------------
 
-    return template 
 
-def build_news_with_urls_markdown(news_items):
-    """Build markdown list of news items with clickable URLs and proper formatting."""
-    if not news_items:
-        return "No recent news found."
-    
-    md_lines = []
-    for item in news_items:
+def estimate_tokens(text: str) -> int:
+    """Dependency-free token estimate (about 4 characters per token).
+
+    Callers with a real tokenizer should pass it as ``count_tokens`` instead,
+    e.g. ``app.utils.token_counter.get_token_counter().count``.
+    """
+    return (len(text) + 3) // 4
+
+
+@dataclass
+class BudgetedPrompt:
+    """A prompt built within a token budget, plus what the budgeter did to fit it."""
+
+    prompt: str
+    prompt_tokens: int
+    max_prompt_tokens: int
+    docs_in: int
+    docs_used: int
+    docs_dropped: int
+    symbols_collapsed: int
+    truncated: bool
+    compact_instruction: bool
+    context: str = ""
+    instruction: str = ""
+
+
+def _doc_score(doc: Dict) -> float:
+    score = doc.get("score")
+    if score is None:
+        score = doc.get("metadata", {}).get("score", 0.0)
+    try:
+        return float(score)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def rank_and_collapse_docs(docs: Sequence[Dict]) -> List[Dict[str, str | int | float]]:
+    """Filtered metadata per distinct document, best score first.
+
+    Documents for the same symbol collapse into one: the best-scored document's
+    values win and the others only fill in missing keys.  Documents without a
+    symbol are deduplicated on their filtered metadata.
+    """
+    ranked = sorted(docs, key=_doc_score, reverse=True)
+    merged: Dict[str, Dict[str, str | int | float]] = {}
+    for doc in ranked:
+        filtered = _filter_metadata(doc.get("metadata", {}))
+        if not filtered:
+            continue
+        symbol = str(filtered.get("symbol", "")).strip().upper()
+        key = f"symbol:{symbol}" if symbol else "meta:" + json.dumps(filtered, sort_keys=True, default=str)
+        if key in merged:
+            for k, v in filtered.items():
+                merged[key].setdefault(k, v)
+        else:
+            merged[key] = dict(filtered)
+    return list(merged.values())
+
+
+def _truncate_block(block: str, budget: int, count_tokens: Callable[[str], int]) -> str:
+    """Longest prefix of *block*, in whole lines, that fits *budget*; '' if no section fits."""
+    lines = block.split("\n")
+    kept: List[str] = []
+    for line in lines:
+        candidate = "\n".join(kept + [line])
+        if count_tokens(candidate) > budget:
+            break
+        kept.append(line)
+    text = "\n".join(kept).rstrip()
+    # Drop a dangling heading with no content under it
+    while text and text.rsplit("\n", 1)[-1].startswith("## "):
+        text = text.rsplit("\n", 1)[0].rstrip() if "\n" in text else ""
+    return text + "\n" if text.strip() else ""
+
+
+def build_stock_prompt_with_budget(
+    *,
+    docs: List[Dict],
+    question: str,
+    max_prompt_tokens: int,
+    style: str = "markdown",
+    model_role: str | None = None,
+    count_tokens: Callable[[str], int] | None = None,
+) -> BudgetedPrompt:
+    """Build :func:`build_stock_prompt` output that fits ``max_prompt_tokens``.
+
+    Documents are ranked by ``score``, collapsed per symbol and added best
+    first; the first one that does not fit is truncated at a line boundary and
+    the rest are dropped.  If the markdown sample answer alone would crowd out
+    the context, a compact description of the same format is used instead.
+    When even the prompt without context exceeds the budget, it is returned
+    as is; check ``prompt_tokens`` against ``max_prompt_tokens``.
+    """
+    count = count_tokens or estimate_tokens
+    role = model_role if model_role is not None else _ROLE_DEFAULT
+    instruction = _INSTRUCTIONS.get(style, _INSTRUCTIONS["markdown"])
+    blocks = [_render_doc_block(meta) for meta in rank_and_collapse_docs(docs)]
+
+    compact = False
+    overhead = count(_assemble_prompt(role, "", question, instruction))
+    first_block = count(blocks[0]) if blocks else 0
+    if instruction is _INSTRUCTIONS["markdown"] and overhead + first_block > max_prompt_tokens:
+        instruction = _COMPACT_MARKDOWN_INSTRUCTION
+        compact = True
+        overhead = count(_assemble_prompt(role, "", question, instruction))
+
+    separator_tokens = count(_BLOCK_SEPARATOR)
+    remaining = max_prompt_tokens - overhead
+    used: List[str] = []
+    truncated = False
+    for block in blocks:
+        cost = count(block) + (separator_tokens if used else 0)
+        if cost <= remaining:
+            used.append(block)
+            remaining -= cost
+            continue
+        partial = _truncate_block(block, remaining - (separator_tokens if used else 0), count)
+        if partial:
+            used.append(partial)
+            truncated = True
+        break
+
+    def _render() -> str:
+        return _assemble_prompt(role, _BLOCK_SEPARATOR.join(used) if used else _NO_CONTEXT, question, instruction)
+
+    prompt = _render()
+    prompt_tokens = count(prompt)
+    # Counting the parts separately can undercount the joined prompt slightly
+    while prompt_tokens > max_prompt_tokens and used:
+        used.pop()
+        truncated = True
+        prompt = _render()
+        prompt_tokens = count(prompt)
+
+    filtered_docs = sum(1 for doc in docs if _filter_metadata(doc.get("metadata", {})))
+    return BudgetedPrompt(
+        prompt=prompt,
+        prompt_tokens=prompt_tokens,
+        max_prompt_tokens=max_prompt_tokens,
+        docs_in=len(docs),
+        docs_used=len(used),
+        docs_dropped=len(blocks) - len(used),
+        symbols_collapsed=filtered_docs - len(blocks),
+        truncated=truncated,
+        compact_instruction=compact,
+        context=_BLOCK_SEPARATOR.join(used) if used else _NO_CONTEXT,
+        instruction=instruction,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Section builders
+#
+# The iter_* builders yield the markdown in chunks (one per item or row), so a
+# caller can pass them straight to ``StreamingResponse`` and never hold more
+# than one row in memory; ``max_items`` caps how many items are emitted.  The
+# build_* functions join the chunks and return exactly what they always did.
+# ---------------------------------------------------------------------------
+
+
+def iter_news_with_urls_markdown(news_items, max_items: int | None = None) -> Iterator[str]:
+    """Yield the markdown list of news items, one chunk per item."""
+    emitted = 0
+    for item in news_items or ():
+        if max_items is not None and emitted >= max_items:
+            break
         title = item.get("title", "")
+        if not title:
+            continue
         url = item.get("url", "")
         source = item.get("source", "")
         published_at = item.get("published_at", "")
-        
-        if not title:
-            continue
-            
-        # Format the news item with proper markdown
-        if url:
-            # Create clickable link with bold title
-            md_lines.append(f"- **[{title}]({url})**")
-        else:
-            # Just bold title if no URL
-            md_lines.append(f"- **{title}**")
-        
+
+        # Clickable link with bold title, or just the bold title if no URL
+        line = f"- **[{title}]({url})**" if url else f"- **{title}**"
+
         # Add source and date if available
         metadata = []
         if source:
             metadata.append(f"Source: {source}")
         if published_at:
             metadata.append(f"Published: {published_at}")
-        
         if metadata:
-            md_lines.append(f"  ({', '.join(metadata)})")
-    
-    return "\n".join(md_lines) if md_lines else "No recent news found."
+            line = f"{line}\n  ({', '.join(metadata)})"
 
-def build_reddit_sentiment_markdown(reddit_data):
-    """Build markdown table for Reddit sentiment with detailed information."""
+        yield line if not emitted else "\n" + line
+        emitted += 1
+
+    if not emitted:
+        yield "No recent news found."
+
+
+def build_news_with_urls_markdown(news_items):
+    """Build markdown list of news items with clickable URLs and proper formatting."""
+    return "".join(iter_news_with_urls_markdown(news_items))
+
+
+def iter_reddit_sentiment_markdown(reddit_data, max_items: int = 3) -> Iterator[str]:
+    """Yield the Reddit sentiment markdown: the summary, then one chunk per top post."""
     if not reddit_data or isinstance(reddit_data, str):
-        return "No Reddit sentiment data available."
-    
+        yield "No Reddit sentiment data available."
+        return
+
     if "error" in reddit_data:
-        return f"Reddit sentiment error: {reddit_data['error']}"
-    
+        yield f"Reddit sentiment error: {reddit_data['error']}"
+        return
+
     sentiment_summary = reddit_data.get("sentiment_summary", {})
     posts = reddit_data.get("posts", [])
     total_posts = reddit_data.get("total_posts_analyzed", len(posts))
-    
+
     if not sentiment_summary:
-        return "No Reddit sentiment data available."
-    
-    # Build sentiment summary with better formatting
-    md_lines = []
-    
+        yield "No Reddit sentiment data available."
+        return
+
     positive = sentiment_summary.get("positive", 0)
     neutral = sentiment_summary.get("neutral", 0)
     negative = sentiment_summary.get("negative", 0)
-    
-    # Add total post count
-    md_lines.append(f"**Total Posts Analyzed**: {total_posts}")
-    md_lines.append("")
-    
-    # Format as bullet points instead of table
-    md_lines.append(f"- **Positive**: {positive:.1%}")
-    md_lines.append(f"- **Neutral**: {neutral:.1%}")
-    md_lines.append(f"- **Negative**: {negative:.1%}")
-    
+
+    # Total post count, then the split as bullet points instead of a table
+    yield (
+        f"**Total Posts Analyzed**: {total_posts}\n\n"
+        f"- **Positive**: {positive:.1%}\n"
+        f"- **Neutral**: {neutral:.1%}\n"
+        f"- **Negative**: {negative:.1%}"
+    )
+
     # Add sentiment interpretation
     total = positive + neutral + negative
-    if total > 0:
-        dominant_sentiment = max(sentiment_summary.items(), key=lambda x: x[1])[0]
-        sentiment_percentage = sentiment_summary[dominant_sentiment] * 100
-        
-        md_lines.append(f"\n**Overall Sentiment**: {dominant_sentiment.title()} ({sentiment_percentage:.1f}%)")
-        
-        # Add top posts if available
-        if posts:
-            md_lines.append(f"\n**Top Posts**:")
-            for i, post in enumerate(posts[:3], 1):
-                title = post.get("title", "")[:80] + "..." if len(post.get("title", "")) > 80 else post.get("title", "")
-                sentiment = post.get("sentiment", "neutral")
-                score = post.get("score", 0)
-                engagement = post.get("engagement_score", 0)
-                url = post.get("url", "")
-                
-                # Create clickable link if URL is available
-                if url:
-                    md_lines.append(f"{i}. **[{title}]({url})** ({sentiment}, score: {score}, engagement: {engagement:.1f})")
-                else:
-                    md_lines.append(f"{i}. **{title}** ({sentiment}, score: {score}, engagement: {engagement:.1f})")
-    
-    return "\n".join(md_lines)
+    if total <= 0:
+        return
+    dominant_sentiment = max(sentiment_summary.items(), key=lambda x: x[1])[0]
+    sentiment_percentage = sentiment_summary[dominant_sentiment] * 100
+    yield f"\n\n**Overall Sentiment**: {dominant_sentiment.title()} ({sentiment_percentage:.1f}%)"
 
-def build_sec_filing_summary_markdown(symbol, filings):
+    # Add top posts if available
+    if not posts:
+        return
+    yield "\n\n**Top Posts**:"
+    for i, post in enumerate(posts[:max_items], 1):
+        title = post.get("title", "")[:80] + "..." if len(post.get("title", "")) > 80 else post.get("title", "")
+        sentiment = post.get("sentiment", "neutral")
+        score = post.get("score", 0)
+        engagement = post.get("engagement_score", 0)
+        url = post.get("url", "")
+
+        # Create clickable link if URL is available
+        if url:
+            yield f"\n{i}. **[{title}]({url})** ({sentiment}, score: {score}, engagement: {engagement:.1f})"
+        else:
+            yield f"\n{i}. **{title}** ({sentiment}, score: {score}, engagement: {engagement:.1f})"
+
+
+def build_reddit_sentiment_markdown(reddit_data):
+    """Build markdown table for Reddit sentiment with detailed information."""
+    return "".join(iter_reddit_sentiment_markdown(reddit_data))
+
+
+def iter_sec_filing_summary_markdown(symbol, filings, max_items: int | None = None) -> Iterator[str]:
+    """Yield the SEC filings markdown table: the header, then one chunk per row."""
     if not filings:
-        return f"### SEC Filings for {symbol}\nNo recent filings found."
+        yield f"### SEC Filings for {symbol}\nNo recent filings found."
+        return
 
-    md = f"### SEC Filings for {symbol}\n\n"
-    md += "| Date/File | Type | Summary/Preview |\n|---|---|---|\n"
+    yield f"### SEC Filings for {symbol}\n\n| Date/File | Type | Summary/Preview |\n|---|---|---|\n"
+    rows = 0
     for filing in filings:
+        if max_items is not None and rows >= max_items:
+            break
         # Use available fields, fallback to alternatives
         date_or_file = filing.get('date') or filing.get('file_path', '')
         type_ = filing.get('type') or filing.get('filing_type', '')
@@ -353,8 +671,12 @@ def build_sec_filing_summary_markdown(symbol, filings):
         # If all are empty, skip the row
         if not (date_or_file or type_ or summary):
             continue
-        md += f"| {date_or_file} | {type_} | {summary} |\n"
+        yield f"| {date_or_file} | {type_} | {summary} |\n"
+        rows += 1
     # If no rows were added, show a message
-    if md.strip().endswith('|---|---|---|'):
-        md += "| No filings with displayable metadata found. | | |\n"
-    return md 
\ No newline at end of file
+    if not rows:
+        yield "| No filings with displayable metadata found. | | |\n"
+
+
+def build_sec_filing_summary_markdown(symbol, filings):
+    return "".join(iter_sec_filing_summary_markdown(symbol, filings))
@@ -5,34 +5,153 @@ TODO: Quota/Billing Plan Needed!
 - Consider per-user, per-plan, and abuse prevention strategies.
 - See planning docs for details.
 
-In-memory rate limiter for FastAPI endpoints, keyed by user ID (authenticated) or IP (unauthenticated).
-Returns HTTP 429 if the limit is exceeded. See PLANNING.md Phase 4.
-Replace with Redis or distributed rate limiter for production.
+Rate limiter for FastAPI endpoints, keyed by user ID (authenticated) or IP (unauthenticated).
+
+Every request is charged against a token-bucket policy (a Limit: ``rate``
+requests per ``period`` seconds, bursts of up to ``burst``), picked by route
+and by plan (``request.state.plan``, else ``user`` / ``anonymous``). Responses
+carry ``X-RateLimit-Limit`` / ``-Remaining`` / ``-Reset`` headers; rejected
+requests get HTTP 429 with ``Retry-After`` so clients know when to come back.
+See PLANNING.md Phase 4.
+
+State lives in the shared limiter backend (RATE_LIMIT_BACKEND), so the limit
+holds across all workers when a file or redis backend is configured. Each
+request costs one atomic backend call, which also returns the remaining units.
+The memory backend is charged inline on the event loop (no I/O, no awaits; its
+lock is only held for the bucket update, since it is shared with threads); the
+file and redis backends run in the threadpool so their I/O never blocks it.
+
+Policies per plan come from RATE_LIMIT_POLICIES, a JSON object such as
+``{"anonymous": {"rate": 30, "period": 60, "burst": 10}, "pro": {"rate": 600}}``.
+Without it, RATE_LIMIT_INTERVAL_USER / RATE_LIMIT_INTERVAL_IP (falling back to
+RATE_LIMIT_INTERVAL) allow one request per interval for ``user`` / ``anonymous``.
 """
-import time
+import json
+import math
 import os
-from fastapi import Request, HTTPException
-from threading import Lock
+from typing import Dict, Mapping, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.limiter_backends import MemoryLimiterBackend, get_limiter_backend
+from app.utils.token_bucket import Limit
+
+# Policy table entry used when the request's plan has none of its own
+DEFAULT_PLAN = "default"
+
+# plan -> policy
+Policies = Mapping[str, Limit]
+
+
+def policy(rate: float, period: float = 60.0, burst: Optional[float] = None) -> Limit:
+    """A budget of *rate* requests per *period* seconds, allowing bursts of up to *burst* requests."""
+    return Limit("requests", rate, period, burst)
+
+
+def load_policies() -> Dict[str, Limit]:
+    """Read the per-plan policies from the environment (see module docstring)."""
+    raw = os.getenv("RATE_LIMIT_POLICIES")
+    if raw:
+        try:
+            return {
+                plan: policy(
+                    float(spec["rate"]),
+                    float(spec.get("period", 60.0)),
+                    float(spec["burst"]) if spec.get("burst") is not None else None,
+                )
+                for plan, spec in json.loads(raw).items()
+            }
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            raise ValueError(f"Invalid RATE_LIMIT_POLICIES: {e}") from e
+    interval = os.getenv("RATE_LIMIT_INTERVAL", "0")
+    user_interval = float(os.getenv("RATE_LIMIT_INTERVAL_USER", interval))
+    ip_interval = float(os.getenv("RATE_LIMIT_INTERVAL_IP", interval))
+    # "One request per interval" is a bucket of size 1 refilling once per interval
+    policies = {}
+    if user_interval > 0:
+        policies["user"] = policy(1, user_interval, burst=1)
+    if ip_interval > 0:
+        policies["anonymous"] = policy(1, ip_interval, burst=1)
+    return policies
+
+
+def rate_limit_headers(limit: Limit, available: float, retry_after: Optional[float] = None) -> Dict[str, str]:
+    """Response headers for a bucket holding *available* units; ``Retry-After`` when rejected."""
+    reset = max(0.0, (limit.capacity - available) / limit.per_second)
+    headers = {
+        "X-RateLimit-Limit": f"{limit.capacity:g}",
+        "X-RateLimit-Remaining": str(max(0, math.floor(available))),
+        "X-RateLimit-Reset": str(math.ceil(reset)),
+    }
+    if retry_after is not None:
+        headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return headers
+
 
 class RateLimiter:
-    def __init__(self):
-        # Allow separate intervals for user and IP
-        self.user_interval = float(os.getenv("RATE_LIMIT_INTERVAL_USER", os.getenv("RATE_LIMIT_INTERVAL", "0")))
-        self.ip_interval = float(os.getenv("RATE_LIMIT_INTERVAL_IP", os.getenv("RATE_LIMIT_INTERVAL", "0")))
-        self._store = {}
-        self._lock = Lock()
-
-    async def __call__(self, request: Request):
+    """
+    FastAPI dependency enforcing per-route, per-plan request budgets.
+
+    Args:
+        policies: plan -> policy applied on every route, one budget shared across
+            routes; defaults to load_policies()
+        routes: route path (as declared, e.g. ``/ai/analyze``) -> plan -> policy;
+            each route listed here gets its own budget
+        backend: Limiter backend; defaults to get_limiter_backend()
+        cost: Units one request takes from its bucket
+
+    A plan without an entry falls back to the table's DEFAULT_PLAN entry; no
+    policy at all means the request is not limited.
+    """
+
+    def __init__(
+        self,
+        policies: Optional[Policies] = None,
+        routes: Optional[Mapping[str, Policies]] = None,
+        backend=None,
+        cost: float = 1.0
+    ):
+        self.policies = dict(load_policies() if policies is None else policies)
+        self.routes = {route: dict(table) for route, table in (routes or {}).items()}
+        self.backend = backend if backend is not None else get_limiter_backend()
+        self.cost = cost
+        self._inline = isinstance(self.backend, MemoryLimiterBackend)
+
+    def resolve(self, request: Request) -> Tuple[str, Optional[Limit]]:
+        """Bucket key and policy for *request* (policy None when it is not limited)."""
         user_id = getattr(request.state, "user_id", None)
+        plan = getattr(request.state, "plan", None) or ("user" if user_id else "anonymous")
         if user_id:
-            key = f"user:{user_id}"
-            interval = self.user_interval
+            identity = f"user:{user_id}"
+        else:
+            identity = f"ip:{request.client.host if request.client else 'unknown'}"
+        route = getattr(request.scope.get("route"), "path", None) or request.url.path
+        table = self.routes.get(route)
+        if table is not None:
+            limit = table.get(plan, table.get(DEFAULT_PLAN))
+            if limit is not None:
+                return f"endpoint:{route}:{identity}", limit
+        return f"endpoint:{identity}", self.policies.get(plan, self.policies.get(DEFAULT_PLAN))
+
+    def _charge(self, key: str, limit: Limit) -> Tuple[float, Optional[float]]:
+        """Take one request from *key*'s bucket; return (units left, seconds to wait if rejected)."""
+        wait, tokens = self.backend.try_reserve(key, [(limit, self.cost)])
+        return tokens[0], wait if wait > 0 else None
+
+    async def __call__(self, request: Request, response: Response):
+        key, limit = self.resolve(request)
+        if limit is None:
+            return
+        if self._inline:
+            available, retry_after = self._charge(key, limit)
         else:
-            key = f"ip:{request.client.host}"
-            interval = self.ip_interval
-        now = time.time()
-        with self._lock:
-            last_call = self._store.get(key, 0)
-            if now - last_call < interval:
-                raise HTTPException(status_code=429, detail=f"Rate limit exceeded: {interval}s between requests")
-            self._store[key] = now 
\ No newline at end of file
+            available, retry_after = await run_in_threadpool(self._charge, key, limit)
+        headers = rate_limit_headers(limit, available, retry_after)
+        if retry_after is not None:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Rate limit exceeded: retry in {headers['Retry-After']}s",
+                headers=headers,
+            )
+        response.headers.update(headers)
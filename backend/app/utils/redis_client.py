@@ -0,0 +1,17 @@
+"""
+Shared Redis client factory.
+
+redis is only imported when a Redis-backed feature is configured, so
+deployments without Redis do not need the package.
+"""
+from functools import lru_cache
+
+
+@lru_cache()
+def get_redis_client(url: str):
+    """Get a cached redis-py client for *url* (connections are opened lazily and pooled)."""
+    try:
+        import redis
+    except ImportError as e:
+        raise ImportError("The 'redis' package is required for Redis-backed rate limiting/caching. Install it with `pip install redis`.") from e
+    return redis.Redis.from_url(url)
@@ -0,0 +1,165 @@
+"""Section-level render cache for markdown reports such as ``SUMMARY_TEMPLATE``.
+
+The sections of a stock report change at very different rates: the company
+overview and key metrics move monthly, while news, SEC filings and Reddit
+sentiment change minute to minute.  :class:`ReportRenderer` splits a template
+at its ``## `` headings, hashes the inputs of each section and only re-renders
+(and re-runs the markdown builders for) sections whose inputs changed; the
+cached section strings are then spliced back together with one join.
+
+Like :mod:`app.utils.prompt_builder` this module has no external runtime deps.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Mapping, Sequence, Tuple
+
+from app.utils.prompt_builder import (
+    SUMMARY_TEMPLATE,
+    build_news_with_urls_markdown,
+    build_reddit_sentiment_markdown,
+    build_sec_filing_summary_markdown,
+    compile_template,
+)
+
+# placeholder -> (raw context keys it is built from, builder)
+SectionBuilder = Tuple[Sequence[str], Callable[..., str]]
+
+DEFAULT_SECTION_BUILDERS: Dict[str, SectionBuilder] = {
+    "news_with_urls": (("news_items",), build_news_with_urls_markdown),
+    "sec_filings_table": (("symbol", "sec_filings"), build_sec_filing_summary_markdown),
+    "reddit_sentiment": (("reddit_data",), build_reddit_sentiment_markdown),
+}
+
+_SECTION_SPLIT_RE = re.compile(r"(?m)^(?=## )")
+
+
+def split_sections(template: str) -> List[Tuple[str, str]]:
+    """Split *template* at ``## `` headings into ``(name, text)`` pairs.
+
+    The text before the first heading is named ``header``.  Joining the texts
+    gives back *template* unchanged.
+    """
+    sections = []
+    for text in _SECTION_SPLIT_RE.split(template):
+        if not text:
+            continue
+        name = text[3:].split("\n", 1)[0].strip() if text.startswith("## ") else "header"
+        sections.append((name, text))
+    return sections
+
+
+class _Section:
+    __slots__ = ("index", "name", "compiled", "inputs")
+
+    def __init__(self, index: int, name: str, text: str, builders: Mapping[str, SectionBuilder]):
+        self.index = index
+        self.name = name
+        self.compiled = compile_template(text)
+        # Context keys whose values decide this section's output
+        inputs: List[str] = []
+        for key in self.compiled.keys:
+            for dep in (key, *builders.get(key, ((), None))[0]):
+                if dep not in inputs:
+                    inputs.append(dep)
+        self.inputs = tuple(inputs)
+
+
+class ReportRenderer:
+    """Renders a report template section by section, caching each section's output.
+
+    Parameters
+    ----------
+    template
+        Report template with ``{{placeholders}}`` and ``## `` section headings.
+    builders
+        Placeholders computed from raw context values, e.g. ``news_with_urls``
+        from ``news_items``.  A placeholder already present in the context is
+        used as is.  Defaults to :data:`DEFAULT_SECTION_BUILDERS`.
+    max_entries
+        Cached section renders kept (least recently used are evicted first).
+    """
+
+    def __init__(
+        self,
+        template: str = SUMMARY_TEMPLATE,
+        builders: Mapping[str, SectionBuilder] | None = None,
+        max_entries: int = 1024,
+    ):
+        self.builders = dict(DEFAULT_SECTION_BUILDERS if builders is None else builders)
+        self.sections = [
+            _Section(index, name, text, self.builders) for index, (name, text) in enumerate(split_sections(template))
+        ]
+        self.max_entries = max_entries
+        self._cache: OrderedDict[Tuple[int, str], str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = {section.name: 0 for section in self.sections}
+        self._misses = {section.name: 0 for section in self.sections}
+
+    @staticmethod
+    def _digest(section: _Section, context: Mapping[str, Any]) -> str:
+        values = [(key, key in context, context.get(key)) for key in section.inputs]
+        try:
+            # Pickling plain data is several times faster than JSON; equal bytes imply
+            # equal inputs, and differently ordered but equal dicts only cost a miss
+            payload = pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            payload = json.dumps(values, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def _resolve(self, section: _Section, context: Mapping[str, Any]) -> Dict[str, Any]:
+        values: Dict[str, Any] = {}
+        for key in section.compiled.keys:
+            if key in context:
+                values[key] = context[key]
+                continue
+            builder = self.builders.get(key)
+            if builder is None:
+                continue
+            deps, build = builder
+            if all(dep in context for dep in deps):
+                values[key] = build(*(context[dep] for dep in deps))
+        return values
+
+    def _render_section(self, section: _Section, context: Mapping[str, Any]) -> str:
+        key = (section.index, self._digest(section, context))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self._hits[section.name] += 1
+                return cached
+            self._misses[section.name] += 1
+        rendered = section.compiled.render(self._resolve(section, context))
+        with self._lock:
+            self._cache[key] = rendered
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return rendered
+
+    def render(self, context: Mapping[str, Any]) -> str:
+        """Render the report; same output as ``build_markdown_report`` on the resolved context."""
+        return "".join(self._render_section(section, context) for section in self.sections)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sections = {}
+            for section in self.sections:
+                hits, misses = self._hits[section.name], self._misses[section.name]
+                sections[section.name] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                }
+            return {"entries": len(self._cache), "max_entries": self.max_entries, "sections": sections}
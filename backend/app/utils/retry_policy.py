@@ -0,0 +1,272 @@
+"""
+Retry engine for upstream LLM calls.
+
+- Errors are classified: transport failures, timeouts, 408/409/425/429 and 5xx
+  are retried; other 4xx, quota exhaustion and anything unrecognised (including
+  our own local rate-limit errors) fail immediately.
+- Server hints win: ``retry-after-ms``, ``Retry-After`` (seconds or HTTP date)
+  and OpenAI's ``x-ratelimit-reset-requests`` / ``x-ratelimit-reset-tokens``.
+- Otherwise delays use decorrelated jitter, so synchronized clients spread out.
+- A RetryBudget caps retries to a fraction of recent requests, so a brownout
+  upstream does not get multiplied load from retry storms.
+"""
+import asyncio
+import functools
+import logging
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Tuple
+
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+
+_DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """Parse OpenAI reset durations such as ``"20ms"``, ``"1.5s"`` or ``"6m0s"`` (plain numbers are seconds)."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART_RE.findall(value)
+    if not parts or "".join(n + u for n, u in parts) != value:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def retry_after_from_headers(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Seconds the server asked us to wait, or None if the response carries no hint."""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    # Wait for whichever exhausted budget resets last
+    resets = []
+    for kind in ("requests", "tokens"):
+        reset = headers.get(f"x-ratelimit-reset-{kind}")
+        if reset and headers.get(f"x-ratelimit-remaining-{kind}", "0") in ("0", "0.0"):
+            seconds = parse_duration(reset)
+            if seconds is not None:
+                resets.append(seconds)
+    return max(resets) if resets else None
+
+
+def _status_and_headers(exc: BaseException) -> Tuple[Optional[int], Optional[Mapping[str, str]]]:
+    response = getattr(exc, "response", None)
+    status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+    headers = getattr(response, "headers", None)
+    return status, headers
+
+
+def classify_error(exc: BaseException) -> Tuple[bool, Optional[float]]:
+    """
+    Decide whether *exc* is worth retrying.
+
+    Returns:
+        (retryable, retry_after) where retry_after is the server-requested wait in seconds, if any
+    """
+    if isinstance(exc, (openai.APIConnectionError, httpx.TransportError)):
+        return True, None
+    status, headers = _status_and_headers(exc)
+    if status is None:
+        return False, None
+    if status == 429 and getattr(exc, "code", None) == "insufficient_quota":
+        # Billing problem, not throttling; retrying cannot succeed
+        return False, None
+    retryable = status in RETRYABLE_STATUS_CODES or status >= 500
+    return retryable, retry_after_from_headers(headers) if retryable else None
+
+
+class RetryBudget:
+    """
+    Caps retries at ``ratio`` of the requests seen in the last ``window`` seconds.
+
+    ``min_retries`` retries are always allowed per window so that low-traffic
+    callers can still recover from a single blip. Counts live in ten rotating
+    sub-windows, so bookkeeping is O(1).
+    """
+
+    _SLOTS = 10
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10, window: float = 10.0, clock=time.monotonic):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._slot_width = window / self._SLOTS
+        self._requests = [0] * self._SLOTS
+        self._retries = [0] * self._SLOTS
+        self._epoch = int(clock() / self._slot_width)
+        self.denied = 0
+
+    def _rotate(self) -> int:
+        epoch = int(self._clock() / self._slot_width)
+        stale = min(self._SLOTS, epoch - self._epoch)
+        for i in range(1, stale + 1):
+            slot = (self._epoch + i) % self._SLOTS
+            self._requests[slot] = 0
+            self._retries[slot] = 0
+        self._epoch = epoch
+        return epoch % self._SLOTS
+
+    def record_request(self) -> None:
+        with self._lock:
+            self._requests[self._rotate()] += 1
+
+    def try_spend(self) -> bool:
+        """Take one retry from the budget; False if the budget is exhausted."""
+        with self._lock:
+            slot = self._rotate()
+            if sum(self._retries) >= self.min_retries + self.ratio * sum(self._requests):
+                self.denied += 1
+                return False
+            self._retries[slot] += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._rotate()
+            return {
+                "requests": sum(self._requests),
+                "retries": sum(self._retries),
+                "denied": self.denied,
+                "ratio": self.ratio,
+                "window": self.window,
+            }
+
+
+class RetryState:
+    """Per-call retry bookkeeping handed out by RetryPolicy.start()."""
+
+    def __init__(self, policy: "RetryPolicy"):
+        self.policy = policy
+        self.attempt = 1
+        self._previous_delay = policy.base_delay
+
+    def backoff(self, exc: BaseException) -> Optional[float]:
+        """
+        Seconds to wait before the next attempt after *exc*, or None to give up and re-raise.
+        """
+        policy = self.policy
+        retryable, retry_after = policy.classify(exc)
+        if not retryable or self.attempt >= policy.max_attempts:
+            return None
+        if retry_after is not None and retry_after > policy.max_retry_after:
+            logger.warning(f"[Retry] Server asked to wait {retry_after:.1f}s, longer than allowed; giving up")
+            return None
+        if policy.budget is not None and not policy.budget.try_spend():
+            logger.warning("[Retry] Retry budget exhausted; not retrying")
+            return None
+        # Decorrelated jitter: uniform between the base delay and 3x the previous delay
+        delay = min(policy.max_delay, random.uniform(policy.base_delay, self._previous_delay * 3))
+        self._previous_delay = delay
+        if retry_after is not None:
+            # Honour the server's hint, with a little jitter so waiters do not return in lockstep
+            delay = retry_after * random.uniform(1.0, 1.1)
+        self.attempt += 1
+        policy.retries += 1
+        return delay
+
+
+class RetryPolicy:
+    """
+    Retry policy for upstream calls; usable directly or as a decorator on sync and async functions.
+
+    Args:
+        max_attempts: Total attempts including the first one
+        base_delay: Minimum delay between attempts, in seconds
+        max_delay: Maximum jittered delay, in seconds
+        max_retry_after: Give up instead of waiting when the server asks for longer than this
+        budget: Shared RetryBudget; None disables the budget
+        classify: Error classifier returning (retryable, retry_after)
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        max_retry_after: float = 60.0,
+        budget: Optional[RetryBudget] = None,
+        classify: Callable[[BaseException], Tuple[bool, Optional[float]]] = classify_error
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.budget = budget
+        self.classify = classify
+        self.retries = 0
+
+    def start(self) -> RetryState:
+        """Begin one logical call (counted against the budget's request total)."""
+        if self.budget is not None:
+            self.budget.record_request()
+        return RetryState(self)
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        state = self.start()
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                delay = state.backoff(e)
+                if delay is None:
+                    raise
+                logger.warning(f"[Retry] {type(e).__name__}: {e}; attempt {state.attempt} in {delay:.2f}s")
+                time.sleep(delay)
+
+    async def acall(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        state = self.start()
+        while True:
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                delay = state.backoff(e)
+                if delay is None:
+                    raise
+                logger.warning(f"[Retry] {type(e).__name__}: {e}; attempt {state.attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def __call__(self, func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await self.acall(func, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        return wrapper
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "max_attempts": self.max_attempts,
+            "budget": self.budget.stats() if self.budget is not None else None,
+        }
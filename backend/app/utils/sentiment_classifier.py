@@ -0,0 +1,345 @@
+"""
+Local sentiment classification: a fast path in front of the LLM.
+
+Most Reddit and news text is clearly positive or negative, so it does not need
+a chat completion. Two local scorers produce a label plus a confidence:
+
+- LexiconSentimentScorer: weighted finance/social lexicon with negation,
+  scored for a whole batch at once with NumPy
+- EmbeddingSentimentModel: multinomial logistic regression over (cached)
+  text embeddings, trained on LLM labels
+
+LocalSentimentClassifier combines them and returns None for texts below its
+confidence threshold; callers escalate exactly those texts to the LLM.
+
+Run ``python -m app.utils.sentiment_classifier --help`` for the calibration
+harness, which measures agreement with LLM labels and the throughput gained.
+"""
+import json
+import logging
+import re
+import time
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LABELS = ("negative", "neutral", "positive")
+
+_TOKEN_RE = re.compile(r"[a-z0-9$%']+(?:-[a-z]+)?|[\U0001F300-\U0001FAFF☀-➿]")
+
+# Weights in roughly [-2, 2]; strong market slang gets the larger magnitudes
+DEFAULT_LEXICON: Dict[str, float] = {
+    # positive
+    "good": 1.0, "great": 1.5, "excellent": 2.0, "strong": 1.0, "stronger": 1.0, "strongest": 1.5,
+    "beat": 1.5, "beats": 1.5, "surge": 1.5, "surged": 1.5, "surges": 1.5, "soar": 2.0, "soared": 2.0,
+    "soaring": 2.0, "rally": 1.5, "rallied": 1.5, "rallies": 1.5, "gain": 1.0, "gains": 1.0, "gained": 1.0,
+    "up": 0.5, "upside": 1.0, "upgrade": 1.5, "upgraded": 1.5, "outperform": 1.5, "outperformed": 1.5,
+    "bull": 1.5, "bullish": 2.0, "buy": 1.0, "buying": 1.0, "long": 0.5, "calls": 1.0, "moon": 2.0,
+    "mooning": 2.0, "rocket": 1.5, "tendies": 1.5, "profit": 1.0, "profits": 1.0, "profitable": 1.5,
+    "record": 1.0, "growth": 1.0, "growing": 1.0, "grow": 1.0, "love": 1.5, "amazing": 2.0,
+    "optimistic": 1.5, "positive": 1.0, "win": 1.0, "winning": 1.0, "winner": 1.5, "breakout": 1.5,
+    "undervalued": 1.5, "cheap": 0.5, "recovery": 1.0, "recovering": 1.0, "rebound": 1.0, "exceeded": 1.5,
+    "raised": 0.5, "raises": 0.5, "dividend": 0.5, "\U0001F680": 2.0, "\U0001F4C8": 1.5, "\U0001F48E": 1.0,
+    # negative
+    "bad": -1.0, "terrible": -2.0, "awful": -2.0, "weak": -1.0, "weaker": -1.0, "miss": -1.5,
+    "missed": -1.5, "misses": -1.5, "plunge": -2.0, "plunged": -2.0, "plunges": -2.0, "crash": -2.0,
+    "crashed": -2.0, "crashing": -2.0, "drop": -1.0, "dropped": -1.0, "drops": -1.0, "fall": -1.0,
+    "fell": -1.0, "falling": -1.0, "down": -0.5, "downside": -1.0, "downgrade": -1.5, "downgraded": -1.5,
+    "underperform": -1.5, "bear": -1.5, "bearish": -2.0, "sell": -1.0, "selling": -1.0, "selloff": -1.5,
+    "sell-off": -1.5, "short": -0.5, "puts": -1.0, "dump": -1.5, "dumping": -1.5, "bagholder": -1.5,
+    "bagholders": -1.5, "loss": -1.0, "losses": -1.0, "lost": -1.0, "lose": -1.0, "losing": -1.0,
+    "decline": -1.0, "declined": -1.0, "declines": -1.0, "fraud": -2.0, "lawsuit": -1.5, "scam": -2.0,
+    "bankrupt": -2.0, "bankruptcy": -2.0, "layoffs": -1.5, "recession": -1.5, "overvalued": -1.5,
+    "worst": -2.0, "hate": -1.5, "pessimistic": -1.5, "negative": -1.0, "warning": -1.0, "risk": -0.5,
+    "risky": -1.0, "debt": -0.5, "cut": -0.5, "cuts": -0.5, "slump": -1.5, "tank": -1.5, "tanked": -1.5,
+    "tanking": -1.5, "rugpull": -2.0, "\U0001F4C9": -1.5, "\U0001F921": -1.0,
+}
+
+DEFAULT_NEGATIONS = ("not", "no", "never", "isn't", "wasn't", "don't", "doesn't", "didn't", "won't", "can't", "without")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class LexiconSentimentScorer:
+    """
+    Weighted lexicon scorer, vectorized over a batch of texts.
+
+    A term directly after a negation has its weight flipped. Confidence grows
+    with the net polarity and shrinks when positive and negative terms mix.
+
+    Args:
+        lexicon: term -> weight (positive terms > 0, negative terms < 0)
+        negations: terms that flip the weight of the following term
+    """
+
+    def __init__(self, lexicon: Optional[Mapping[str, float]] = None, negations: Sequence[str] = DEFAULT_NEGATIONS):
+        lexicon = DEFAULT_LEXICON if lexicon is None else lexicon
+        # Index 0 is the "unknown term" slot with weight 0
+        self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(lexicon, 1)}
+        self.weights = np.zeros(len(self.vocabulary) + 1 + len(negations), dtype=np.float64)
+        self.weights[1:len(lexicon) + 1] = list(lexicon.values())
+        self._negation_ids = np.arange(len(lexicon) + 1, len(lexicon) + 1 + len(negations))
+        for offset, term in enumerate(negations):
+            self.vocabulary[term] = len(lexicon) + 1 + offset
+
+    def score(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score *texts*.
+
+        Returns:
+            (positive mass, negative mass) per text, both >= 0
+        """
+        vocabulary = self.vocabulary
+        ids: List[int] = []
+        docs: List[int] = []
+        for doc, text in enumerate(texts):
+            tokens = [vocabulary.get(token, 0) for token in tokenize(text)]
+            ids.extend(tokens)
+            docs.extend([doc] * len(tokens))
+        n = len(texts)
+        if not ids:
+            return np.zeros(n), np.zeros(n)
+        ids_arr = np.asarray(ids, dtype=np.int64)
+        docs_arr = np.asarray(docs, dtype=np.int64)
+        weights = self.weights[ids_arr]
+        is_negation = np.isin(ids_arr, self._negation_ids)
+        negated = np.zeros(len(ids_arr), dtype=bool)
+        negated[1:] = is_negation[:-1] & (docs_arr[1:] == docs_arr[:-1])
+        weights = np.where(negated, -weights, weights)
+        positive = np.bincount(docs_arr, weights=np.clip(weights, 0, None), minlength=n)
+        negative = np.bincount(docs_arr, weights=np.clip(-weights, 0, None), minlength=n)
+        return positive, negative
+
+    def predict(self, texts: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+        """
+        Label *texts* with a confidence in [0, 1].
+
+        Texts without any lexicon term come back 'neutral' with confidence 0.
+        """
+        positive, negative = self.score(texts)
+        margin = positive - negative
+        total = positive + negative
+        with np.errstate(divide="ignore", invalid="ignore"):
+            purity = np.where(total > 0, np.abs(margin) / total, 0.0)
+        confidence = np.tanh(np.abs(margin)) * purity
+        labels = np.where(margin > 0, "positive", np.where(margin < 0, "negative", "neutral"))
+        return labels.tolist(), confidence
+
+
+class EmbeddingSentimentModel:
+    """
+    Multinomial logistic regression over text embeddings.
+
+    Train it on texts the LLM already labelled; prediction is one matrix product.
+    """
+
+    def __init__(self, weights: Optional[np.ndarray] = None, bias: Optional[np.ndarray] = None):
+        self.weights = weights
+        self.bias = bias
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.weights is not None
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def fit(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        labels: Sequence[str],
+        epochs: int = 300,
+        learning_rate: float = 0.5,
+        l2: float = 1e-3
+    ) -> "EmbeddingSentimentModel":
+        """Fit with full-batch gradient descent on the cross-entropy loss."""
+        x = np.asarray(embeddings, dtype=np.float64)
+        y = np.asarray([LABELS.index(label) for label in labels])
+        targets = np.eye(len(LABELS))[y]
+        self.weights = np.zeros((x.shape[1], len(LABELS)))
+        self.bias = np.zeros(len(LABELS))
+        for _ in range(epochs):
+            error = self._softmax(x @ self.weights + self.bias) - targets
+            self.weights -= learning_rate * (x.T @ error / len(x) + l2 * self.weights)
+            self.bias -= learning_rate * error.mean(axis=0)
+        return self
+
+    def predict_proba(self, embeddings: Sequence[Sequence[float]]) -> np.ndarray:
+        if not self.is_fitted:
+            raise ValueError("EmbeddingSentimentModel is not fitted")
+        return self._softmax(np.asarray(embeddings, dtype=np.float64) @ self.weights + self.bias)
+
+    def predict(self, embeddings: Sequence[Sequence[float]]) -> Tuple[List[str], np.ndarray]:
+        """Label embeddings; confidence is the winning class probability."""
+        probabilities = self.predict_proba(embeddings)
+        return [LABELS[i] for i in probabilities.argmax(axis=1)], probabilities.max(axis=1)
+
+    def save(self, path: str) -> None:
+        np.savez(path, weights=self.weights, bias=self.bias)
+
+    @classmethod
+    def load(cls, path: str) -> "EmbeddingSentimentModel":
+        with np.load(path) as data:
+            return cls(data["weights"], data["bias"])
+
+
+class LocalSentimentClassifier:
+    """
+    Confidence-gated local classifier.
+
+    Uses the embedding model when it is fitted and embeddings are supplied,
+    otherwise the lexicon. Texts below *threshold* get no label.
+
+    Args:
+        lexicon: Lexicon scorer (default: LexiconSentimentScorer())
+        model: Optional fitted EmbeddingSentimentModel
+        threshold: Minimum confidence for a local label
+    """
+
+    def __init__(
+        self,
+        lexicon: Optional[LexiconSentimentScorer] = None,
+        model: Optional[EmbeddingSentimentModel] = None,
+        threshold: float = 0.8
+    ):
+        self.lexicon = lexicon or LexiconSentimentScorer()
+        self.model = model
+        self.threshold = threshold
+
+    @property
+    def uses_embeddings(self) -> bool:
+        return self.model is not None and self.model.is_fitted
+
+    def predict(
+        self,
+        texts: Sequence[str],
+        embeddings: Optional[Sequence[Sequence[float]]] = None
+    ) -> Tuple[List[str], np.ndarray]:
+        """Best local label and confidence for every text, regardless of the threshold."""
+        if self.uses_embeddings and embeddings is not None:
+            return self.model.predict(embeddings)
+        return self.lexicon.predict(texts)
+
+    def classify(
+        self,
+        texts: Sequence[str],
+        embeddings: Optional[Sequence[Sequence[float]]] = None
+    ) -> List[Optional[str]]:
+        """Label confident texts; None marks texts that should go to the LLM."""
+        labels, confidence = self.predict(texts, embeddings)
+        return [label if conf >= self.threshold else None for label, conf in zip(labels, confidence)]
+
+
+def calibrate(
+    classifier: LocalSentimentClassifier,
+    texts: Sequence[str],
+    reference_labels: Sequence[str],
+    embeddings: Optional[Sequence[Sequence[float]]] = None,
+    thresholds: Sequence[float] = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95),
+    llm_seconds_per_text: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Measure how the local classifier agrees with LLM labels at several thresholds.
+
+    Args:
+        classifier: Classifier to evaluate (its own threshold is ignored)
+        texts: Evaluation texts
+        reference_labels: LLM labels for *texts*
+        embeddings: Embeddings for *texts*, if the classifier has a model
+        thresholds: Confidence thresholds to report
+        llm_seconds_per_text: Measured LLM cost per text, to estimate the speedup
+
+    Returns:
+        Report with local throughput and, per threshold, coverage (share answered
+        locally), agreement on the covered texts, and the estimated speedup
+    """
+    start = time.perf_counter()
+    labels, confidence = classifier.predict(texts, embeddings)
+    local_seconds = time.perf_counter() - start
+    reference = np.asarray(reference_labels)
+    agrees = np.asarray(labels) == reference
+    n = len(texts)
+    report: Dict[str, Any] = {
+        "texts": n,
+        "scorer": "embedding" if classifier.uses_embeddings and embeddings is not None else "lexicon",
+        "local_seconds": local_seconds,
+        "local_texts_per_second": n / local_seconds if local_seconds > 0 else float("inf"),
+        "llm_seconds_per_text": llm_seconds_per_text,
+        "thresholds": [],
+    }
+    for threshold in thresholds:
+        covered = confidence >= threshold
+        coverage = float(covered.mean()) if n else 0.0
+        row: Dict[str, Any] = {
+            "threshold": threshold,
+            "coverage": coverage,
+            "agreement": float(agrees[covered].mean()) if covered.any() else None,
+            # Escalated texts get the LLM label, so they agree by definition
+            "overall_agreement": float(np.where(covered, agrees, True).mean()) if n else None,
+        }
+        if llm_seconds_per_text:
+            hybrid_seconds = local_seconds + (1 - coverage) * n * llm_seconds_per_text
+            row["speedup"] = (n * llm_seconds_per_text) / hybrid_seconds if hybrid_seconds > 0 else None
+        report["thresholds"].append(row)
+    return report
+
+
+def _main(argv: Optional[Sequence[str]] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Calibrate the local sentiment classifier against LLM labels."
+    )
+    parser.add_argument("data", help="JSONL file with a 'text' field and optionally an LLM 'label' field")
+    parser.add_argument("--label-with-llm", action="store_true",
+                        help="Label texts (or relabel) with OpenAIService.analyze_sentiment_batch and time it")
+    parser.add_argument("--embeddings", action="store_true",
+                        help="Evaluate the embedding model (embeddings fetched through OpenAIService)")
+    parser.add_argument("--model", help="Load EmbeddingSentimentModel weights from this .npz file")
+    parser.add_argument("--train-out", help="Fit the embedding model on the first 80%% of the data and save it here")
+    parser.add_argument("--thresholds", default="0.5,0.6,0.7,0.8,0.9,0.95")
+    args = parser.parse_args(argv)
+
+    with open(args.data, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    texts = [row["text"] for row in rows]
+    labels = [row.get("label") for row in rows]
+    llm_seconds_per_text = None
+
+    needs_labels = args.label_with_llm or not all(labels)
+    service = None
+    if needs_labels or args.embeddings or args.train_out:
+        from app.dependencies import get_openai_service
+        service = get_openai_service()
+    if needs_labels:
+        start = time.perf_counter()
+        # Reference labels must come from the LLM, never from the classifier under test
+        labels = service.analyze_sentiment_batch(texts, local=False)
+        llm_seconds_per_text = (time.perf_counter() - start) / max(1, len(texts))
+
+    classifier = LocalSentimentClassifier()
+    embeddings = None
+    if args.embeddings or args.train_out:
+        embeddings = service.get_embeddings(texts)
+    if args.model:
+        classifier.model = EmbeddingSentimentModel.load(args.model)
+    if args.train_out:
+        split = int(len(texts) * 0.8)
+        classifier.model = EmbeddingSentimentModel().fit(embeddings[:split], labels[:split])
+        classifier.model.save(args.train_out)
+        texts, labels, embeddings = texts[split:], labels[split:], embeddings[split:]
+
+    thresholds = [float(t) for t in args.thresholds.split(",")]
+    report = calibrate(classifier, texts, labels, embeddings, thresholds, llm_seconds_per_text)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,97 @@
+"""
+Single-flight request coalescing.
+
+Concurrent calls that share a key wait for one in-flight execution and all
+receive its result (or its exception), instead of each hitting the upstream.
+SingleFlight serves threads, AsyncSingleFlight serves asyncio tasks.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class _FlightStats:
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "upstream_calls": self.calls - self.shared,
+            "dedupe_ratio": self.shared / self.calls if self.calls else 0.0,
+        }
+
+
+class SingleFlight(_FlightStats):
+    """Coalesces concurrent calls with the same key across threads."""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run *fn* unless a call with *key* is already in flight, in which case wait for it.
+
+        Returns:
+            (result, shared) where shared is True if the result came from another caller's execution
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+class AsyncSingleFlight(_FlightStats):
+    """
+    Coalesces concurrent coroutine calls with the same key on an event loop.
+
+    The shared execution runs as its own task, so a cancelled caller does not
+    cancel the request for the others.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # (event loop id, key) -> in-flight task
+        self._calls: Dict[Tuple[int, str], asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Await *fn()* unless a call with *key* is already in flight, in which case await that one.
+
+        Returns:
+            (result, shared) where shared is True if the result came from another caller's execution
+        """
+        flight_key = (id(asyncio.get_running_loop()), key)
+        self.calls += 1
+        task = self._calls.get(flight_key)
+        shared = task is not None
+        if shared:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self._calls[flight_key] = task
+            task.add_done_callback(lambda _: self._calls.pop(flight_key, None))
+        return await asyncio.shield(task), shared
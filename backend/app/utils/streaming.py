@@ -0,0 +1,69 @@
+"""
+Helpers for streaming LLM output from FastAPI endpoints.
+
+Wraps the event generators of OpenAIService.astream_completion in a
+StreamingResponse, either as Server-Sent Events or as plain text.
+"""
+import json
+import logging
+from typing import Any, AsyncIterator, Dict
+
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+# Disable proxy buffering (nginx, Cloud Run) so tokens reach the client immediately
+_STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+# Last chunk of a plain-text stream that failed midway
+_TEXT_ERROR_MARKER = "\n[error: Internal server error]\n"
+
+
+def _sse_frame(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _sse_events(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    try:
+        async for event in events:
+            if event["type"] == "delta":
+                yield _sse_frame("delta", {"content": event["content"]})
+            elif event["type"] == "done":
+                # The full content was already streamed; only send the summary
+                summary = {k: v for k, v in event.items() if k not in ("type", "content")}
+                yield _sse_frame("done", summary)
+    except Exception as e:
+        logger.error(f"Streaming response failed: {e}", exc_info=True)
+        yield _sse_frame("error", {"detail": "Internal server error"})
+
+
+async def _text_events(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    try:
+        async for event in events:
+            if event["type"] == "delta":
+                yield event["content"]
+    except Exception as e:
+        logger.error(f"Streaming response failed: {e}", exc_info=True)
+        # Plain text has no event framing; end with a marker so clients can tell the reply is cut short
+        yield _TEXT_ERROR_MARKER
+
+
+def completion_streaming_response(events: AsyncIterator[Dict[str, Any]], sse: bool = True) -> StreamingResponse:
+    """
+    Build a StreamingResponse from a completion event stream.
+
+    Args:
+        events: Async generator from OpenAIService.astream_completion
+        sse: Emit Server-Sent Events (``delta`` / ``done`` / ``error``) when True,
+            raw text deltas (ending in an error marker if the stream fails) when False
+
+    Returns:
+        StreamingResponse that forwards each token as soon as it arrives
+    """
+    if sse:
+        return StreamingResponse(_sse_events(events), media_type="text/event-stream", headers=_STREAM_HEADERS)
+    return StreamingResponse(_text_events(events), media_type="text/plain; charset=utf-8", headers=_STREAM_HEADERS)
@@ -0,0 +1,124 @@
+"""
+Token-bucket rate limiter with O(1) state per key.
+
+Each limit (e.g. requests per minute, tokens per minute) is a bucket that
+refills continuously at ``rate / period`` and holds at most ``burst`` units.
+A reservation debits every bucket atomically and may leave a bucket in debt;
+the caller then waits until the debt is repaid (GCRA-style scheduling), so
+waiting callers are served in arrival order and nothing is ever scanned.
+
+Acquire modes:
+- ``acquire``: block the calling thread until the reservation is due
+- ``aacquire``: await the reservation without blocking the event loop
+- ``try_acquire``: fail fast, never wait
+
+Bucket state lives in a pluggable backend (app.utils.limiter_backends): in
+process memory by default, or in a file-locked directory / Redis so that all
+workers share one budget. Backends never hold a lock while the caller sleeps,
+so a limiter is safe to share between threads and asyncio tasks.
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a reservation would wait longer than allowed."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class Limit:
+    """A budget of ``rate`` units per ``period`` seconds, with an optional burst size."""
+    name: str
+    rate: float
+    period: float = 60.0
+    burst: Optional[float] = None
+
+    @property
+    def per_second(self) -> float:
+        return self.rate / self.period
+
+    @property
+    def capacity(self) -> float:
+        return self.burst if self.burst is not None else self.rate
+
+
+class TokenBucketLimiter:
+    """
+    Rate limiter enforcing several token-bucket limits at once.
+
+    Args:
+        limits: Limits to enforce; costs are passed per limit name
+        backend: Where bucket state lives (see app.utils.limiter_backends);
+            defaults to in-process memory
+    """
+
+    def __init__(self, limits: Iterable[Limit], backend=None):
+        if backend is None:
+            from app.utils.limiter_backends import MemoryLimiterBackend
+            backend = MemoryLimiterBackend()
+        self.limits: Dict[str, Limit] = {limit.name: limit for limit in limits}
+        self.backend = backend
+
+    def _charges(self, costs: Mapping[str, float]) -> List[Tuple[Limit, float]]:
+        # Unknown names and zero costs are ignored
+        return [(self.limits[name], cost) for name, cost in costs.items() if cost and name in self.limits]
+
+    def reserve(self, costs: Mapping[str, float], key: str = "default", max_wait: Optional[float] = None) -> float:
+        """
+        Debit *costs* from the buckets of *key* and return the seconds to wait before proceeding.
+
+        Args:
+            costs: Units to debit per limit name; unknown names and zero costs are ignored
+            key: Independent budget to charge (e.g. per API key or tenant)
+            max_wait: If set, raise RateLimitExceeded instead of reserving when the wait would be longer
+
+        Returns:
+            Seconds the caller must wait (0 when capacity is available now)
+        """
+        charges = self._charges(costs)
+        if not charges:
+            return 0.0
+        return self.backend.reserve(key, charges, max_wait)
+
+    def adjust(self, costs: Mapping[str, float], key: str = "default") -> None:
+        """Debit (positive) or refund (negative) units without waiting, e.g. to reconcile estimates with actual usage."""
+        charges = self._charges(costs)
+        if charges:
+            self.backend.adjust(key, charges)
+
+    def acquire(self, costs: Mapping[str, float], key: str = "default", timeout: Optional[float] = None) -> float:
+        """Block until *costs* are available. Raises RateLimitExceeded if that takes longer than *timeout*."""
+        wait = self.reserve(costs, key, max_wait=timeout)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, costs: Mapping[str, float], key: str = "default", timeout: Optional[float] = None) -> float:
+        """Await until *costs* are available. Raises RateLimitExceeded if that takes longer than *timeout*."""
+        from app.utils.limiter_backends import MemoryLimiterBackend
+        if isinstance(self.backend, MemoryLimiterBackend):
+            wait = self.reserve(costs, key, max_wait=timeout)
+        else:
+            # File locks and Redis round-trips block; reserve on a worker thread, not the event loop
+            wait = await asyncio.get_running_loop().run_in_executor(None, self.reserve, costs, key, timeout)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def try_acquire(self, costs: Mapping[str, float], key: str = "default") -> bool:
+        """Take *costs* only if they are available right now."""
+        try:
+            self.reserve(costs, key, max_wait=0)
+            return True
+        except RateLimitExceeded:
+            return False
+
+    def available(self, key: str = "default") -> Dict[str, float]:
+        """Units currently available per limit for *key*."""
+        return self.backend.available(key, list(self.limits.values()))
@@ -0,0 +1,134 @@
+"""
+Benchmark harness for the prompt/report builders.
+
+Benchmarks are skipped unless ``BENCHMARK=1`` (see ``make bench``). Each
+benchmark is timed with ``time.perf_counter`` (best of several rounds, inner
+loops sized so a round takes at least 10 ms) and its peak allocation is
+measured with ``tracemalloc`` in a separate, untimed run.
+
+Times are stored relative to a fixed pure-Python calibration workload, so the
+baseline in ``baseline.json`` carries over between machines of different
+speed. A benchmark fails when its relative time exceeds the baseline by more
+than ``BENCHMARK_TIME_TOLERANCE`` (default 1.5x) or its peak allocation by more
+than ``BENCHMARK_MEMORY_TOLERANCE`` (default 1.25x, plus 64 KiB of slack).
+Run with ``BENCHMARK_UPDATE=1`` to record a new baseline instead.
+"""
+import json
+import os
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+import pytest
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+TIME_TOLERANCE = float(os.getenv("BENCHMARK_TIME_TOLERANCE", "1.5"))
+MEMORY_TOLERANCE = float(os.getenv("BENCHMARK_MEMORY_TOLERANCE", "1.25"))
+MEMORY_SLACK = 64 * 1024
+MIN_ROUND_SECONDS = 0.01
+ROUNDS = 7
+# Re-measurements before a slow result counts as a regression (absorbs scheduler noise)
+RETRIES = 2
+
+
+def _enabled(name: str) -> bool:
+    return os.getenv(name, "").lower() in ("1", "true", "yes")
+
+
+def pytest_collection_modifyitems(config, items):
+    if _enabled("BENCHMARK") or _enabled("BENCHMARK_UPDATE"):
+        return
+    skip = pytest.mark.skip(reason="benchmarks run with BENCHMARK=1 (make bench)")
+    for item in items:
+        if "benchmarks" in Path(str(item.fspath)).parts:
+            item.add_marker(skip)
+
+
+def _best_time(fn: Callable[[], Any]) -> float:
+    """Best per-call time over ROUNDS rounds of enough calls to fill MIN_ROUND_SECONDS."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_ROUND_SECONDS:
+            break
+        loops *= 2
+    best = elapsed / loops
+    for _ in range(ROUNDS - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best
+
+
+def _calibration_workload() -> None:
+    # Formatting, joining and dict access: the same kind of work the builders do
+    rows = [{"a": i, "b": str(i)} for i in range(2000)]
+    "".join(f"| {row['a']} | {row['b']} |\n" for row in rows)
+
+
+def _peak_allocation(fn: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+@pytest.fixture(scope="session")
+def benchmark_session():
+    baseline: Dict[str, Dict[str, float]] = {}
+    if BASELINE_PATH.exists():
+        baseline = json.loads(BASELINE_PATH.read_text())
+    session = {
+        "calibration": _best_time(_calibration_workload),
+        "baseline": baseline,
+        "results": {},
+    }
+    yield session
+    if _enabled("BENCHMARK_UPDATE") and session["results"]:
+        merged = {**baseline, **session["results"]}
+        BASELINE_PATH.write_text(json.dumps(dict(sorted(merged.items())), indent=2) + "\n")
+
+
+@pytest.fixture
+def bench(benchmark_session):
+    """
+    Measure ``fn`` under ``name`` and compare it with the stored baseline.
+
+    Returns the measurement: seconds per call, time relative to the
+    calibration workload, and peak traced allocation in bytes.
+    """
+    def run(name: str, fn: Callable[[], Any]) -> Dict[str, float]:
+        expected = benchmark_session["baseline"].get(name)
+        seconds = _best_time(fn)
+        for _ in range(RETRIES if expected is not None else 0):
+            if seconds / benchmark_session["calibration"] <= expected["relative_time"] * TIME_TOLERANCE:
+                break
+            seconds = min(seconds, _best_time(fn))
+        result = {
+            "relative_time": round(seconds / benchmark_session["calibration"], 4),
+            "peak_bytes": _peak_allocation(fn),
+        }
+        benchmark_session["results"][name] = result
+        print(f"\n{name}: {seconds * 1000:.3f} ms/call, {result['relative_time']}x calibration, "
+              f"peak {result['peak_bytes'] / 1024:.1f} KiB")
+
+        if expected is None or _enabled("BENCHMARK_UPDATE"):
+            return {**result, "seconds": seconds}
+        assert result["relative_time"] <= expected["relative_time"] * TIME_TOLERANCE, (
+            f"{name} regressed: {result['relative_time']}x calibration vs baseline {expected['relative_time']}x"
+        )
+        assert result["peak_bytes"] <= expected["peak_bytes"] * MEMORY_TOLERANCE + MEMORY_SLACK, (
+            f"{name} allocates more: peak {result['peak_bytes']} B vs baseline {expected['peak_bytes']} B"
+        )
+        return {**result, "seconds": seconds}
+
+    return run
@@ -0,0 +1,155 @@
+"""
+Benchmarks for app.utils.prompt_builder on synthetic inputs of increasing size.
+
+Run with ``make bench`` (or ``BENCHMARK=1 pytest tests/benchmarks``).
+"""
+import re
+
+import pytest
+
+from app.utils.prompt_builder import (
+    SUMMARY_TEMPLATE,
+    build_markdown_report,
+    build_news_with_urls_markdown,
+    build_reddit_sentiment_markdown,
+    build_sec_filing_summary_markdown,
+    build_stock_prompt,
+    render_many,
+    render_value,
+)
+
+SECTORS = ("Technology", "Healthcare", "Energy", "Financials")
+
+
+def make_docs(n):
+    return [
+        {
+            "score": (i * 37 % 100) / 100,
+            "metadata": {
+                "symbol": f"S{i:04d}",
+                "Name": f"Company {i} Inc",
+                "Sector": SECTORS[i % len(SECTORS)],
+                "Industry": "Software",
+                "MarketCapitalization": 1_000_000_000 + i,
+                "52WeekHigh": 200.5 + i,
+                "52WeekLow": 100.25 + i,
+                "TrailingPE": 30.1,
+                "ForwardPE": 25.4,
+                "PEGRatio": 1.7,
+                "PriceToBookRatio": 40.2,
+                "DividendYield": 0.005,
+                "AnalystRatingStrongBuy": i % 10,
+                "AnalystRatingBuy": 20,
+                "AnalystRatingHold": 15,
+                "AnalystRatingSell": 2,
+                "AnalystRatingStrongSell": 1,
+                "Description": "Makes things. " * 20,
+            },
+        }
+        for i in range(n)
+    ]
+
+
+def make_news(n):
+    return [
+        {
+            "title": f"Headline number {i} about quarterly results",
+            "url": f"https://news.example.com/articles/{i}" if i % 5 else "",
+            "source": "Example Wire",
+            "published_at": f"2024-05-{i % 28 + 1:02d}T12:00:00Z",
+        }
+        for i in range(n)
+    ]
+
+
+def make_filings(n):
+    return [
+        {
+            "date": f"2024-{i % 12 + 1:02d}-01",
+            "type": ("10-K", "10-Q", "8-K")[i % 3],
+            "summary": f"Filing {i}: revenue and guidance update. " * 3,
+        }
+        for i in range(n)
+    ]
+
+
+def make_reddit(n):
+    return {
+        "sentiment_summary": {"positive": 0.5, "neutral": 0.3, "negative": 0.2},
+        "total_posts_analyzed": n,
+        "posts": [
+            {
+                "title": f"DD post {i} on the stock " * 4,
+                "url": f"https://reddit.example.com/{i}",
+                "sentiment": "positive",
+                "score": i,
+                "engagement_score": i / 3,
+            }
+            for i in range(n)
+        ],
+    }
+
+
+def make_report_context(news, filings):
+    meta = make_docs(1)[0]["metadata"]
+    return {
+        **meta,
+        "news_with_urls": build_news_with_urls_markdown(make_news(news)),
+        "sec_filings_table": build_sec_filing_summary_markdown("S0000", make_filings(filings)),
+        "reddit_sentiment": build_reddit_sentiment_markdown(make_reddit(10)),
+        "EPS": {"Date": [f"2024-Q{q}" for q in range(1, 5)], "EPS": [1.1, 1.2, 1.3, 1.4]},
+    }
+
+
+@pytest.mark.parametrize("n", [1, 10, 100, 1000])
+def test_build_stock_prompt(bench, n):
+    docs = make_docs(n)
+    bench(f"build_stock_prompt[{n}]", lambda: build_stock_prompt(docs=docs, question="Which is the best value?"))
+
+
+@pytest.mark.parametrize("n", [10, 100, 1000])
+def test_build_stock_prompt_with_budget(bench, n):
+    docs = make_docs(n)
+    bench(
+        f"build_stock_prompt_budget[{n}]",
+        lambda: build_stock_prompt(docs=docs, question="Which is the best value?", max_prompt_tokens=8000),
+    )
+
+
+@pytest.mark.parametrize("news,filings", [(10, 10), (1000, 1000), (10000, 10000)])
+def test_build_markdown_report(bench, news, filings):
+    context = make_report_context(news, filings)
+    bench(f"build_markdown_report[{news}x{filings}]", lambda: build_markdown_report(SUMMARY_TEMPLATE, context))
+
+
+@pytest.mark.parametrize("n", [10, 100, 1000, 10000])
+def test_build_news_with_urls_markdown(bench, n):
+    news = make_news(n)
+    bench(f"build_news_with_urls_markdown[{n}]", lambda: build_news_with_urls_markdown(news))
+
+
+@pytest.mark.parametrize("n", [10, 1000, 10000])
+def test_build_reddit_sentiment_markdown(bench, n):
+    reddit = make_reddit(n)
+    bench(f"build_reddit_sentiment_markdown[{n}]", lambda: build_reddit_sentiment_markdown(reddit))
+
+
+@pytest.mark.parametrize("n", [10, 1000, 10000, 50000])
+def test_build_sec_filing_summary_markdown(bench, n):
+    filings = make_filings(n)
+    bench(f"build_sec_filing_summary_markdown[{n}]", lambda: build_sec_filing_summary_markdown("S0000", filings))
+
+
+def _regex_report(template, context):
+    # The per-call regex substitution build_markdown_report used before templates were compiled
+    def replacer(match):
+        key = match.group(1)
+        return render_value(context.get(key, f"{{{{{key}}}}}"))
+    return re.sub(r"\{\{(\w+)\}\}", replacer, template)
+
+
+def test_render_many_vs_regex(bench):
+    contexts = [{**make_docs(1)[0]["metadata"], "symbol": f"S{i}"} for i in range(200)]
+    regex = bench("render_regex[200]", lambda: [_regex_report(SUMMARY_TEMPLATE, c) for c in contexts])
+    compiled = bench("render_many[200]", lambda: render_many(SUMMARY_TEMPLATE, contexts))
+    assert compiled["seconds"] < regex["seconds"]
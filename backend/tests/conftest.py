@@ -0,0 +1,112 @@
+"""
+Shared fixtures: an OpenAIService wired to an in-process fake LLM backend.
+"""
+import pytest
+
+from app.config.openai_config import get_openai_settings
+from app.utils.limiter_backends import MemoryLimiterBackend
+from app.utils.token_counter import TokenCounter
+
+
+class FakeBackend:
+    """
+    Stand-in for an LLM backend: records calls and answers from *reply*.
+
+    Args:
+        reply: Completion text, or a callable params -> text
+        errors: Exceptions raised by the next calls, in order, before answering
+        name: Backend name (as reported by the router)
+    """
+
+    kind = "fake"
+
+    def __init__(self, reply="ok", errors=(), name="fake"):
+        self.name = name
+        self.reply = reply
+        self.errors = list(errors)
+        self.calls = []
+        self.async_client = None
+        self.closed = False
+
+    def _answer(self, op, params):
+        self.calls.append((op, params))
+        if self.errors:
+            raise self.errors.pop(0)
+        content = self.reply(params) if callable(self.reply) else self.reply
+        return {
+            "content": content,
+            "model": params["model"],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12, "cached_tokens": 0},
+        }
+
+    def _embed(self, op, texts):
+        self.calls.append((op, list(texts)))
+        if self.errors:
+            raise self.errors.pop(0)
+        return {
+            "embeddings": [[float(len(text)), 1.0] for text in texts],
+            "usage": {"prompt_tokens": len(texts), "completion_tokens": 0, "total_tokens": len(texts), "cached_tokens": 0},
+        }
+
+    def _events(self, op, params):
+        result = self._answer(op, params)
+        yield {"type": "model", "model": result["model"]}
+        for word in result["content"].split(" "):
+            yield {"type": "delta", "content": word + " "}
+        yield {"type": "usage", "model": result["model"], "usage": result["usage"]}
+
+    def complete(self, params):
+        return self._answer("complete", params)
+
+    async def acomplete(self, params):
+        return self._answer("acomplete", params)
+
+    def stream(self, params):
+        yield from self._events("stream", params)
+
+    async def astream(self, params):
+        for event in self._events("astream", params):
+            yield event
+
+    def embed(self, texts, model):
+        return self._embed("embed", texts)
+
+    async def aembed(self, texts, model):
+        return self._embed("aembed", texts)
+
+    def close(self):
+        self.closed = True
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture
+def make_service(monkeypatch):
+    """
+    Build an OpenAIService on a FakeBackend.
+
+    Keyword arguments become OPENAI_* settings; the service gets its own rate
+    limiter state and a heuristic token counter, so tests stay independent.
+    """
+    from app.services.openai_service import OpenAIService
+
+    services = []
+
+    def make(backend=None, **settings):
+        monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+        for name, value in settings.items():
+            monkeypatch.setenv(f"OPENAI_{name}", str(value))
+        get_openai_settings.cache_clear()
+        service = OpenAIService()
+        service.backend = backend if backend is not None else FakeBackend()
+        service.backends = [service.backend]
+        service.rate_limiter.backend = MemoryLimiterBackend()
+        service.token_counter = TokenCounter(use_tiktoken=False)
+        services.append(service)
+        return service
+
+    yield make
+    for service in services:
+        service.close()
+    get_openai_settings.cache_clear()
@@ -0,0 +1,172 @@
+"""
+Tests for the shared L2 cache tier.
+
+Two CacheService instances on one backend stand in for two workers. The Redis
+backend runs against fakeredis.
+"""
+import threading
+import time
+
+import pytest
+
+from app.utils.cache_backends import (
+    CacheSerializationError,
+    RedisCacheBackend,
+    SQLiteCacheBackend,
+    decode_value,
+    encode_value,
+)
+from app.utils.cache_service import CacheService
+
+
+def _sqlite_backend(tmp_path):
+    return SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), poll_interval=0.02)
+
+
+def _redis_backend(tmp_path):
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisCacheBackend(fakeredis.FakeRedis(), prefix=f"test:{time.time_ns()}:")
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def make_backend(request, tmp_path):
+    factory = _sqlite_backend if request.param == "sqlite" else _redis_backend
+    return lambda: factory(tmp_path)
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_encoding_round_trip_and_compression():
+    value = {"summary": "x" * 5000, "scores": [1, 2.5, None], "ok": True}
+    data = encode_value(value, compress_min_bytes=1024)
+    assert len(data) < 1000
+    assert decode_value(data) == value
+    assert decode_value(encode_value("short")) == "short"
+
+
+def test_workers_share_results_and_invalidate(make_backend):
+    backend = make_backend()
+    worker_a = CacheService(reap_interval=None, l2=backend, namespace="analyze:")
+    worker_b = CacheService(reap_interval=None, l2=backend, namespace="analyze:")
+
+    worker_a.set("AAPL", {"rating": "buy"}, ttl=60)
+    assert worker_b.get("AAPL") == {"rating": "buy"}
+    assert worker_b.stats()["l2_hits"] == 1
+
+    worker_a.set("AAPL", {"rating": "hold"}, ttl=60)
+    assert _wait_for(lambda: worker_b.get("AAPL") == {"rating": "hold"})
+    assert worker_b.stats()["invalidations"] >= 1
+
+    worker_a.set_many({"MSFT": 1, "NVDA": 2}, ttl=60)
+    assert worker_b.get_many(["MSFT", "NVDA", "TSLA"]) == {"MSFT": 1, "NVDA": 2}
+
+    worker_b.delete("MSFT")
+    assert _wait_for(lambda: worker_a.get("MSFT") is None)
+
+
+async def test_get_or_compute_reads_through_l2(make_backend):
+    backend = make_backend()
+    worker_a = CacheService(reap_interval=None, l2=backend)
+    worker_b = CacheService(reap_interval=None, l2=backend)
+    calls = 0
+
+    async def analyze():
+        nonlocal calls
+        calls += 1
+        return {"text": "analysis"}
+
+    assert await worker_a.get_or_compute(("AAPL", "1y"), analyze, ttl=60) == {"text": "analysis"}
+    assert await worker_b.get_or_compute(("AAPL", "1y"), analyze, ttl=60) == {"text": "analysis"}
+    assert calls == 1
+
+
+class Opaque:
+    def __repr__(self):
+        return "Opaque"  # the same for every instance
+
+
+def test_only_plain_data_keys_reach_l2(make_backend):
+    backend = make_backend()
+    worker_a = CacheService(reap_interval=None, l2=backend, namespace="analyze:")
+    worker_b = CacheService(reap_interval=None, l2=backend, namespace="analyze:")
+
+    worker_a.set(("AAPL", 1.5, None, b"raw"), "shared", ttl=60)
+    opaque = Opaque()
+    worker_a.set(("AAPL", opaque), "local", ttl=60)
+
+    assert worker_b.get(("AAPL", 1.5, None, b"raw")) == "shared"
+    assert worker_b.get(("AAPL", Opaque())) is None
+    assert worker_a.get(("AAPL", opaque)) == "local"
+
+
+def test_clear_drops_the_namespace_everywhere(make_backend):
+    backend = make_backend()
+    # Glob characters in the namespace must not widen the Redis SCAN pattern
+    worker_a = CacheService(reap_interval=None, l2=backend, namespace="quote[*]:")
+    worker_b = CacheService(reap_interval=None, l2=backend, namespace="quote[*]:")
+    other = CacheService(reap_interval=None, l2=backend, namespace="quoteX:")
+
+    worker_a.set("AAPL", 1, ttl=60)
+    other.set("AAPL", 2, ttl=60)
+    assert worker_b.get("AAPL") == 1
+
+    worker_a.clear(l2=True)
+    assert worker_a.get("AAPL") is None
+    assert _wait_for(lambda: len(worker_b) == 0)
+    assert worker_b.get("AAPL") is None
+    assert other.get("AAPL") == 2
+
+    with pytest.raises(ValueError):
+        CacheService(reap_interval=None, l2=backend).clear(l2=True)
+
+
+@pytest.mark.parametrize("value", [(1, 1), {"pair": (1, 2)}, {1: "one"}, {"tags": {"a"}}, Opaque()])
+def test_values_that_do_not_round_trip_are_refused(value):
+    with pytest.raises(CacheSerializationError):
+        encode_value(value)
+
+
+def test_non_portable_values_stay_in_l1(make_backend):
+    backend = make_backend()
+    worker_a = CacheService(reap_interval=None, l2=backend, namespace="analyze:")
+    worker_b = CacheService(reap_interval=None, l2=backend, namespace="analyze:")
+    worker_a.set("pair", (1, 1), ttl=60)
+    assert worker_a.get("pair") == (1, 1)
+    assert worker_b.get("pair") is None
+
+
+class ThreadRecordingBackend:
+    """Delegates to a real backend and records which threads do L2 I/O."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.threads = []
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def get_many(self, keys):
+        self.threads.append(threading.get_ident())
+        return self.backend.get_many(keys)
+
+    def set_many(self, items, ttl=None):
+        self.threads.append(threading.get_ident())
+        return self.backend.set_many(items, ttl)
+
+
+async def test_get_or_compute_does_l2_io_off_the_event_loop(tmp_path):
+    backend = ThreadRecordingBackend(_sqlite_backend(tmp_path))
+    cache = CacheService(reap_interval=None, l2=backend, namespace="analyze:")
+
+    async def analyze():
+        return {"text": "analysis"}
+
+    assert await cache.get_or_compute("AAPL", analyze, ttl=60) == {"text": "analysis"}
+    # One read (the L1 miss) and one write, neither on the loop's thread
+    assert len(backend.threads) == 2
+    assert threading.get_ident() not in backend.threads
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+
+from app.utils.cache_service import CacheService
+
+
+def test_lru_eviction_and_counters():
+    cache = CacheService(max_entries=4, shards=1, reap_interval=None)
+    for i in range(4):
+        cache.set(f"k{i}", i)
+    assert cache.get("k0") == 0  # k0 is now the most recently used
+    cache.set("k4", 4)
+    assert cache.get("k1") is None
+    assert cache.get_many(["k0", "k2", "k3", "k4", "nope"]) == {"k0": 0, "k2": 2, "k3": 3, "k4": 4}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (5, 2, 1, 4)
+
+
+def test_byte_limit_is_enforced_per_shard():
+    cache = CacheService(max_entries=1000, max_bytes=10_000, shards=2, reap_interval=None, sizeof=len)
+    cache.set_many({f"k{i}": "x" * 1000 for i in range(50)})
+    assert cache.stats()["bytes"] <= 10_000
+    assert 0 < len(cache) < 50
+
+
+def test_reaper_removes_expired_entries():
+    cache = CacheService(reap_interval=0.05)
+    cache.set_many({f"k{i}": i for i in range(100)}, ttl=0.01)
+    cache.set("keep", 1)
+    deadline = time.time() + 2
+    while len(cache) > 1 and time.time() < deadline:
+        time.sleep(0.02)
+    assert len(cache) == 1 and cache.get("keep") == 1
+    assert cache.stats()["expirations"] == 100
+    cache.close()
+
+
+def test_reaper_sweeps_one_shard_per_tick():
+    cache = CacheService(shards=4, reap_interval=None)
+    cache.set_many({f"k{i}": i for i in range(100)}, ttl=0.01)
+    time.sleep(0.02)
+    per_shard = [len(shard.entries) for shard in cache._shards]
+    assert [cache.reap_next() for _ in range(4)] == per_shard
+    assert len(cache) == 0 and cache.reap_next() == 0
+
+
+async def test_get_or_compute_coalesces_misses():
+    cache = CacheService(reap_interval=None)
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return "result"
+
+    results = await asyncio.gather(*(cache.get_or_compute("k", compute, ttl=60) for _ in range(10)))
+    assert results == ["result"] * 10 and calls == 1
+    assert await cache.get_or_compute("k", compute, ttl=60) == "result" and calls == 1
+    assert cache.stats()["coalesced"] == 9
+
+
+async def test_get_or_compute_serves_stale_while_refreshing():
+    cache = CacheService(reap_interval=None)
+    version = 0
+
+    async def compute():
+        nonlocal version
+        version += 1
+        await asyncio.sleep(0.01)
+        return version
+
+    assert await cache.get_or_compute("k", compute, ttl=0.05, stale_ttl=10, early_refresh_beta=0) == 1
+    await asyncio.sleep(0.06)
+    # Stale: every caller gets the old value at once, and one refresh runs
+    stale = await asyncio.gather(*(cache.get_or_compute("k", compute, ttl=0.05, stale_ttl=10) for _ in range(5)))
+    assert stale == [1] * 5
+    await asyncio.sleep(0.03)
+    assert version == 2
+    assert await cache.get_or_compute("k", compute, ttl=60, stale_ttl=10, early_refresh_beta=0) == 2
+
+
+async def test_get_or_compute_does_not_cache_failures():
+    cache = CacheService(reap_interval=None)
+
+    async def fail():
+        raise ValueError("upstream down")
+
+    with pytest.raises(ValueError):
+        await cache.get_or_compute("k", fail, ttl=60)
+    assert await cache.get_or_compute("k", lambda: 42, ttl=60) == 42
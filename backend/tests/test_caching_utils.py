@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+
+from app.utils import caching_utils
+from app.utils.cache_backends import SQLiteCacheBackend
+from app.utils.caching_utils import in_memory_cache, rate_limit
+from app.utils.limiter_backends import FileLockLimiterBackend
+
+
+class Agent:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+
+    def __str__(self):
+        return "Agent"  # identical for every instance
+
+    @in_memory_cache(ttl=60)
+    async def analyze(self, symbol, options=None):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return f"{self.name}:{symbol}"
+
+
+async def test_methods_are_cached_per_instance():
+    a, b = Agent("a"), Agent("b")
+    assert await a.analyze("AAPL") == "a:AAPL"
+    assert await b.analyze("AAPL") == "b:AAPL"
+    assert await a.analyze(symbol="AAPL", options=None) == "a:AAPL"
+    assert (a.calls, b.calls) == (1, 1)
+
+
+async def test_canonical_keys_coalescing_and_cache_info():
+    calls = 0
+
+    @in_memory_cache(ttl=60, maxsize=2)
+    async def fetch(params):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return sorted(params)
+
+    results = await asyncio.gather(fetch({"a": 1, "b": [2]}), fetch({"b": [2], "a": 1}))
+    assert results == [["a", "b"], ["a", "b"]] and calls == 1
+    await fetch({"c": 3})
+    await fetch({"d": 4})
+    info = fetch.cache_info()
+    assert (info.maxsize, info.currsize) == (2, 2)
+    fetch.cache_clear()
+    assert fetch.cache_info() == (0, 0, 2, 0)
+
+
+async def test_unhashable_arguments_are_not_cached():
+    np = pytest.importorskip("numpy")
+    calls = 0
+
+    @in_memory_cache(ttl=60)
+    async def total(values):
+        nonlocal calls
+        calls += 1
+        return float(values.sum())
+
+    a, b = np.zeros(10_000), np.zeros(10_000)
+    b[5_000] = 1.0
+    # numpy elides the middle of large arrays, so both reprs are the same
+    assert repr(a) == repr(b)
+    assert (await total(a), await total(b)) == (0.0, 1.0)
+    assert calls == 2 and total.cache_info().currsize == 0
+
+
+async def test_custom_key_fn():
+    calls = 0
+
+    @in_memory_cache(ttl=60, key_fn=lambda symbol, **_: symbol.upper())
+    async def quote(symbol, request_id=None):
+        nonlocal calls
+        calls += 1
+        return symbol.upper()
+
+    await quote("aapl", request_id=1)
+    await quote("AAPL", request_id=2)
+    assert calls == 1
+
+
+@pytest.fixture
+def shared_l2(tmp_path, monkeypatch):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), poll_interval=0.02)
+    monkeypatch.setattr(caching_utils, "get_cache_backend", lambda: backend)
+    yield backend
+    backend.close()
+
+
+def make_worker():
+    # Same module and qualnames each time, so both "workers" share one L2 namespace
+    calls = []
+
+    class Named:
+        def __init__(self, name):
+            self.name = name
+
+        def __repr__(self):
+            return "Named"  # does not show the state that decides the result
+
+        @in_memory_cache(ttl=60)
+        async def who(self):
+            calls.append(self.name)
+            return self.name
+
+    @in_memory_cache(ttl=60)
+    async def quote(symbol, options=None):
+        calls.append(symbol)
+        return {"symbol": symbol, "options": getattr(options, "name", options)}
+
+    return quote, Named, calls
+
+
+async def test_l2_shares_plain_keys_between_workers(shared_l2):
+    (quote_a, _, calls_a), (quote_b, _, calls_b) = make_worker(), make_worker()
+    assert await quote_a("AAPL", options={"range": "1y"}) == {"symbol": "AAPL", "options": {"range": "1y"}}
+    assert await quote_b("AAPL", options={"range": "1y"}) == {"symbol": "AAPL", "options": {"range": "1y"}}
+    assert (calls_a, calls_b) == (["AAPL"], [])
+
+
+async def test_l2_never_shares_entries_keyed_by_objects(shared_l2):
+    (quote_a, Named_a, _), (quote_b, Named_b, _) = make_worker(), make_worker()
+    # A repr is not an identity: instances with equal reprs must not share entries
+    assert await Named_a("a").who() == "a"
+    assert await Named_a("b").who() == "b"
+    assert await Named_b("c").who() == "c"
+    assert await quote_a("AAPL", options=Named_a("a")) == {"symbol": "AAPL", "options": "a"}
+    assert await quote_b("AAPL", options=Named_b("b")) == {"symbol": "AAPL", "options": "b"}
+
+
+async def test_cache_clear_also_clears_l2(shared_l2):
+    quote, _, calls = make_worker()
+    await quote("AAPL")
+    quote.cache_clear()
+    await quote("AAPL")
+    assert calls == ["AAPL", "AAPL"]
+    assert quote.cache_info().misses == 1
+
+
+async def test_rate_limit_keys_instances_locally_and_names_shared(tmp_path, monkeypatch):
+    shared = FileLockLimiterBackend(str(tmp_path))
+    monkeypatch.setattr(caching_utils, "get_limiter_backend", lambda: shared)
+
+    class Poller:
+        @rate_limit(min_interval=60)
+        async def poll(self):
+            return "ok"
+
+    a, b = Poller(), Poller()
+    assert await a.poll() == "ok" and await b.poll() == "ok"
+    with pytest.raises(Exception, match="Rate limit exceeded"):
+        await a.poll()
+    # Instance ids are process-local, so they never become keys in the shared backend
+    assert list(tmp_path.iterdir()) == []
+
+    @rate_limit(min_interval=60, key="news-api")
+    async def headlines():
+        return "headlines"
+
+    @rate_limit(min_interval=60, key="news-api")
+    async def articles():
+        return "articles"
+
+    assert await headlines() == "headlines"
+    with pytest.raises(Exception, match="Rate limit exceeded"):
+        await articles()
@@ -0,0 +1,111 @@
+"""
+Tests for the error-rate / latency circuit breaker, on a fake clock.
+"""
+import random
+
+import pytest
+
+from app.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def _breaker(clock, **kwargs):
+    return CircuitBreaker("primary", **{"failure_rate": 0.5, "min_calls": 4, "open_seconds": 30.0, "clock": clock, **kwargs})
+
+
+def test_opens_once_the_failure_rate_is_reached(clock):
+    breaker = _breaker(clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_failure()
+    # Not enough calls in the window yet
+    assert breaker.state == CLOSED
+    breaker.record_success(0.1)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == pytest.approx(30.0)
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_stays_closed_below_the_failure_rate(clock):
+    breaker = _breaker(clock)
+    for _ in range(3):
+        breaker.record_success(0.1)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.stats()["error_rate"] == pytest.approx(0.25)
+
+
+def test_old_calls_leave_the_window(clock):
+    breaker = _breaker(clock, window=10.0)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 11
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.stats()["calls"] == 1
+
+
+def test_opens_on_slow_p95_latency(clock):
+    breaker = _breaker(clock, latency_p95=1.0)
+    for latency in (0.2, 0.3, 2.5, 3.0):
+        breaker.record_success(latency)
+    assert breaker.state == OPEN
+
+
+def test_latency_check_tracks_the_p95_without_sorting(clock, monkeypatch):
+    breaker = _breaker(clock, latency_p95=1.0, min_calls=10**6, window=5.0)
+    sort_p95 = breaker._p95
+    monkeypatch.setattr(breaker, "_p95", lambda: pytest.fail("p95 sorted while recording"))
+    rng = random.Random(3)
+    for _ in range(400):
+        clock.now += rng.random() * 0.1
+        if rng.random() < 0.2:
+            breaker.record_failure()
+        else:
+            breaker.record_success(rng.choice([0.1, 0.5, 1.0, 1.5, 3.0]) if rng.random() < 0.3 else 0.2)
+        breaker._prune(clock.now)
+        assert breaker._p95_too_slow() == (sort_p95() > 1.0)
+
+
+def test_half_open_probe_closes_or_reopens(clock):
+    breaker = _breaker(clock)
+    for _ in range(4):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.stats()["times_opened"] == 2
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["calls"] == 1
+
+
+def test_lost_probes_are_replaced(clock):
+    breaker = _breaker(clock)
+    for _ in range(4):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    clock.now += 30
+    # The first probe never reported back
+    assert breaker.allow()
@@ -0,0 +1,135 @@
+"""
+Tests for the completion response cache (memory and SQLite backends) and its use in OpenAIService.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils import completion_cache
+from app.utils.completion_cache import DiskCompletionCache, MemoryCompletionCache, build_completion_cache
+
+MESSAGES = [{"role": "user", "content": "Classify: shares jumped 5%"}]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(completion_cache, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture(params=["memory", "disk"])
+def make_cache(request, tmp_path):
+    caches = []
+
+    def make(**kwargs):
+        cache = build_completion_cache(
+            request.param, path=str(tmp_path / "completions.sqlite"), **{"ttl": 60.0, "max_entries": 10, **kwargs}
+        )
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        if isinstance(cache, DiskCompletionCache):
+            cache.close()
+
+
+def test_round_trip_and_stats(make_cache, clock):
+    cache = make_cache()
+    assert cache.get("k") is None
+    cache.set("k", {"content": "positive", "usage": {"total_tokens": 3}})
+    assert cache.get("k") == {"content": "positive", "usage": {"total_tokens": 3}}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_entries_expire_after_their_ttl(make_cache, clock):
+    cache = make_cache()
+    cache.set("default", {"v": 1})
+    cache.set("short", {"v": 2}, ttl=5)
+    clock.now += 10
+    assert cache.get("short") is None
+    assert cache.get("default") == {"v": 1}
+    clock.now += 60
+    assert cache.get("default") is None
+
+
+def test_least_recently_used_entries_are_evicted(make_cache, clock):
+    cache = make_cache(max_entries=2)
+    cache.set("a", {"v": "a"})
+    clock.now += 1
+    cache.set("b", {"v": "b"})
+    clock.now += 1
+    cache.get("a")
+    clock.now += 1
+    cache.set("c", {"v": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": "a"}
+    assert cache.stats()["evictions"] == 1
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_disk_cache_is_shared_by_instances(tmp_path):
+    path = str(tmp_path / "completions.sqlite")
+    writer = DiskCompletionCache(path)
+    writer.set("k", {"content": "neutral"})
+    reader = DiskCompletionCache(path)
+    assert reader.get("k") == {"content": "neutral"}
+    writer.close()
+    reader.close()
+
+
+def test_disk_cache_counts_writes_and_prunes_expired_rows_periodically(tmp_path, clock):
+    cache = DiskCompletionCache(str(tmp_path / "completions.sqlite"), ttl=5, max_entries=3, prune_every=4)
+    statements = []
+    cache._db.set_trace_callback(statements.append)
+    cache.set("a", {"v": 1})
+    cache.set("a", {"v": 2})
+    cache.set("b", {"v": 3})
+    # Rewriting a key does not count as a new entry, and no write counted the rows
+    assert cache._count == 2 and not any("COUNT" in sql for sql in statements)
+    clock.now += 10
+    cache.set("c", {"v": 4})
+    assert len(cache) == 1 and cache._count == 1
+    assert cache.stats()["evictions"] == 0
+    cache.close()
+
+
+def test_build_rejects_unknown_or_incomplete_backends():
+    assert isinstance(build_completion_cache("memory", ttl=1, max_entries=1), MemoryCompletionCache)
+    with pytest.raises(ValueError):
+        build_completion_cache("disk", ttl=1, max_entries=1)
+    with pytest.raises(ValueError):
+        build_completion_cache("redis", ttl=1, max_entries=1)
+
+
+def test_service_caches_deterministic_completions_only(make_service):
+    service = make_service(COMPLETION_CACHE_ENABLED=True)
+    first = service.create_completion(MESSAGES, model="gpt-4o-mini", temperature=0)
+    second = service.create_completion(MESSAGES, model="gpt-4o-mini", temperature=0)
+    assert (first["cache_hit"], second["cache_hit"]) == (False, True)
+    assert second["content"] == first["content"]
+    assert len(service.backend.calls) == 1
+    service.create_completion(MESSAGES, model="gpt-4o-mini", temperature=0.7)
+    service.create_completion(MESSAGES, model="gpt-4o-mini", temperature=0.7)
+    assert len(service.backend.calls) == 3
+    assert service.create_completion(MESSAGES, model="gpt-4o-mini", temperature=0, cache=False)["cache_hit"] is False
+    assert len(service.backend.calls) == 4
+
+
+async def test_service_cache_can_be_requested_per_call(make_service):
+    service = make_service()
+    await service.acreate_completion(MESSAGES, model="gpt-4o-mini", temperature=0.7, cache=True)
+    hit = await service.acreate_completion(MESSAGES, model="gpt-4o-mini", temperature=0.7, cache=True)
+    assert hit["cache_hit"] is True
+    assert len(service.backend.calls) == 1
@@ -0,0 +1,117 @@
+"""
+Tests for the embedding micro-batcher (sync and async).
+"""
+import asyncio
+from concurrent.futures import wait
+
+import pytest
+
+from app.utils.embedding_batcher import AsyncEmbeddingBatcher, EmbeddingBatcher
+
+
+class InputError(Exception):
+    status_code = 400
+
+
+def _vectors(texts):
+    return [[float(len(text))] for text in texts]
+
+
+class Recorder:
+    """embed_batch stand-in recording each batch; texts containing "bad" are rejected."""
+
+    def __init__(self, error=InputError):
+        self.batches = []
+        self.error = error
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        if any("bad" in text for text in texts):
+            raise self.error("bad input")
+        return _vectors(texts)
+
+    async def acall(self, texts):
+        await asyncio.sleep(0)
+        return self(texts)
+
+
+async def test_async_callers_share_batches_up_to_the_size_limit():
+    recorder = Recorder()
+    batcher = AsyncEmbeddingBatcher(recorder.acall, max_batch_size=4, max_wait=0.05)
+    texts = [f"text {i}" * (i + 1) for i in range(10)]
+    vectors = await asyncio.gather(*(batcher.embed(text) for text in texts))
+    assert vectors == _vectors(texts)
+    assert [len(batch) for batch in recorder.batches] == [4, 4, 2]
+    assert batcher.stats()["avg_batch_size"] == pytest.approx(10 / 3)
+
+
+async def test_async_batches_respect_the_token_limit():
+    recorder = Recorder()
+    batcher = AsyncEmbeddingBatcher(recorder.acall, max_batch_tokens=10, max_wait=0.01, count_tokens=len)
+    await asyncio.gather(*(batcher.embed(text) for text in ["aaaa", "bbbb", "cccc", "dd"]))
+    assert recorder.batches == [["aaaa", "bbbb"], ["cccc", "dd"]]
+
+
+async def test_async_lone_text_is_flushed_after_max_wait():
+    recorder = Recorder()
+    batcher = AsyncEmbeddingBatcher(recorder.acall, max_wait=0.01)
+    assert await asyncio.wait_for(batcher.embed("alone"), timeout=1) == [5.0]
+    assert recorder.batches == [["alone"]]
+
+
+async def test_async_bad_input_only_fails_its_own_caller():
+    recorder = Recorder()
+    batcher = AsyncEmbeddingBatcher(recorder.acall, max_wait=0.01)
+    results = await asyncio.gather(
+        *(batcher.embed(text) for text in ["ok one", "bad", "ok two", "ok three"]),
+        return_exceptions=True
+    )
+    assert isinstance(results[1], InputError)
+    assert [results[0], results[2], results[3]] == _vectors(["ok one", "ok two", "ok three"])
+    assert batcher.stats()["isolated_failures"] > 0
+
+
+async def test_async_upstream_outage_fails_the_whole_batch_without_bisecting():
+    recorder = Recorder(error=RuntimeError)
+    batcher = AsyncEmbeddingBatcher(recorder.acall, max_wait=0.01)
+    results = await asyncio.gather(batcher.embed("bad"), batcher.embed("fine"), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(recorder.batches) == 1
+
+
+def test_sync_callers_share_a_batch_and_close_flushes():
+    recorder = Recorder()
+    batcher = EmbeddingBatcher(recorder, max_batch_size=8, max_wait=0.2)
+    futures = [batcher.submit(f"t{i}") for i in range(5)]
+    batcher.close()
+    wait(futures, timeout=5)
+    assert [f.result() for f in futures] == _vectors([f"t{i}" for i in range(5)])
+    assert recorder.batches == [["t0", "t1", "t2", "t3", "t4"]]
+    with pytest.raises(RuntimeError):
+        batcher.submit("late")
+
+
+def test_sync_bad_input_only_fails_its_own_caller():
+    recorder = Recorder()
+    batcher = EmbeddingBatcher(recorder, max_batch_size=4, max_wait=0.2)
+    futures = [batcher.submit(text) for text in ["a", "bad", "c", "d"]]
+    wait(futures, timeout=5)
+    assert isinstance(futures[1].exception(), InputError)
+    assert [futures[i].result() for i in (0, 2, 3)] == _vectors(["a", "c", "d"])
+    batcher.close()
+
+
+def test_sync_rejects_short_vector_lists():
+    batcher = EmbeddingBatcher(lambda texts: [[1.0]], max_batch_size=2, max_wait=0.2)
+    futures = [batcher.submit("a"), batcher.submit("b")]
+    wait(futures, timeout=5)
+    assert isinstance(futures[0].exception(), ValueError)
+    batcher.close()
+
+
+async def test_service_coalesces_concurrent_embeddings(make_service):
+    service = make_service(EMBEDDING_CACHE_ENABLED=False, EMBEDDING_BATCH_MAX_WAIT_MS=20)
+    texts = ["alpha", "beta", "gamma"]
+    vectors = await asyncio.gather(*(service.aget_embedding(text) for text in texts))
+    assert vectors == [[5.0, 1.0], [4.0, 1.0], [5.0, 1.0]]
+    assert service.backend.calls == [("aembed", texts)]
@@ -0,0 +1,67 @@
+"""
+Tests for the content-addressed embedding cache and its use in OpenAIService.
+"""
+import pytest
+
+from app.utils.embedding_cache import EmbeddingCache, normalize_text, text_digest
+
+MODEL = "text-embedding-ada-002"
+
+
+def test_keys_ignore_whitespace_and_unicode_form():
+    assert normalize_text("  Apple beats \n estimates ") == "Apple beats estimates"
+    assert text_digest("caf\u00e9") == text_digest("cafe\u0301")
+
+
+def test_get_many_returns_hits_and_misses_in_order():
+    cache = EmbeddingCache()
+    cache.put(MODEL, "one", [0.5, 0.25])
+    assert cache.get_many(MODEL, ["two", "one", " one "]) == [None, [0.5, 0.25], [0.5, 0.25]]
+    assert cache.get("other-model", "one") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+
+
+def test_vectors_are_stored_at_float32_precision():
+    cache = EmbeddingCache()
+    cache.put(MODEL, "pi", [3.141592653589793])
+    assert cache.get(MODEL, "pi") == [pytest.approx(3.141592653589793, rel=1e-7)]
+    assert cache.get(MODEL, "pi") != [3.141592653589793]
+
+
+def test_lru_evicts_least_recently_used_within_the_byte_budget():
+    vector = [0.0] * 100
+    entry = 100 * 4 + 200
+    cache = EmbeddingCache(max_bytes=2 * entry)
+    cache.put(MODEL, "a", vector)
+    cache.put(MODEL, "b", vector)
+    cache.get(MODEL, "a")
+    cache.put(MODEL, "c", vector)
+    assert cache.get(MODEL, "b") is None
+    assert cache.get(MODEL, "a") == vector
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_disk_tier_is_shared_and_survives_clear(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    writer = EmbeddingCache(disk_path=path)
+    writer.put_many(MODEL, ["a", "b"], [[1.0], [2.0]])
+    writer.clear()
+    assert writer.get(MODEL, "a") == [1.0]
+    reader = EmbeddingCache(disk_path=path)
+    assert reader.get_many(MODEL, ["b", "c"]) == [[2.0], None]
+    assert reader.stats()["disk_hits"] == 1
+    writer.close()
+    reader.close()
+
+
+def test_service_only_embeds_cache_misses_once(make_service):
+    service = make_service(EMBEDDING_BATCH_ENABLED=False)
+    first = service.get_embeddings(["AAPL up", "MSFT down", "AAPL  up"])
+    assert first[0] == first[2]
+    assert service.backend.calls == [("embed", ["AAPL up", "MSFT down"])]
+    service.get_embeddings(["MSFT down", "TSLA flat"])
+    assert service.backend.calls[-1] == ("embed", ["TSLA flat"])
+    assert service.get_embedding("AAPL up") == first[0]
+    assert len(service.backend.calls) == 2
@@ -0,0 +1,145 @@
+"""
+Tests for the shared rate-limit backends.
+
+The Redis backend runs against fakeredis (with Lua support) as a local
+stand-in, so no Redis server is needed.
+"""
+import multiprocessing
+import time
+
+import pytest
+
+from app.utils.limiter_backends import FileLockLimiterBackend, MemoryLimiterBackend, RedisLimiterBackend
+from app.utils.token_bucket import Limit, RateLimitExceeded, TokenBucketLimiter
+
+LIMITS = [Limit("rpm", 5, 60.0), Limit("tpm", 100, 60.0)]
+
+
+def _redis_backend():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return RedisLimiterBackend(fakeredis.FakeRedis())
+
+
+@pytest.fixture(params=["memory", "file", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryLimiterBackend()
+    if request.param == "file":
+        return FileLockLimiterBackend(str(tmp_path))
+    return _redis_backend()
+
+
+def test_fail_fast_rejects_without_consuming(backend):
+    limiter = TokenBucketLimiter(LIMITS, backend=backend)
+    for _ in range(5):
+        assert limiter.try_acquire({"rpm": 1, "tpm": 10})
+    assert not limiter.try_acquire({"rpm": 1, "tpm": 10})
+    # The rejected call did not touch the TPM bucket
+    assert limiter.available()["tpm"] == pytest.approx(50, abs=0.5)
+
+
+def test_reserve_reports_wait_and_debt(backend):
+    limiter = TokenBucketLimiter(LIMITS, backend=backend)
+    assert limiter.reserve({"tpm": 100}) == 0
+    # 100 tpm refills at 100/60 per second, so 50 more tokens are due in ~30s
+    assert limiter.reserve({"tpm": 50}) == pytest.approx(30, abs=0.5)
+    with pytest.raises(RateLimitExceeded) as exc:
+        limiter.reserve({"tpm": 1}, max_wait=1)
+    assert exc.value.retry_after > 30
+
+
+def test_try_reserve_reports_remaining_in_one_call(backend):
+    rpm = LIMITS[0]
+    assert backend.try_reserve("k", [(rpm, 2)]) == (0, [pytest.approx(3, abs=0.01)])
+    assert backend.try_reserve("k", [(rpm, 3)])[1] == [pytest.approx(0, abs=0.01)]
+    wait, tokens = backend.try_reserve("k", [(rpm, 1)])
+    # Rejected: nothing is debited and the wait is until one request has refilled
+    assert wait == pytest.approx(12, abs=0.1)
+    assert tokens == [pytest.approx(0, abs=0.01)]
+    assert backend.available("k", [rpm])["rpm"] == pytest.approx(0, abs=0.01)
+
+
+def test_adjust_refunds_tokens(backend):
+    limiter = TokenBucketLimiter(LIMITS, backend=backend)
+    limiter.reserve({"tpm": 80})
+    limiter.adjust({"tpm": -60})
+    assert limiter.available()["tpm"] == pytest.approx(80, abs=0.5)
+
+
+def test_keys_are_independent(backend):
+    limiter = TokenBucketLimiter(LIMITS, backend=backend)
+    for _ in range(5):
+        limiter.reserve({"rpm": 1}, key="a")
+    assert not limiter.try_acquire({"rpm": 1}, key="a")
+    assert limiter.try_acquire({"rpm": 1}, key="b")
+
+
+def _take_all(directory, results):
+    limiter = TokenBucketLimiter([Limit("rpm", 20, 60.0)], backend=FileLockLimiterBackend(directory))
+    results.put(sum(limiter.try_acquire({"rpm": 1}) for _ in range(20)))
+
+
+def test_file_backend_shares_budget_across_processes(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_take_all, args=(str(tmp_path), results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    # Four workers each trying to spend the full budget still only get it once
+    assert sum(results.get() for _ in workers) == 20
+
+
+def test_memory_backend_evicts_idle_keys():
+    now = [0.0]
+    backend = MemoryLimiterBackend(clock=lambda: now[0], max_evictions=64)
+    limiter = TokenBucketLimiter([Limit("rpm", 60, 60.0)], backend=backend)
+    for i in range(100):
+        limiter.reserve({"rpm": 30}, key=f"client-{i}")
+    assert len(backend) == 100
+    # Every bucket has refilled after 30s; each call evicts a bounded batch of them
+    now[0] = 31.0
+    limiter.reserve({"rpm": 1}, key="active")
+    assert len(backend) == 100 - 64 + 1
+    limiter.reserve({"rpm": 1}, key="active")
+    assert len(backend) == 1
+    # Evicted keys come back with a full bucket, exactly as if they had been kept
+    assert limiter.available(key="client-0")["rpm"] == 60
+
+
+def test_memory_backend_keeps_buckets_still_refilling():
+    now = [0.0]
+    backend = MemoryLimiterBackend(clock=lambda: now[0])
+    limiter = TokenBucketLimiter([Limit("rpm", 60, 60.0)], backend=backend)
+    limiter.reserve({"rpm": 60}, key="drained")
+    now[0] = 30.0
+    limiter.reserve({"rpm": 1}, key="other")
+    assert limiter.available(key="drained")["rpm"] == pytest.approx(30)
+
+
+def test_file_backend_bounds_open_descriptors(tmp_path):
+    backend = FileLockLimiterBackend(str(tmp_path), max_open_files=8)
+    limiter = TokenBucketLimiter([Limit("rpm", 5, 60.0)], backend=backend)
+    for i in range(100):
+        limiter.reserve({"rpm": 5}, key=f"client-{i}")
+    assert len(backend._fds) <= 8
+    # State of keys whose descriptor was closed is still on disk
+    assert not limiter.try_acquire({"rpm": 1}, key="client-0")
+    backend.close()
+
+
+def test_file_backend_prunes_refilled_buckets(tmp_path):
+    fast = Limit("rps", 100, 1.0)
+    owner = FileLockLimiterBackend(str(tmp_path))
+    sweeper = FileLockLimiterBackend(str(tmp_path), sweep_interval=0)
+    owner.reserve("a", [(fast, 1)])
+    time.sleep(0.05)
+    sweeper.available("b", [fast])
+    assert len(sweeper) == 0
+    # The owner's cached descriptor points at the deleted file; its next write must be visible to others
+    owner.reserve("a", [(fast, 100)])
+    assert sweeper.available("a", [fast])["rps"] < 10
+    owner.close()
+    sweeper.close()
@@ -0,0 +1,177 @@
+"""
+Tests for the pooled LLM backends.
+
+Requests go to an httpx.MockTransport, so no provider is contacted; the
+recorded requests show what each backend sent and over which client.
+"""
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.services import llm_backends
+from app.services.llm_backends import OpenAIBackend, OpenRouterBackend, _usage_dict
+
+SETTINGS = SimpleNamespace(
+    HTTP2=False,
+    HTTP_MAX_CONNECTIONS=10,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS=5,
+    HTTP_KEEPALIVE_EXPIRY=30.0,
+    REQUEST_TIMEOUT=5.0,
+)
+
+USAGE = {
+    "prompt_tokens": 12,
+    "completion_tokens": 3,
+    "total_tokens": 15,
+    "prompt_tokens_details": {"cached_tokens": 8},
+}
+
+
+def _completion(model):
+    return {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": "hello"},
+            "finish_reason": "stop",
+        }],
+        "usage": USAGE,
+    }
+
+
+def _embeddings(texts):
+    return {
+        "object": "list",
+        "model": "text-embedding-ada-002",
+        "data": [
+            {"object": "embedding", "index": i, "embedding": [float(len(text)), 1.0]}
+            for i, text in enumerate(texts)
+        ],
+        "usage": {"prompt_tokens": 4, "total_tokens": 4},
+    }
+
+
+def _stream_body(model):
+    chunks = [
+        {"model": model, "choices": [{"index": 0, "delta": {"content": "hel"}}]},
+        {"model": model, "choices": [{"index": 0, "delta": {"content": "lo"}}]},
+        {"model": model, "choices": [], "usage": USAGE},
+    ]
+    lines = [": keep-alive"] + [f"data: {json.dumps(chunk)}" for chunk in chunks] + ["data: [DONE]"]
+    return "\n\n".join(lines) + "\n\n"
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Route every backend client through a mock transport; returns the recorded requests."""
+    seen = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        seen.append((request.url.path, body))
+        if request.url.path.endswith("/embeddings"):
+            return httpx.Response(200, json=_embeddings(body["input"]))
+        if body.get("stream"):
+            return httpx.Response(
+                200, text=_stream_body(body["model"]), headers={"content-type": "text/event-stream"}
+            )
+        return httpx.Response(200, json=_completion(body["model"]))
+
+    build = llm_backends.build_http_client_kwargs
+    monkeypatch.setattr(
+        llm_backends, "build_http_client_kwargs",
+        lambda settings: {**build(settings), "transport": httpx.MockTransport(handler)}
+    )
+    return seen
+
+
+def _backends():
+    return [
+        OpenAIBackend(SETTINGS, api_key="sk-test"),
+        OpenRouterBackend(SETTINGS, api_key="or-test", base_url="https://openrouter.test/api/v1/"),
+    ]
+
+
+PARAMS = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 5}
+
+
+def test_usage_dict_reports_cached_prompt_tokens():
+    assert _usage_dict(USAGE) == {
+        "prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15, "cached_tokens": 8
+    }
+    assert _usage_dict({"prompt_tokens": 2, "total_tokens": 2})["cached_tokens"] == 0
+    assert _usage_dict(None)["total_tokens"] == 0
+
+
+def test_http_client_kwargs_fall_back_without_h2(monkeypatch):
+    monkeypatch.setattr(llm_backends, "_http2_available", lambda: False)
+    kwargs = llm_backends.build_http_client_kwargs(SimpleNamespace(**{**vars(SETTINGS), "HTTP2": True}))
+    assert kwargs["http2"] is False
+    assert kwargs["timeout"] == httpx.Timeout(5.0)
+
+
+@pytest.mark.parametrize("index", [0, 1], ids=["openai", "openrouter"])
+def test_sync_calls_reuse_one_pooled_client(sent, index):
+    backend = _backends()[index]
+    client = backend.client
+    first = backend.complete(PARAMS)
+    backend.complete(PARAMS)
+    assert backend.client is client
+    assert len(sent) == 2
+    assert first["content"] == "hello"
+    assert first["usage"]["cached_tokens"] == 8
+    embedded = backend.embed(["ab", "abcd"], "text-embedding-ada-002")
+    assert embedded["embeddings"] == [[2.0, 1.0], [4.0, 1.0]]
+    backend.close()
+
+
+@pytest.mark.parametrize("index", [0, 1], ids=["openai", "openrouter"])
+async def test_async_client_is_lazy_shared_and_closed(sent, index):
+    backend = _backends()[index]
+    assert backend._async_client is None
+    client = backend.async_client
+    assert backend.async_client is client
+    result = await backend.acomplete(PARAMS)
+    vectors = await backend.aembed(["abc"], "text-embedding-ada-002")
+    assert result["content"] == "hello"
+    assert vectors["embeddings"] == [[3.0, 1.0]]
+    assert backend.async_client is client
+    await backend.aclose()
+    assert backend._async_client is None
+    backend.close()
+
+
+def test_openrouter_prefixes_bare_model_names(sent):
+    backend = OpenRouterBackend(SETTINGS, api_key="or-test", base_url="https://openrouter.test/api/v1", model_prefix="openai/")
+    backend.complete(PARAMS)
+    backend.complete({**PARAMS, "model": "anthropic/claude-3-haiku"})
+    assert [body["model"] for _, body in sent] == ["openai/gpt-4o-mini", "anthropic/claude-3-haiku"]
+    assert sent[0][0] == "/api/v1/chat/completions"
+    backend.close()
+
+
+@pytest.mark.parametrize("index", [0, 1], ids=["openai", "openrouter"])
+def test_stream_yields_deltas_then_usage(sent, index):
+    backend = _backends()[index]
+    events = [event for event in backend.stream(PARAMS) if event["type"] != "model"]
+    assert events == [
+        {"type": "delta", "content": "hel"},
+        {"type": "delta", "content": "lo"},
+        {"type": "usage", "model": "gpt-4o-mini", "usage": _usage_dict(USAGE)},
+    ]
+    assert sent[0][1]["stream_options"] == {"include_usage": True}
+    backend.close()
+
+
+async def test_astream_matches_stream(sent):
+    backend = OpenRouterBackend(SETTINGS, api_key="or-test", base_url="https://openrouter.test/api/v1")
+    events = [event async for event in backend.astream(PARAMS)]
+    assert "".join(e["content"] for e in events if e["type"] == "delta") == "hello"
+    assert events[-1]["usage"]["total_tokens"] == 15
+    await backend.aclose()
+    backend.close()
@@ -0,0 +1,146 @@
+"""
+Tests for failover and hedging across LLM backends, on fake backends.
+"""
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+from app.services.llm_router import BackendRouter, is_backend_failure
+from app.utils.circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError
+from tests.conftest import FakeBackend
+
+PARAMS = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}]}
+
+
+def _status_error(status):
+    response = httpx.Response(status, request=httpx.Request("POST", "https://api.test/v1"))
+    return openai.APIStatusError("upstream error", response=response, body=None)
+
+
+def _router(*backends, hedge_after=None, **breaker_kwargs):
+    kwargs = {"min_calls": 1, "failure_rate": 0.5, **breaker_kwargs}
+    return BackendRouter(
+        [(backend, CircuitBreaker(backend.name, **kwargs)) for backend in backends], hedge_after=hedge_after
+    )
+
+
+class SlowBackend(FakeBackend):
+    def __init__(self, delay, **kwargs):
+        super().__init__(**kwargs)
+        self.delay = delay
+
+    def complete(self, params):
+        time.sleep(self.delay)
+        return super().complete(params)
+
+    async def acomplete(self, params):
+        await asyncio.sleep(self.delay)
+        return await super().acomplete(params)
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (httpx.ConnectError("refused"), True),
+    (_status_error(503), True),
+    (_status_error(401), True),
+    (_status_error(400), False),
+    (CircuitOpenError("open", 1.0), True),
+])
+def test_is_backend_failure(exc, expected):
+    assert is_backend_failure(exc) is expected
+
+
+def test_fails_over_to_the_next_backend():
+    primary = FakeBackend(reply="primary", errors=[httpx.ConnectError("down")], name="primary")
+    backup = FakeBackend(reply="backup", name="backup")
+    router = _router(primary, backup)
+    assert router.complete(PARAMS)["content"] == "backup"
+    assert router.stats()["failovers"] == 1
+    # The failure opened the primary's breaker, so the next call skips it
+    assert router.routes[0][1].state == OPEN
+    assert router.complete(PARAMS)["content"] == "backup"
+    assert len(primary.calls) == 1
+
+
+def test_bad_requests_do_not_fail_over_or_trip_the_breaker():
+    primary = FakeBackend(errors=[_status_error(400)], name="primary")
+    backup = FakeBackend(name="backup")
+    router = _router(primary, backup)
+    with pytest.raises(openai.APIStatusError):
+        router.complete(PARAMS)
+    assert backup.calls == []
+    assert router.routes[0][1].state != OPEN
+
+
+def test_raises_circuit_open_when_every_backend_is_down():
+    primary = FakeBackend(errors=[httpx.ConnectError("down")], name="primary")
+    backup = FakeBackend(errors=[httpx.ConnectError("down")], name="backup")
+    router = _router(primary, backup, open_seconds=30.0)
+    with pytest.raises(httpx.ConnectError):
+        router.complete(PARAMS)
+    with pytest.raises(CircuitOpenError) as excinfo:
+        router.complete(PARAMS)
+    assert 0 < excinfo.value.retry_after <= 30.0
+
+
+async def test_async_failover():
+    primary = FakeBackend(errors=[_status_error(503)], name="primary")
+    backup = FakeBackend(reply="backup", name="backup")
+    router = _router(primary, backup)
+    assert (await router.acomplete(PARAMS))["content"] == "backup"
+    vectors = await router.aembed(["abc"], "text-embedding-ada-002")
+    assert vectors["embeddings"] == [[3.0, 1.0]]
+
+
+def test_hedges_slow_backends():
+    router = _router(SlowBackend(0.5, reply="slow", name="primary"), FakeBackend(reply="fast", name="backup"), hedge_after=0.02)
+    assert router.complete(PARAMS)["content"] == "fast"
+    assert (router.stats()["hedges"], router.stats()["hedge_wins"]) == (1, 1)
+    router.close()
+
+
+def test_fast_primary_is_not_hedged():
+    backup = FakeBackend(name="backup")
+    router = _router(FakeBackend(reply="fast", name="primary"), backup, hedge_after=0.5)
+    assert router.complete(PARAMS)["content"] == "fast"
+    assert backup.calls == []
+    router.close()
+
+
+async def test_async_hedge_cancels_the_loser():
+    primary = SlowBackend(5.0, reply="slow", name="primary")
+    router = _router(primary, FakeBackend(reply="fast", name="backup"), hedge_after=0.02)
+    result = await asyncio.wait_for(router.acomplete(PARAMS), timeout=2)
+    assert result["content"] == "fast"
+    assert router.stats()["hedge_wins"] == 1
+    # The cancelled request was neither a success nor a failure
+    assert router.routes[0][1].stats()["calls"] == 0
+
+
+def test_streams_fail_over_only_before_the_first_event():
+    primary = FakeBackend(errors=[httpx.ConnectError("down")], name="primary")
+    router = _router(primary, FakeBackend(reply="from backup", name="backup"))
+    deltas = [e["content"] for e in router.stream(PARAMS) if e["type"] == "delta"]
+    assert "".join(deltas) == "from backup "
+
+    class Breaks(FakeBackend):
+        def stream(self, params):
+            yield {"type": "delta", "content": "partial"}
+            raise httpx.ConnectError("dropped")
+
+    backup = FakeBackend(name="backup")
+    router = _router(Breaks(name="primary"), backup)
+    with pytest.raises(httpx.ConnectError):
+        list(router.stream(PARAMS))
+    assert backup.calls == []
+
+
+def test_service_reports_routing_stats(make_service):
+    router = _router(FakeBackend(errors=[httpx.ConnectError("down")], name="primary"), FakeBackend(name="backup"))
+    service = make_service(router, SINGLEFLIGHT_ENABLED=False)
+    assert service.create_completion([{"role": "user", "content": "hi"}], model="gpt-4o-mini")["content"] == "ok"
+    routing = service.get_metrics()["routing"]
+    assert routing["failovers"] == 1
+    assert [b["name"] for b in routing["backends"]] == ["primary", "backup"]
@@ -0,0 +1,26 @@
+"""App lifespan: startup must not depend on LLM configuration, and restarts get a fresh service."""
+from fastapi.testclient import TestClient
+
+from app.config.openai_config import get_openai_settings
+from app.dependencies import get_openai_service
+from app.main import app
+
+
+def test_app_starts_without_openai_key(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    with TestClient(app) as client:
+        assert client.get("/").status_code == 200
+
+
+def test_each_lifespan_gets_an_open_service(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    get_openai_settings.cache_clear()
+    get_openai_service.cache_clear()
+    with TestClient(app):
+        first = get_openai_service()
+    assert first.client.is_closed()
+    with TestClient(app):
+        second = get_openai_service()
+        assert second is not first
+        assert not second.client.is_closed()
+    get_openai_settings.cache_clear()
@@ -0,0 +1,84 @@
+"""
+Tests for per-request model selection.
+"""
+import pytest
+
+from app.services.model_router import ModelRouter
+
+PRICING = {
+    "gpt-4o-mini": {"input": 0.00015, "output": 0.0006},
+    "gpt-3.5-turbo": {"input": 0.0005, "output": 0.0015},
+    "gpt-4o": {"input": 0.0025, "output": 0.01},
+    "gpt-4-turbo": {"input": 0.01, "output": 0.03},
+    "gpt-4": {"input": 0.03, "output": 0.06},
+}
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(PRICING, default_model="gpt-4-turbo")
+
+
+def test_agent_tier_picks_the_cheapest_adequate_model(router):
+    assert router.select("sentiment", prompt_tokens=100, max_output_tokens=1).model == "gpt-4o-mini"
+    choice = router.select("news", prompt_tokens=1000, max_output_tokens=500)
+    assert choice.model == "gpt-4o"
+    assert choice.rejected["gpt-4o-mini"] == "quality 1 < 2"
+    assert choice.estimated_cost == pytest.approx(1000 / 1000 * 0.0025 + 500 / 1000 * 0.01)
+
+
+def test_unknown_agents_get_the_default_models_tier(router):
+    choice = router.select("earnings", prompt_tokens=100, max_output_tokens=100)
+    assert choice.model == "gpt-4-turbo"
+    assert choice.rejected["gpt-4-turbo-preview"] == "no pricing"
+
+
+def test_context_window_and_json_mode_rule_models_out(router):
+    choice = router.select("earnings", prompt_tokens=10000, max_output_tokens=500)
+    assert choice.rejected["gpt-4"] == "context 10500 > 8192"
+    json_choice = router.select("earnings", prompt_tokens=100, max_output_tokens=100, response_format="json")
+    assert json_choice.rejected["gpt-4"] == "no JSON mode"
+
+
+def test_cost_budget_falls_back_to_the_closest_model(router):
+    choice = router.select("news", prompt_tokens=1000, max_output_tokens=500, max_cost=0.000001)
+    assert choice.model == "gpt-4o"
+    assert choice.reason.startswith("no model meets the budget")
+
+
+def test_observed_latency_steers_latency_bound_traffic(router):
+    router.record("gpt-4o-mini", latency=10.0, output_tokens=0)
+    choice = router.select("sentiment", prompt_tokens=100, max_output_tokens=50, max_latency=2.0)
+    assert choice.model == "gpt-3.5-turbo"
+    assert choice.rejected["gpt-4o-mini"].startswith("latency")
+
+
+def test_latency_overhead_is_an_ewma(router):
+    router.record("gpt-4o", latency=2.0, output_tokens=60)
+    router.record("gpt-4o", latency=6.0, output_tokens=60)
+    # Output time (60 tokens at 60 tok/s) is subtracted before averaging
+    assert router.stats()["latency_overhead"]["gpt-4o"] == pytest.approx(0.2 * 5.0 + 0.8 * 1.0)
+    router.record("unknown-model", latency=1.0, output_tokens=1)
+    assert "unknown-model" not in router.stats()["samples"]
+
+
+def test_nothing_eligible_uses_the_default_model(router):
+    choice = router.select("sentiment", prompt_tokens=500000, max_output_tokens=100)
+    assert choice.model == "gpt-4-turbo"
+    assert router.stats()["selections"] == {"gpt-4-turbo": 1}
+
+
+def test_service_routes_only_unpinned_agent_calls(make_service):
+    service = make_service(MODEL_ROUTING_ENABLED=True, SINGLEFLIGHT_ENABLED=False)
+    messages = [{"role": "user", "content": "Label this headline"}]
+    service.create_completion(messages, agent_type="sentiment", max_tokens=1)
+    service.create_completion(messages, model="gpt-4", agent_type="sentiment", max_tokens=1)
+    service.create_completion(messages, max_tokens=1)
+    models = [params["model"] for _, params in service.backend.calls]
+    assert models == ["gpt-4o-mini", "gpt-4", service.settings.default_model]
+
+
+def test_service_uses_agent_models_unless_routing_is_enabled(make_service):
+    service = make_service()
+    service.create_completion([{"role": "user", "content": "hi"}], agent_type="sentiment", max_tokens=1)
+    assert service.backend.calls[0][1]["model"] == service.settings.agent_models["sentiment"]
@@ -0,0 +1,45 @@
+"""
+Tests for OpenAIService request handling, on a fake backend (see conftest.py).
+"""
+import asyncio
+
+from tests.conftest import FakeBackend
+
+MESSAGES = [{"role": "user", "content": "How is AAPL doing?"}]
+
+
+async def test_async_completion_uses_the_async_backend(make_service):
+    service = make_service(SINGLEFLIGHT_ENABLED=False)
+    result = await service.acreate_completion(MESSAGES, model="gpt-4o-mini", max_tokens=5)
+    assert result["content"] == "ok"
+    assert result["cache_hit"] is False
+    assert [op for op, _ in service.backend.calls] == ["acomplete"]
+    assert service.backend.calls[0][1]["max_tokens"] == 5
+
+
+async def test_async_completions_run_concurrently(make_service):
+    gate = asyncio.Event()
+    entered = []
+
+    class SlowBackend(FakeBackend):
+        async def acomplete(self, params):
+            entered.append(params["messages"][0]["content"])
+            if len(entered) == 3:
+                gate.set()
+            await gate.wait()
+            return await super().acomplete(params)
+
+    service = make_service(SlowBackend(), SINGLEFLIGHT_ENABLED=False)
+    results = await asyncio.wait_for(asyncio.gather(*(
+        service.acreate_completion([{"role": "user", "content": str(i)}], model="gpt-4o-mini")
+        for i in range(3)
+    )), timeout=5)
+    assert sorted(entered) == ["0", "1", "2"]
+    assert all(r["content"] == "ok" for r in results)
+
+
+async def test_lifecycle_closes_the_backend(make_service):
+    service = make_service()
+    await service.astart()
+    await service.aclose()
+    assert service.backend.closed
@@ -0,0 +1,97 @@
+import re
+
+from app.utils.prompt_builder import (
+    SUMMARY_TEMPLATE,
+    build_markdown_report,
+    build_news_with_urls_markdown,
+    build_sec_filing_summary_markdown,
+    build_stock_messages,
+    build_stock_prompt,
+    build_stock_prompt_with_budget,
+    iter_news_with_urls_markdown,
+    iter_sec_filing_summary_markdown,
+    render_many,
+    render_value,
+)
+
+
+def _doc(symbol, score, **meta):
+    return {"score": score, "metadata": {"symbol": symbol, "Name": f"{symbol} Inc", "Sector": "Tech", **meta}}
+
+
+def test_no_budget_keeps_every_doc():
+    docs = [_doc("AAPL", 0.1), _doc("AAPL", 0.9)]
+    prompt = build_stock_prompt(docs=docs, question="Q?")
+    assert prompt.count("## Overview\n- **Name**: AAPL Inc") == 2
+
+
+def test_budget_ranks_and_collapses_symbols():
+    docs = [_doc("AAPL", 0.2, TrailingPE=30), _doc("MSFT", 0.9), _doc("aapl", 0.5, ForwardPE=25)]
+    result = build_stock_prompt_with_budget(docs=docs, question="Q?", max_prompt_tokens=4000)
+    assert result.docs_used == 2
+    assert result.symbols_collapsed == 1
+    assert result.prompt.index("MSFT Inc") < result.prompt.index("aapl Inc")
+    # Collapsed block keeps the best-scored values and fills gaps from the others
+    assert "| - | - | - | 25 | - | - | 30 |" in result.prompt
+
+
+def test_budget_is_respected():
+    docs = [_doc(f"S{i}", i / 100) for i in range(50)]
+    for budget in (700, 1200, 2500):
+        result = build_stock_prompt_with_budget(
+            docs=docs, question="Q?", max_prompt_tokens=budget, count_tokens=len
+        )
+        assert result.prompt_tokens == len(result.prompt) <= budget
+        assert result.docs_used + result.docs_dropped == 50
+        assert result.truncated
+
+
+def _regex_report(template, context):
+    # The original per-call regex substitution, kept as the reference implementation
+    def replacer(match):
+        key = match.group(1)
+        return render_value(context.get(key, f"{{{{{key}}}}}"))
+    return re.sub(r"\{\{(\w+)\}\}", replacer, template)
+
+
+def _contexts(n):
+    keys = re.findall(r"\{\{(\w+)\}\}", SUMMARY_TEMPLATE)
+    values = [1.5, None, "text", ["a", "b"], {"Date": ["2024", "2025"], "EPS": [1.2, 1.4]}, {}]
+    return [{key: values[(i + j) % len(values)] for j, key in enumerate(keys) if (i + j) % 7} for i in range(n)]
+
+
+def test_compiled_template_matches_regex_path():
+    for context in _contexts(50):
+        assert build_markdown_report(SUMMARY_TEMPLATE, context) == _regex_report(SUMMARY_TEMPLATE, context)
+    for template in ("", "plain", "{{a}}{{b}}", "{{ a }} {{a}} {{b"):
+        assert build_markdown_report(template, {"a": [1]}) == _regex_report(template, {"a": [1]})
+
+
+def test_render_many_matches_single_renders():
+    contexts = _contexts(20)
+    assert render_many(SUMMARY_TEMPLATE, contexts) == [_regex_report(SUMMARY_TEMPLATE, c) for c in contexts]
+
+
+def test_messages_share_a_static_prefix():
+    first = build_stock_messages(docs=[_doc("AAPL", 0.5)], question="Buy?")
+    second = build_stock_messages(docs=[_doc("MSFT", 0.9), _doc("NVDA", 0.1)], question="Risks?")
+    assert first[0] == second[0]
+    assert first[0]["role"] == "system" and "MSFT" not in second[0]["content"]
+    assert "MSFT Inc" in second[1]["content"] and second[1]["content"].endswith("User question: Risks?")
+
+    budgeted = build_stock_messages(docs=[_doc("AAPL", 0.5)], question="Buy?", max_prompt_tokens=4000)
+    assert budgeted == first
+
+
+def test_section_iterators_stream_and_cap():
+    news = [{"title": f"T{i}", "url": f"https://example.com/{i}"} for i in range(5)]
+    chunks = list(iter_news_with_urls_markdown(news, max_items=2))
+    assert chunks == ["- **[T0](https://example.com/0)**", "\n- **[T1](https://example.com/1)**"]
+    assert "".join(iter_news_with_urls_markdown(news)) == build_news_with_urls_markdown(news)
+
+    filings = ({"date": f"2024-01-0{i}", "type": "8-K", "summary": "s"} for i in range(1, 10))
+    rows = list(iter_sec_filing_summary_markdown("AAPL", filings, max_items=3))
+    assert len(rows) == 4 and rows[-1] == "| 2024-01-03 | 8-K | s |\n"
+    assert build_sec_filing_summary_markdown("AAPL", [{}]).endswith(
+        "| No filings with displayable metadata found. | | |\n"
+    )
@@ -0,0 +1,90 @@
+"""Tests for the endpoint rate limiter (per-route / per-plan policies and headers)."""
+import pytest
+from fastapi import Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.utils.limiter_backends import MemoryLimiterBackend
+from app.utils.rate_limiter import RateLimiter, load_policies, policy
+
+
+def make_client(limiter):
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def identify(request: Request, call_next):
+        request.state.user_id = request.headers.get("x-user")
+        request.state.plan = request.headers.get("x-plan")
+        return await call_next(request)
+
+    @app.get("/quotes/{symbol}", dependencies=[Depends(limiter)])
+    async def quote(symbol: str):
+        return {"symbol": symbol}
+
+    @app.get("/analyze", dependencies=[Depends(limiter)])
+    async def analyze():
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def test_headers_count_down_then_429_with_retry_after():
+    client = make_client(RateLimiter({"anonymous": policy(60, 60.0, burst=3)}, backend=MemoryLimiterBackend()))
+    remaining = [client.get("/quotes/AAPL").headers["X-RateLimit-Remaining"] for _ in range(3)]
+    assert remaining == ["2", "1", "0"]
+
+    rejected = client.get("/quotes/AAPL")
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "1"
+    assert rejected.headers["X-RateLimit-Limit"] == "3"
+    assert rejected.headers["X-RateLimit-Remaining"] == "0"
+    assert rejected.headers["X-RateLimit-Reset"] == "3"
+
+
+def test_plans_get_their_own_policies():
+    limiter = RateLimiter(
+        {"free": policy(1, 60.0), "pro": policy(100, 60.0, burst=10), "default": policy(2, 60.0)},
+        backend=MemoryLimiterBackend(),
+    )
+    client = make_client(limiter)
+    assert client.get("/analyze", headers={"x-user": "a", "x-plan": "free"}).status_code == 200
+    assert client.get("/analyze", headers={"x-user": "a", "x-plan": "free"}).status_code == 429
+    pro = client.get("/analyze", headers={"x-user": "b", "x-plan": "pro"})
+    assert pro.headers["X-RateLimit-Limit"] == "10"
+    # Unknown plans use the default entry
+    assert client.get("/analyze", headers={"x-user": "c", "x-plan": "trial"}).headers["X-RateLimit-Limit"] == "2"
+
+
+def test_route_policies_have_separate_budgets():
+    limiter = RateLimiter(
+        {"anonymous": policy(5, 60.0)},
+        routes={"/analyze": {"anonymous": policy(1, 60.0)}},
+        backend=MemoryLimiterBackend(),
+    )
+    client = make_client(limiter)
+    assert client.get("/analyze").status_code == 200
+    assert client.get("/analyze").status_code == 429
+    # Templated paths share one route budget; the global budget is untouched by /analyze
+    assert client.get("/quotes/AAPL").headers["X-RateLimit-Remaining"] == "4"
+    assert client.get("/quotes/MSFT").headers["X-RateLimit-Remaining"] == "3"
+
+
+def test_no_policy_means_unlimited():
+    client = make_client(RateLimiter({}, backend=MemoryLimiterBackend()))
+    response = client.get("/analyze")
+    assert response.status_code == 200
+    assert "X-RateLimit-Limit" not in response.headers
+
+
+def test_load_policies_from_env(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_POLICIES", '{"pro": {"rate": 600, "burst": 50}, "free": {"rate": 1, "period": 5}}')
+    assert load_policies() == {"pro": policy(600, 60.0, burst=50), "free": policy(1, 5.0)}
+    monkeypatch.setenv("RATE_LIMIT_POLICIES", '{"pro": {"period": 60}}')
+    with pytest.raises(ValueError):
+        load_policies()
+
+
+def test_legacy_interval_env(monkeypatch):
+    monkeypatch.delenv("RATE_LIMIT_POLICIES", raising=False)
+    monkeypatch.setenv("RATE_LIMIT_INTERVAL", "0")
+    monkeypatch.setenv("RATE_LIMIT_INTERVAL_IP", "10")
+    assert load_policies() == {"anonymous": policy(1, 10.0, burst=1)}
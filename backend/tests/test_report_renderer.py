@@ -0,0 +1,45 @@
+from app.utils.prompt_builder import (
+    SUMMARY_TEMPLATE,
+    build_markdown_report,
+    build_news_with_urls_markdown,
+    build_sec_filing_summary_markdown,
+)
+from app.utils.report_renderer import ReportRenderer, split_sections
+
+
+def _context(news):
+    return {
+        "symbol": "AAPL",
+        "Name": "Apple Inc",
+        "EPS": 6.1,
+        "news_items": [{"title": title, "url": f"https://example.com/{title}"} for title in news],
+        "sec_filings": [{"date": "2024-01-01", "type": "10-K", "summary": "Annual report"}],
+    }
+
+
+def test_split_sections_round_trips():
+    sections = split_sections(SUMMARY_TEMPLATE)
+    assert "".join(text for _, text in sections) == SUMMARY_TEMPLATE
+    assert [name for name, _ in sections][1:] == [
+        "Company Overview", "Key Metrics", "News Headlines", "SEC Filings Table", "Reddit Sentiment"
+    ]
+
+
+def test_only_changed_sections_rerender():
+    renderer = ReportRenderer()
+    first = _context(["a", "b"])
+    report = renderer.render(first)
+    expected_context = {
+        **first,
+        "news_with_urls": build_news_with_urls_markdown(first["news_items"]),
+        "sec_filings_table": build_sec_filing_summary_markdown("AAPL", first["sec_filings"]),
+    }
+    assert report == build_markdown_report(SUMMARY_TEMPLATE, expected_context)
+    assert "{{reddit_sentiment}}" in report
+
+    second = _context(["c"])
+    assert "example.com/c" in renderer.render(second)
+    sections = renderer.stats()["sections"]
+    assert sections["Company Overview"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert sections["News Headlines"]["hits"] == 0
+    assert sections["SEC Filings Table"]["hits"] == 1
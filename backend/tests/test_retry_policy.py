@@ -0,0 +1,170 @@
+"""
+Tests for the retry engine: error classification, server hints, backoff and the retry budget.
+"""
+import time
+from email.utils import formatdate
+
+import httpx
+import openai
+import pytest
+
+from app.utils import retry_policy
+from app.utils.retry_policy import (
+    RetryBudget,
+    RetryPolicy,
+    classify_error,
+    parse_duration,
+    retry_after_from_headers,
+)
+from tests.conftest import FakeBackend
+
+
+def _status_error(status, headers=None, code=None):
+    response = httpx.Response(status, request=httpx.Request("POST", "https://api.test/v1"), headers=headers)
+    return openai.APIStatusError("upstream error", response=response, body={"code": code} if code else None)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    slept = []
+
+    async def asleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(retry_policy.time, "sleep", slept.append)
+    monkeypatch.setattr(retry_policy.asyncio, "sleep", asleep)
+    return slept
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("20ms", 0.02), ("1.5s", 1.5), ("6m0s", 360.0), ("1h2m", 3720.0), ("7", 7.0), ("soon", None), ("5x", None),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == (pytest.approx(seconds) if seconds is not None else None)
+
+
+def test_retry_after_hints():
+    assert retry_after_from_headers({"retry-after-ms": "250", "retry-after": "9"}) == pytest.approx(0.25)
+    assert retry_after_from_headers({"retry-after": "3"}) == 3.0
+    date = formatdate(time.time() + 30, usegmt=True)
+    assert retry_after_from_headers({"retry-after": date}) == pytest.approx(30, abs=2)
+    assert retry_after_from_headers({
+        "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2s",
+        "x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "6m0s",
+    }) == pytest.approx(360.0)
+    # Budgets that are not exhausted carry no hint
+    assert retry_after_from_headers({"x-ratelimit-remaining-tokens": "10", "x-ratelimit-reset-tokens": "1s"}) is None
+    assert retry_after_from_headers(None) is None
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (httpx.ConnectError("refused"), (True, None)),
+    (_status_error(503), (True, None)),
+    (_status_error(429, headers={"retry-after": "2"}), (True, 2.0)),
+    (_status_error(429, code="insufficient_quota"), (False, None)),
+    (_status_error(400), (False, None)),
+    (ValueError("local bug"), (False, None)),
+])
+def test_classify_error(exc, expected):
+    assert classify_error(exc) == expected
+
+
+def test_budget_caps_retries_to_a_share_of_recent_requests():
+    clock = Clock()
+    budget = RetryBudget(ratio=0.5, min_retries=1, window=10.0, clock=clock)
+    for _ in range(4):
+        budget.record_request()
+    assert [budget.try_spend() for _ in range(4)] == [True, True, True, False]
+    assert budget.stats()["denied"] == 1
+    # Old traffic ages out of the window, and with it the spent retries
+    clock.now += 11
+    assert budget.stats()["requests"] == 0
+    assert budget.try_spend()
+
+
+def test_retries_transient_errors_then_succeeds(no_sleep):
+    policy = RetryPolicy(max_attempts=3, base_delay=0.1, max_delay=1.0)
+    outcomes = [httpx.ConnectError("down"), _status_error(502), "ok"]
+
+    def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert policy.call(call) == "ok"
+    assert len(no_sleep) == 2
+    assert all(0.1 <= delay <= 1.0 for delay in no_sleep)
+    assert policy.stats()["retries"] == 2
+
+
+def test_gives_up_after_max_attempts_or_on_permanent_errors(no_sleep):
+    policy = RetryPolicy(max_attempts=2, base_delay=0)
+    calls = []
+
+    @policy
+    def always_down():
+        calls.append(1)
+        raise httpx.ConnectError("down")
+
+    with pytest.raises(httpx.ConnectError):
+        always_down()
+    assert len(calls) == 2
+
+    calls.clear()
+
+    @policy
+    def bad_request():
+        calls.append(1)
+        raise _status_error(400)
+
+    with pytest.raises(openai.APIStatusError):
+        bad_request()
+    assert len(calls) == 1
+
+
+def test_server_hint_wins_unless_it_is_too_long(no_sleep):
+    policy = RetryPolicy(max_attempts=3, base_delay=0, max_retry_after=5)
+    state = policy.start()
+    assert 2.0 <= state.backoff(_status_error(429, headers={"retry-after": "2"})) <= 2.2
+    assert state.backoff(_status_error(429, headers={"retry-after": "60"})) is None
+
+
+def test_exhausted_budget_stops_retries(no_sleep):
+    budget = RetryBudget(ratio=0, min_retries=0)
+    policy = RetryPolicy(max_attempts=5, base_delay=0, budget=budget)
+    with pytest.raises(httpx.ConnectError):
+        policy.call(lambda: (_ for _ in ()).throw(httpx.ConnectError("down")))
+    assert budget.stats()["denied"] == 1
+    assert no_sleep == []
+
+
+async def test_async_functions_are_retried_without_blocking(no_sleep):
+    policy = RetryPolicy(max_attempts=3, base_delay=0)
+    failures = [httpx.ReadTimeout("slow")]
+
+    @policy
+    async def fetch():
+        if failures:
+            raise failures.pop()
+        return "ok"
+
+    assert await fetch() == "ok"
+    assert len(no_sleep) == 1
+
+
+def test_service_retries_upstream_errors(make_service, no_sleep):
+    backend = FakeBackend(errors=[_status_error(503)])
+    service = make_service(backend, SINGLEFLIGHT_ENABLED=False)
+    result = service.create_completion([{"role": "user", "content": "hi"}], model="gpt-4o-mini")
+    assert result["content"] == "ok"
+    assert len(backend.calls) == 2
+    assert service.get_metrics()["retries"]["retries"] == 1
@@ -0,0 +1,87 @@
+"""
+Tests for batched sentiment classification in OpenAIService, on a fake backend.
+"""
+import re
+
+import pytest
+
+from app.services.openai_service import OpenAIService
+from tests.conftest import FakeBackend
+
+_NUMBERED_TEXT_RE = re.compile(r"^(\d+)\. (.*)$")
+
+
+def _label(text):
+    if "up" in text:
+        return "positive"
+    if "down" in text:
+        return "negative"
+    return "neutral"
+
+
+def classify(params):
+    """Answer sentiment prompts the way a well-behaved model would."""
+    prompt = params["messages"][0]["content"]
+    if "Texts:\n" not in prompt:
+        return _label(prompt.split("Text: ", 1)[1])
+    lines = prompt.split("Texts:\n", 1)[1].splitlines()
+    return "\n".join(
+        f"{match.group(1)}: {_label(match.group(2))}"
+        for match in map(_NUMBERED_TEXT_RE.match, lines)
+    )
+
+
+@pytest.mark.parametrize("content, expected", [
+    ("1: positive\n2: Negative\n3: neutral", ["positive", "negative", "neutral"]),
+    ("(2) negative\n1. positive\n3 - neutral", ["positive", "negative", "neutral"]),
+    ("positive\nnegative\nneutral", ["positive", "negative", "neutral"]),
+    ("1: positive\n3: neutral", None),
+    ("positive\nnegative", None),
+    ("1: bullish\n2: bearish\n3: flat", None),
+    ("", None),
+])
+def test_parse_sentiment_batch(content, expected):
+    assert OpenAIService._parse_sentiment_batch(content, 3) == expected
+
+
+def test_batches_respect_the_item_limit(make_service):
+    service = make_service()
+    batches = service._sentiment_batches([f"headline {i}" for i in range(7)], batch_size=3)
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+
+
+def test_batch_labels_come_back_in_input_order(make_service):
+    service = make_service(FakeBackend(reply=classify))
+    texts = ["AAPL up 3%", "TSLA down 5%", "", "Fed holds rates", "AAPL up 3%", "MSFT up 1%"]
+    labels = service.analyze_sentiment_batch(texts, batch_size=2, local=False)
+    assert labels == ["positive", "negative", "neutral", "neutral", "positive", "positive"]
+    # Four distinct non-empty texts in batches of two
+    assert len(service.backend.calls) == 2
+
+
+def test_unparseable_replies_are_re_split(make_service):
+    def sloppy(params):
+        prompt = params["messages"][0]["content"]
+        if "Texts:\n" in prompt and prompt.count("\n") > 4:
+            return "Mostly positive overall."
+        return classify(params)
+
+    service = make_service(FakeBackend(reply=sloppy))
+    texts = ["up one", "down two", "flat three", "up four"]
+    assert service.analyze_sentiment_batch(texts, batch_size=4, local=False) == [
+        "positive", "negative", "neutral", "positive"
+    ]
+    assert len(service.backend.calls) == 3
+
+
+def test_failed_batches_fall_back_to_neutral(make_service):
+    service = make_service(FakeBackend(errors=[ValueError("bad request")]))
+    assert service.analyze_sentiment_batch(["up", "down"], local=False) == ["neutral", "neutral"]
+
+
+async def test_async_batch_matches_sync(make_service):
+    service = make_service(FakeBackend(reply=classify))
+    texts = ["up a", "down b", "c", "up d", "down e"]
+    labels = await service.aanalyze_sentiment_batch(texts, batch_size=2, local=False)
+    assert labels == ["positive", "negative", "neutral", "positive", "negative"]
+    assert len(service.backend.calls) == 3
@@ -0,0 +1,42 @@
+"""Tests for the local sentiment classifier's calibration CLI."""
+import json
+
+import app.dependencies
+from app.utils.sentiment_classifier import _main
+
+
+class FakeService:
+    def __init__(self):
+        self.calls = []
+
+    def analyze_sentiment_batch(self, texts, local=None):
+        self.calls.append({"texts": list(texts), "local": local})
+        return ["positive" if "beat" in text else "negative" for text in texts]
+
+
+def test_main_labels_unlabeled_rows_with_the_llm(tmp_path, monkeypatch, capsys):
+    service = FakeService()
+    monkeypatch.setattr(app.dependencies, "get_openai_service", lambda: service)
+    data = tmp_path / "data.jsonl"
+    data.write_text("\n".join(json.dumps({"text": t}) for t in ["Earnings beat estimates", "Shares plunge"]))
+
+    _main([str(data), "--thresholds", "0.5"])
+
+    # Unlabeled rows need a service even without flags, and labels must skip the local fast path
+    assert service.calls == [{"texts": ["Earnings beat estimates", "Shares plunge"], "local": False}]
+    report = json.loads(capsys.readouterr().out)
+    assert report["texts"] == 2
+    assert report["llm_seconds_per_text"] is not None
+
+
+def test_main_uses_labels_from_the_file(tmp_path, monkeypatch, capsys):
+    def no_service():
+        raise AssertionError("the file already has every label")
+
+    monkeypatch.setattr(app.dependencies, "get_openai_service", no_service)
+    data = tmp_path / "data.jsonl"
+    data.write_text(json.dumps({"text": "Shares plunge", "label": "negative"}))
+
+    _main([str(data)])
+
+    assert json.loads(capsys.readouterr().out)["llm_seconds_per_text"] is None
@@ -0,0 +1,116 @@
+"""
+Tests for single-flight request coalescing.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.utils.singleflight import AsyncSingleFlight, SingleFlight
+from tests.conftest import FakeBackend
+
+
+def test_concurrent_threads_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+
+    def caller():
+        results.append(flight.do("key", slow))
+
+    threads = [threading.Thread(target=caller) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    # Let every follower join the leader's flight before it completes
+    deadline = time.monotonic() + 5
+    while flight.calls < 5 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls == [1]
+    assert sorted(results) == [("result", False)] + [("result", True)] * 4
+    assert flight.stats()["upstream_calls"] == 1
+    assert flight.stats()["dedupe_ratio"] == pytest.approx(0.8)
+
+
+def test_sequential_calls_are_not_coalesced():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == (1, False)
+    assert flight.do("key", lambda: 2) == (2, False)
+
+
+def test_errors_reach_the_leader_and_the_key_is_released():
+    flight = SingleFlight()
+
+    def boom():
+        raise ValueError("upstream failed")
+
+    with pytest.raises(ValueError):
+        flight.do("key", boom)
+    assert flight.do("key", lambda: "recovered") == ("recovered", False)
+
+
+async def test_async_callers_share_one_task():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(4)))
+    assert calls == [1]
+    assert [shared for _, shared in results] == [False, True, True, True]
+    assert all(value == "result" for value, _ in results)
+
+
+async def test_async_errors_are_shared():
+    flight = AsyncSingleFlight()
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    results = await asyncio.gather(flight.do("key", boom), flight.do("key", boom), return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+async def test_cancelled_caller_does_not_cancel_the_shared_request():
+    flight = AsyncSingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "result"
+
+    leader = asyncio.ensure_future(flight.do("key", fetch))
+    follower = asyncio.ensure_future(flight.do("key", fetch))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await follower == ("result", True)
+    assert leader.cancelled()
+
+
+async def test_service_sends_identical_concurrent_completions_once(make_service):
+    class SlowBackend(FakeBackend):
+        async def acomplete(self, params):
+            await asyncio.sleep(0.01)
+            return await super().acomplete(params)
+
+    service = make_service(SlowBackend())
+    messages = [{"role": "user", "content": "Outlook for NVDA?"}]
+    results = await asyncio.gather(*(
+        service.acreate_completion(messages, model="gpt-4o-mini", temperature=0.7) for _ in range(3)
+    ))
+    assert len(service.backend.calls) == 1
+    assert all(r["content"] == "ok" for r in results)
+    assert service.get_metrics()["singleflight"]["shared"] == 2
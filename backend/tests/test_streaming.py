@@ -0,0 +1,122 @@
+"""
+Tests for streaming completions: the service's event stream and the FastAPI response helpers.
+"""
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.utils.streaming import completion_streaming_response
+from tests.conftest import FakeBackend
+
+MESSAGES = [{"role": "user", "content": "Summarize the market"}]
+
+
+def _app(events):
+    app = FastAPI()
+
+    @app.get("/sse")
+    async def sse():
+        return completion_streaming_response(events(), sse=True)
+
+    @app.get("/text")
+    async def text():
+        return completion_streaming_response(events(), sse=False)
+
+    return TestClient(app)
+
+
+def test_stream_yields_deltas_then_a_done_record(make_service):
+    service = make_service(FakeBackend(reply="stocks went up"))
+    events = list(service.stream_completion(MESSAGES, model="gpt-4o-mini"))
+    assert [e["type"] for e in events] == ["delta", "delta", "delta", "done"]
+    done = events[-1]
+    assert done["content"] == "stocks went up "
+    assert done["usage"]["total_tokens"] == 12
+    assert done["model"] == "gpt-4o-mini"
+    assert done["time_to_first_token"] is not None
+
+
+async def test_astream_matches_the_sync_stream(make_service):
+    service = make_service(FakeBackend(reply="stocks went up"))
+    events = [e async for e in service.astream_completion(MESSAGES, model="gpt-4o-mini")]
+    assert "".join(e["content"] for e in events if e["type"] == "delta") == "stocks went up "
+    assert events[-1]["type"] == "done"
+
+
+def test_stream_counts_usage_when_the_provider_does_not(make_service):
+    class NoUsage(FakeBackend):
+        def stream(self, params):
+            for event in super().stream(params):
+                if event["type"] != "usage":
+                    yield event
+
+    service = make_service(NoUsage(reply="one two"))
+    done = list(service.stream_completion(MESSAGES, model="gpt-4o-mini"))[-1]
+    assert done["usage"]["completion_tokens"] > 0
+    assert done["usage"]["prompt_tokens"] > 0
+
+
+def test_stream_retries_only_before_the_first_token(make_service):
+    backend = FakeBackend(reply="fine", errors=[httpx.ConnectError("down")])
+    service = make_service(backend, RETRY_DELAY=0)
+    assert list(service.stream_completion(MESSAGES, model="gpt-4o-mini"))[-1]["content"] == "fine "
+    assert len(backend.calls) == 2
+
+    class BreaksMidway(FakeBackend):
+        def stream(self, params):
+            self.calls.append(("stream", params))
+            yield {"type": "delta", "content": "partial"}
+            raise httpx.ConnectError("dropped")
+
+    broken = BreaksMidway()
+    service = make_service(broken, RETRY_DELAY=0)
+    with pytest.raises(httpx.ConnectError):
+        list(service.stream_completion(MESSAGES, model="gpt-4o-mini"))
+    assert len(broken.calls) == 1
+
+
+def test_sse_response_frames_deltas_and_summary():
+    async def events():
+        yield {"type": "delta", "content": "Hel"}
+        yield {"type": "delta", "content": "lo"}
+        yield {"type": "done", "content": "Hello", "model": "m", "usage": {"total_tokens": 3}}
+
+    response = _app(events).get("/sse")
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["x-accel-buffering"] == "no"
+    assert response.text == (
+        'event: delta\ndata: {"content": "Hel"}\n\n'
+        'event: delta\ndata: {"content": "lo"}\n\n'
+        'event: done\ndata: {"model": "m", "usage": {"total_tokens": 3}}\n\n'
+    )
+
+
+def test_sse_response_reports_failures_as_an_error_event():
+    async def events():
+        yield {"type": "delta", "content": "Hel"}
+        raise RuntimeError("upstream exploded")
+
+    text = _app(events).get("/sse").text
+    assert text.endswith('event: error\ndata: {"detail": "Internal server error"}\n\n')
+    assert "exploded" not in text
+
+
+def test_text_response_streams_raw_deltas():
+    async def events():
+        yield {"type": "delta", "content": "Hel"}
+        yield {"type": "delta", "content": "lo"}
+        yield {"type": "done", "content": "Hello"}
+
+    response = _app(events).get("/text")
+    assert response.headers["content-type"] == "text/plain; charset=utf-8"
+    assert response.text == "Hello"
+
+
+def test_text_response_ends_failures_with_an_error_marker():
+    async def events():
+        yield {"type": "delta", "content": "Hel"}
+        raise RuntimeError("upstream exploded")
+
+    text = _app(events).get("/text").text
+    assert text == "Hel\n[error: Internal server error]\n"
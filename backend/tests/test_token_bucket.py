@@ -0,0 +1,120 @@
+"""
+Tests for the token-bucket limiter API, on a memory backend with a fake clock.
+"""
+import threading
+
+import pytest
+
+from app.services.openai_service import RateLimitException
+from app.utils import token_bucket
+from app.utils.limiter_backends import FileLockLimiterBackend, MemoryLimiterBackend
+from app.utils.token_bucket import Limit, RateLimitExceeded, TokenBucketLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def _limiter(clock, *limits):
+    return TokenBucketLimiter(limits or [Limit("rpm", 60, 60.0)], backend=MemoryLimiterBackend(clock=clock))
+
+
+def test_limit_capacity_defaults_to_rate():
+    assert Limit("rpm", 60, 60.0).capacity == 60
+    assert Limit("rpm", 60, 60.0, burst=5).capacity == 5
+    assert Limit("tpm", 120, 60.0).per_second == 2.0
+
+
+def test_buckets_refill_continuously_up_to_the_burst(clock):
+    limiter = _limiter(clock, Limit("rps", 2, 1.0, burst=4))
+    assert limiter.try_acquire({"rps": 4})
+    assert not limiter.try_acquire({"rps": 1})
+    clock.now += 0.5
+    assert limiter.available()["rps"] == pytest.approx(1.0)
+    clock.now += 60
+    assert limiter.available()["rps"] == pytest.approx(4.0)
+
+
+def test_waiters_are_scheduled_in_arrival_order(clock):
+    limiter = _limiter(clock, Limit("rps", 1, 1.0, burst=1))
+    assert limiter.reserve({"rps": 1}) == 0
+    assert limiter.reserve({"rps": 1}) == pytest.approx(1.0)
+    assert limiter.reserve({"rps": 1}) == pytest.approx(2.0)
+
+
+def test_max_wait_rejects_without_reserving(clock):
+    limiter = _limiter(clock, Limit("rps", 1, 1.0, burst=1))
+    limiter.reserve({"rps": 1})
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        limiter.reserve({"rps": 1}, max_wait=0.5)
+    assert excinfo.value.retry_after == pytest.approx(1.0)
+    # The rejected call left no debt behind
+    assert limiter.reserve({"rps": 1}) == pytest.approx(1.0)
+
+
+def test_unknown_names_and_zero_costs_are_free(clock):
+    limiter = _limiter(clock)
+    assert limiter.reserve({"unknown": 1000, "rpm": 0}) == 0
+    assert limiter.available()["rpm"] == pytest.approx(60)
+
+
+def test_adjust_reconciles_estimates(clock):
+    limiter = _limiter(clock, Limit("tpm", 1000, 60.0))
+    limiter.reserve({"tpm": 800})
+    limiter.adjust({"tpm": -500})
+    assert limiter.available()["tpm"] == pytest.approx(700)
+
+
+def test_acquire_sleeps_for_the_reserved_wait(clock, monkeypatch):
+    slept = []
+    monkeypatch.setattr(token_bucket.time, "sleep", slept.append)
+    limiter = _limiter(clock, Limit("rps", 1, 1.0, burst=1))
+    assert limiter.acquire({"rps": 1}) == 0
+    assert limiter.acquire({"rps": 1}, timeout=5) == pytest.approx(1.0)
+    assert slept == [pytest.approx(1.0)]
+
+
+async def test_aacquire_awaits_instead_of_blocking(clock, monkeypatch):
+    slept = []
+
+    async def fake_sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(token_bucket.asyncio, "sleep", fake_sleep)
+    limiter = _limiter(clock, Limit("rps", 1, 1.0, burst=1))
+    await limiter.aacquire({"rps": 1}, key="k")
+    await limiter.aacquire({"rps": 1}, key="k")
+    assert slept == [pytest.approx(1.0)]
+    with pytest.raises(RateLimitExceeded):
+        await limiter.aacquire({"rps": 1}, key="k", timeout=0)
+
+
+async def test_aacquire_reserves_off_the_loop_on_shared_backends(tmp_path):
+    threads = []
+
+    class RecordingBackend(FileLockLimiterBackend):
+        def reserve(self, key, charges, max_wait):
+            threads.append(threading.get_ident())
+            return super().reserve(key, charges, max_wait)
+
+    limiter = TokenBucketLimiter([Limit("rpm", 60, 60.0)], backend=RecordingBackend(str(tmp_path)))
+    assert await limiter.aacquire({"rpm": 1}) == 0
+    assert threads and threads[0] != threading.get_ident()
+
+
+def test_service_raises_when_the_budget_is_exhausted(make_service):
+    service = make_service(RATE_LIMIT_RPM=1, RATE_LIMIT_MAX_WAIT=0, SINGLEFLIGHT_ENABLED=False)
+    messages = [{"role": "user", "content": "hi"}]
+    service.create_completion(messages, model="gpt-4o-mini")
+    with pytest.raises(RateLimitException):
+        service.create_completion(messages, model="gpt-4o-mini")
+    assert len(service.backend.calls) == 1
@@ -0,0 +1,117 @@
+"""
+Tests for token counting: the calibrated heuristic and the tiktoken path.
+
+The tiktoken path runs against a stand-in module, so the test does not need
+tiktoken (or its downloaded encodings) to be installed.
+"""
+import random
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.utils.token_counter import TOKENS_PER_MESSAGE, TOKENS_PER_REPLY, TokenCounter
+
+
+def _true_tokens(text):
+    # A made-up tokenizer: one token per word, plus one per digit and per punctuation mark
+    return len(text.split()) + sum(c.isdigit() for c in text) + sum(c in ".,%$" for c in text)
+
+
+def _corpus(n, seed=7):
+    rng = random.Random(seed)
+    words = ["shares", "rose", "AAPL", "earnings", "guidance", "Q3", "revenue", "fell", "outlook"]
+    return [
+        " ".join(rng.choice(words) for _ in range(rng.randint(3, 12)))
+        + f" {rng.randint(1, 99999)}.{rng.randint(0, 99)}%"
+        for _ in range(n)
+    ]
+
+
+def test_features_count_byte_classes_per_text():
+    features = TokenCounter.features(["ab cd", "", "x1,é"])
+    # letter runs, letters, digits, punctuation, non-ASCII bytes, whitespace
+    assert features[0].tolist() == [2, 4, 0, 0, 0, 1]
+    assert features[1].tolist() == [0] * 6
+    assert features[2].tolist() == [1, 1, 1, 1, 2, 0]
+
+
+def test_letter_runs_do_not_span_texts():
+    assert TokenCounter.features(["ab", "cd"])[:, 0].tolist() == [1, 1]
+
+
+def test_counts_are_positive_for_text_and_zero_for_empty():
+    counter = TokenCounter(use_tiktoken=False)
+    counts = counter.count_many(["hello world", "", "x"])
+    assert counts[0] >= 2 and counts[1] == 0 and counts[2] >= 1
+    messages = [{"role": "system", "content": "hello world"}, {"role": "user", "content": None}]
+    assert counter.count_messages(messages) == counts[0] + 2 * TOKENS_PER_MESSAGE + TOKENS_PER_REPLY
+
+
+def test_calibration_converges_on_the_real_tokenizer():
+    counter = TokenCounter(use_tiktoken=False)
+    held_out = _corpus(50, seed=1)
+    truth = np.array([_true_tokens(t) for t in held_out])
+
+    def error():
+        return np.mean(np.abs(np.array(counter.count_many(held_out)) - truth) / truth)
+
+    before = error()
+    for batch in np.array_split(np.array(_corpus(200, seed=2), dtype=object), 50):
+        texts = list(batch)
+        counter.observe(texts, sum(_true_tokens(t) for t in texts))
+    assert counter.observations == 50
+    assert error() < before / 2
+    assert (counter.weights >= 0).all()
+
+
+def test_weights_refit_in_batches_and_ignore_overhead():
+    counter = TokenCounter(use_tiktoken=False)
+    prior = counter.weights.copy()
+    messages = [{"role": "user", "content": "shares rose 5%"}]
+    for _ in range(7):
+        counter.observe_messages(messages, 100 + TOKENS_PER_MESSAGE + TOKENS_PER_REPLY)
+    assert np.array_equal(counter.weights, prior)
+    counter.observe_messages(messages, 100 + TOKENS_PER_MESSAGE + TOKENS_PER_REPLY)
+    assert not np.array_equal(counter.weights, prior)
+    assert counter.stats()["mode"] == "heuristic"
+
+
+@pytest.fixture
+def fake_tiktoken(monkeypatch):
+    class Encoding:
+        def __init__(self, name):
+            self.name = name
+
+        def encode_ordinary_batch(self, texts):
+            return [text.split() for text in texts]
+
+    def encoding_for_model(model):
+        if model != "gpt-4o":
+            raise KeyError(model)
+        return Encoding("o200k_base")
+
+    module = SimpleNamespace(encoding_for_model=encoding_for_model, get_encoding=Encoding)
+    monkeypatch.setitem(sys.modules, "tiktoken", module)
+    return module
+
+
+def test_exact_counts_with_tiktoken(fake_tiktoken):
+    counter = TokenCounter()
+    assert counter.exact
+    assert counter.count_many(["one two three", "four"], "openai/gpt-4o") == [3, 1]
+    # Unknown models fall back to cl100k_base; encodings are cached per model
+    assert counter.count("a b", "mystery-model") == 2
+    assert counter._encodings["gpt-4o"].name == "o200k_base"
+    assert counter._encodings["mystery-model"].name == "cl100k_base"
+    counter.observe(["one two"], 50)
+    assert counter.observations == 0
+    assert counter.stats() == {"mode": "tiktoken", "observations": 0, "mean_abs_pct_error": None, "weights": None}
+
+
+def test_service_calibrates_from_reported_usage(make_service):
+    service = make_service(EMBEDDING_BATCH_ENABLED=False, EMBEDDING_CACHE_ENABLED=False)
+    service.create_completion([{"role": "user", "content": "How did AAPL close?"}], model="gpt-4o-mini")
+    service.get_embeddings(["AAPL closed up 2%"])
+    assert service.get_metrics()["token_counter"]["observations"] == 2